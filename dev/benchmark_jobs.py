@@ -0,0 +1,187 @@
+"""
+Benchmarks of the functions handling the job information from SLURM.
+
+Usage: python dev/benchmark_jobs.py
+"""
+
+import time
+import timeit
+from io import BytesIO, StringIO
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from osa.configs.datamodel import Sequence
+from osa.job import FORMAT_SLURM, get_sacct_output, get_squeue_output, set_queue_values
+from osa.utils.utils import time_to_seconds
+
+EXTRA_DIR = Path(__file__).parent.parent / "extra"
+
+STATES = ["COMPLETED", "FAILED", "CANCELLED by 1234", "TIMEOUT", "RUNNING", "PENDING"]
+
+
+def synthetic_sacct_table(n_rows=100_000, n_sequences=60, seed=0) -> pd.DataFrame:
+    """Build a parsed sacct table with many resubmissions of each sequence."""
+    rng = np.random.default_rng(seed)
+    jobnames = [f"LST1_{run:05d}" for run in range(1000, 1000 + n_sequences)]
+    # Several tries per sequence, each one a job array of subruns
+    jobname_idx = rng.integers(0, n_sequences, n_rows)
+    try_idx = rng.integers(0, 20, n_rows)
+    return pd.DataFrame(
+        {
+            "JobID": 10_000_000 + jobname_idx * 100 + try_idx,
+            "JobName": np.array(jobnames)[jobname_idx],
+            "CPUTimeRAW": rng.integers(60, 7200, n_rows),
+            "State": rng.choice(STATES, n_rows, p=[0.8, 0.05, 0.02, 0.03, 0.05, 0.05]),
+            "ExitCode": rng.choice(["0:0", "1:0", "0:15"], n_rows),
+        }
+    )
+
+
+def synthetic_sequences(n_sequences=60) -> list:
+    sequence_list = []
+    for run in range(1000, 1000 + n_sequences):
+        sequence = Sequence()
+        sequence.jobname = f"LST1_{run:05d}"
+        sequence_list.append(sequence)
+    return sequence_list
+
+
+def legacy_set_queue_values(sacct_info, squeue_info, sequence_list):
+    """Former per-sequence implementation of set_queue_values, kept for comparison."""
+    job_info = pd.concat([sacct_info, squeue_info])
+    jobnames = [sequence.jobname for sequence in sequence_list]
+    job_info_filtered = job_info[job_info["JobName"].isin(jobnames)]
+
+    for sequence in sequence_list:
+        df_jobname = job_info_filtered[job_info_filtered["JobName"] == sequence.jobname]
+        sequence.tries = df_jobname["JobID"].nunique()
+        sequence.action = "Check"
+
+        if not df_jobname.empty:
+            sequence.jobid = df_jobname["JobID"].max()
+            jobs = df_jobname[df_jobname["JobID"] == sequence.jobid]
+            try:
+                sequence.cputime = time.strftime(
+                    "%H:%M:%S", time.gmtime(jobs["CPUTimeRAW"].median(skipna=False))
+                )
+            except ValueError:
+                sequence.cputime = None
+
+            if (jobs.State.values == "COMPLETED").all():
+                sequence.state = "COMPLETED"
+                sequence.exit = jobs["ExitCode"].iloc[0]
+            elif (jobs.State.values == "PENDING").all():
+                sequence.state = "PENDING"
+            elif any("FAILED" in job for job in jobs.State):
+                sequence.state = "FAILED"
+                mask = ["FAILED" in job for job in jobs.State]
+                sequence.exit = jobs[mask]["ExitCode"].iloc[0]
+            elif any("CANCELLED" in job for job in jobs.State):
+                sequence.state = "CANCELLED"
+                mask = ["CANCELLED" in job for job in jobs.State]
+                sequence.exit = jobs[mask]["ExitCode"].iloc[0]
+            elif any("TIMEOUT" in job for job in jobs.State):
+                sequence.state = "TIMEOUT"
+                sequence.exit = "0:15"
+            elif any("RUNNING" in job for job in jobs.State):
+                sequence.state = "RUNNING"
+
+
+def benchmark_set_queue_values(n_rows=100_000, n_sequences=60, repeat=5):
+    sacct_info = synthetic_sacct_table(n_rows, n_sequences)
+    squeue_info = sacct_info.iloc[:0]
+
+    legacy_sequences = synthetic_sequences(n_sequences)
+    new_sequences = synthetic_sequences(n_sequences)
+    legacy_set_queue_values(sacct_info, squeue_info, legacy_sequences)
+    set_queue_values(sacct_info, squeue_info, new_sequences)
+    assert [vars(seq) for seq in legacy_sequences] == [vars(seq) for seq in new_sequences]
+
+    legacy = min(
+        timeit.repeat(
+            lambda: legacy_set_queue_values(sacct_info, squeue_info, legacy_sequences),
+            number=1,
+            repeat=repeat,
+        )
+    )
+    new = min(
+        timeit.repeat(
+            lambda: set_queue_values(sacct_info, squeue_info, new_sequences),
+            number=1,
+            repeat=repeat,
+        )
+    )
+    print(
+        f"set_queue_values ({n_rows} rows, {n_sequences} sequences): "
+        f"legacy {legacy:.3f} s, grouped {new:.3f} s, speed-up x{legacy / new:.1f}"
+    )
+
+
+def synthetic_slurm_output(file: Path, n_rows: int, header: bool = False) -> str:
+    """Repeat the lines of a sacct/squeue output file shifting their job IDs."""
+    lines = file.read_text().splitlines()
+    header_line, lines = (lines[:1], lines[1:]) if header else ([], lines)
+    output = []
+    for shift in range(0, n_rows // len(lines) + 1):
+        for line in lines:
+            job_id = line.split("_")[0].split(".")[0].split(";")[0].split(",")[0]
+            output.append(f"{int(job_id) + 100_000 * shift}{line[len(job_id):]}")
+    return "\n".join(header_line + output[:n_rows]) + "\n"
+
+
+def legacy_get_sacct_output(sacct_output: StringIO) -> pd.DataFrame:
+    """Former implementation of get_sacct_output, kept for comparison."""
+    sacct_output = pd.read_csv(sacct_output, names=FORMAT_SLURM)
+    sacct_output = sacct_output[
+        (sacct_output["JobName"].str.contains("batch"))
+        | (sacct_output["JobName"].str.contains("LST1"))
+    ]
+    sacct_output["JobID"] = sacct_output["JobID"].apply(lambda x: x.split("_")[0])
+    sacct_output["JobID"] = sacct_output["JobID"].str.strip(".batch").astype(int)
+    return sacct_output
+
+
+def legacy_get_squeue_output(squeue_output: StringIO) -> pd.DataFrame:
+    """Former implementation of get_squeue_output, kept for comparison."""
+    df = pd.read_csv(squeue_output, delimiter=";")
+    df.rename(
+        inplace=True,
+        columns={"STATE": "State", "JOBID": "JobID", "NAME": "JobName", "TIME": "CPUTime"},
+    )
+    df = df[df["JobName"].str.contains("LST1")]
+    df["JobID"] = df["JobID"].apply(lambda x: x.split("_")[0]).astype("int")
+    df["CPUTimeRAW"] = df["CPUTime"].apply(time_to_seconds)
+    return df
+
+
+def benchmark_parsers(n_rows=1_000_000, repeat=3):
+    """Compare the former and the current sacct and squeue parsers."""
+    for name, legacy_parser, parser, file, header in (
+        ("sacct", legacy_get_sacct_output, get_sacct_output, "sacct_output.csv", False),
+        ("squeue", legacy_get_squeue_output, get_squeue_output, "squeue_output.csv", True),
+    ):
+        output = synthetic_slurm_output(EXTRA_DIR / file, n_rows, header=header)
+        legacy_table = legacy_parser(StringIO(output))
+        table = parser(StringIO(output))
+        for column in ("JobID", "JobName", "State", "CPUTimeRAW"):
+            assert (legacy_table[column].to_numpy() == table[column].to_numpy()).all()
+
+        legacy = min(
+            timeit.repeat(lambda: legacy_parser(StringIO(output)), number=1, repeat=repeat)
+        )
+        new = min(timeit.repeat(lambda: parser(StringIO(output)), number=1, repeat=repeat))
+        # Stream of bytes, as read from the pipe of the sacct process
+        data = output.encode()
+        stream = min(timeit.repeat(lambda: parser(BytesIO(data)), number=1, repeat=repeat))
+        print(
+            f"{name} parser ({n_rows} rows): legacy {legacy:.3f} s, "
+            f"typed {new:.3f} s, from byte stream {stream:.3f} s, "
+            f"speed-up x{legacy / stream:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    benchmark_set_queue_values()
+    benchmark_parsers()
@@ -0,0 +1,248 @@
+"""
+Archive of the resources used by the jobs of every night, stored as Parquet
+files partitioned by date, stage and production ID, and aggregate queries on it.
+"""
+
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from osa.configs.config import cfg
+from osa.report import read_history
+from osa.utils.logging import myLogger
+from osa.utils.utils import date_to_iso
+
+__all__ = [
+    "job_accounting_dir",
+    "history_job_records",
+    "sacct_job_records",
+    "archive_night_jobs",
+    "read_job_archive",
+    "job_statistics",
+]
+
+log = myLogger(logging.getLogger(__name__))
+
+ARCHIVE_FILE = "jobs.parquet"
+PARTITION_KEYS = ["date", "stage", "prod_id"]
+
+ARCHIVE_COLUMNS = {
+    "run": "int64",
+    "subrun": "Int64",
+    "subruns": "Int64",
+    "job_id": "string",
+    "state": "string",
+    "elapsed": "float64",
+    "max_rss": "float64",
+}
+
+
+def job_accounting_dir() -> Path:
+    """Directory of the job accounting archive."""
+    return Path(cfg.get("LST1", "JOB_ACCOUNTING_DIR"))
+
+
+def sacct_job_records(
+    usage: pd.DataFrame,
+    runs: Iterable[int],
+    packing: Optional[Dict[int, int]] = None,
+    n_subruns: Optional[Dict[int, int]] = None,
+) -> pd.DataFrame:
+    """
+    Select the jobs (or array tasks) of the given runs and give them the
+    archive format. The stage of each job is its type of sequence.
+
+    An array task processes the subruns from `subrun` on, `subruns` of them.
+
+    Parameters
+    ----------
+    usage: pd.DataFrame
+        Resources used by each job (see `osa.job.get_job_resources`).
+    runs: Iterable[int]
+        Run numbers of the sequences of the night.
+    packing: dict, optional
+        Subruns processed by each array task of a run, 1 by default.
+    n_subruns: dict, optional
+        Number of subruns of each run, which bounds those of its last task.
+    """
+    packing = packing or {}
+    n_subruns = n_subruns or {}
+    usage = usage[usage["run"].isin(list(runs))]
+    task_ids = pd.to_numeric(usage["JobID"].str.extract(r"_(\d+)$")[0])
+    task_packing = usage["run"].map(lambda run: packing.get(run, 1))
+    first_subruns = task_ids * task_packing
+    # The last task of a run processes the remaining subruns
+    remaining = usage["run"].map(n_subruns) - first_subruns
+    task_subruns = task_packing.where(task_ids.notna()).clip(upper=remaining)
+    return pd.DataFrame(
+        {
+            "stage": usage["type"],
+            "run": usage["run"],
+            "subrun": first_subruns,
+            "subruns": task_subruns,
+            "job_id": usage["JobID"],
+            "state": usage["State"],
+            "elapsed": usage["Elapsed"],
+            "max_rss": usage["MaxRSS"],
+        }
+    )
+
+
+def history_job_records(history_files: Iterable[Path]) -> pd.DataFrame:
+    """
+    Give the archive format to the executions of each analysis step found in
+    the history files. The stage is the name of the executed program and the
+    state is either COMPLETED or FAILED depending on its return code.
+    """
+    rows = []
+    for history_file in history_files:
+        for record in read_history(history_file):
+            run, _, subrun = record.run.partition(".")
+            rows.append(
+                {
+                    "stage": record.stage,
+                    "run": int(run),
+                    "subrun": int(subrun) if subrun else None,
+                    "subruns": 1 if subrun else None,
+                    "job_id": None,
+                    "state": "COMPLETED" if record.return_code == 0 else "FAILED",
+                    "elapsed": record.duration,
+                    "max_rss": None,
+                }
+            )
+
+    return pd.DataFrame(rows, columns=["stage", *ARCHIVE_COLUMNS])
+
+
+def archive_night_jobs(
+    jobs: pd.DataFrame, date: datetime, prod_id: str, archive_dir: Optional[Path] = None
+) -> List[Path]:
+    """
+    Store the jobs of a night in the archive, replacing those previously
+    archived for the same night and production ID.
+
+    Parameters
+    ----------
+    jobs: pd.DataFrame
+        Job records with a stage column (see `sacct_job_records`
+        and `history_job_records`).
+    date: datetime
+        Date of the start of the night.
+    prod_id: str
+        Production ID of the analysis.
+    archive_dir: Path, optional
+        By default, the JOB_ACCOUNTING_DIR option.
+
+    Returns
+    -------
+    files: list of Path
+        Parquet files written, one per stage.
+    """
+    archive_dir = archive_dir or job_accounting_dir()
+    night_dir = archive_dir / f"date={date_to_iso(date)}"
+
+    for old_file in night_dir.glob(f"stage=*/prod_id={prod_id}/{ARCHIVE_FILE}"):
+        old_file.unlink()
+
+    files = []
+    for stage, stage_jobs in jobs.groupby("stage"):
+        partition = night_dir / f"stage={stage}" / f"prod_id={prod_id}"
+        partition.mkdir(parents=True, exist_ok=True)
+        file = partition / ARCHIVE_FILE
+        tmp_file = file.with_suffix(".tmp")
+        stage_jobs[list(ARCHIVE_COLUMNS)].astype(ARCHIVE_COLUMNS).to_parquet(
+            tmp_file, index=False
+        )
+        os.replace(tmp_file, file)
+        files.append(file)
+
+    log.debug(f"{len(jobs)} job records of {date_to_iso(date)} archived in {archive_dir}")
+    return files
+
+
+def read_job_archive(
+    archive_dir: Optional[Path] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    stages: Optional[Iterable[str]] = None,
+    prod_ids: Optional[Iterable[str]] = None,
+) -> pd.DataFrame:
+    """
+    Read the archived jobs. Only the partitions matching the selection are read.
+
+    Parameters
+    ----------
+    archive_dir: Path, optional
+        By default, the JOB_ACCOUNTING_DIR option.
+    start, end: datetime, optional
+        First and last nights to read.
+    stages, prod_ids: Iterable[str], optional
+        Stages and production IDs to read, all of them by default.
+
+    Returns
+    -------
+    jobs: pd.DataFrame
+        Archived job records including the date, stage and prod_id columns.
+    """
+    archive_dir = archive_dir or job_accounting_dir()
+    start = date_to_iso(start) if start else None
+    end = date_to_iso(end) if end else None
+
+    tables = []
+    for file in sorted(archive_dir.glob(f"date=*/stage=*/prod_id=*/{ARCHIVE_FILE}")):
+        keys = dict(part.split("=", 1) for part in file.parent.relative_to(archive_dir).parts)
+        if (
+            (start and keys["date"] < start)
+            or (end and keys["date"] > end)
+            or (stages and keys["stage"] not in stages)
+            or (prod_ids and keys["prod_id"] not in prod_ids)
+        ):
+            continue
+        tables.append(pd.read_parquet(file).assign(**keys))
+
+    if not tables:
+        return pd.DataFrame(columns=[*PARTITION_KEYS, *ARCHIVE_COLUMNS])
+
+    return pd.concat(tables, ignore_index=True)
+
+
+def job_statistics(jobs: pd.DataFrame, by: Iterable[str] = ("stage",)) -> pd.DataFrame:
+    """
+    Compute the median and 95th percentile of the runtime and memory,
+    and the failure rate of the archived jobs.
+
+    Parameters
+    ----------
+    jobs: pd.DataFrame
+        Archived job records (see `read_job_archive`).
+    by: Iterable[str]
+        Columns to group the jobs by. Besides the archive columns,
+        'month' groups the nights by month.
+
+    Returns
+    -------
+    pd.DataFrame
+        Number of jobs, runtime (seconds), memory (GB) percentiles
+        and failure rate of each group.
+    """
+    jobs = jobs.assign(
+        month=jobs["date"].str[:7],
+        failed=jobs["state"] != "COMPLETED",
+        elapsed=pd.to_numeric(jobs["elapsed"]),
+        max_rss=pd.to_numeric(jobs["max_rss"]),
+    )
+    grouped = jobs.groupby(list(by))
+    return pd.DataFrame(
+        {
+            "jobs": grouped.size(),
+            "runtime_p50": grouped["elapsed"].quantile(0.5),
+            "runtime_p95": grouped["elapsed"].quantile(0.95),
+            "memory_p50": grouped["max_rss"].quantile(0.5),
+            "memory_p95": grouped["max_rss"].quantile(0.95),
+            "failure_rate": grouped["failed"].mean(),
+        }
+    ).reset_index()
@@ -12,6 +12,7 @@ class RunObj:
     source_name: str = None
     source_ra: float = None
     source_dec: float = None
+    priority: int = 0
     telescope: str = "LST1"
     night: str = None
 
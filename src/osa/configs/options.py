@@ -1,5 +1,8 @@
 """Command line arguments shared variables across all modules."""
 
+from contextlib import contextmanager
+from types import ModuleType
+
 configfile = None
 stdout = None
 stderr = None
@@ -27,5 +30,36 @@ test = False
 no_calib = False
 no_submit = False
 seqtoclose = None
+files_only = False
 run = None
+nights = None
+watch = False
+resubmit_failed = False
+speculative_of = None
+sacct_journal = None
 filters = None
+
+
+def _option_values() -> dict:
+    return {
+        name: value
+        for name, value in globals().items()
+        if not name.startswith("_") and not callable(value) and not isinstance(value, ModuleType)
+    }
+
+
+@contextmanager
+def night_options(**values):
+    """
+    Set the given options, e.g. the date, for the processing of a night.
+    All the options are restored to their previous values on exit, so that
+    several nights can be processed one after the other in the same process.
+    """
+    saved = _option_values()
+    globals().update(values)
+    try:
+        yield
+    finally:
+        for name in set(_option_values()) - set(saved):
+            del globals()[name]
+        globals().update(saved)
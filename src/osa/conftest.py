@@ -15,6 +15,7 @@ Analysis products (dl1, dl2, muons and datacheck) are produced in the analysis d
 BASE_DIR/running_analysis/YYYYMMDD/<prod_id>
 """
 
+from io import StringIO
 from textwrap import dedent
 
 import pytest
@@ -23,6 +24,7 @@ from osa.configs import options
 from osa.configs.config import cfg
 from osa.nightsummary.extract import extract_runs, extract_sequences
 from osa.nightsummary.nightsummary import run_summary_table
+from osa.scheduler import Scheduler
 from osa.scripts.tests.test_osa_scripts import run_program
 from osa.utils.utils import date_to_dir
 from datetime import datetime
@@ -581,3 +583,52 @@ def gain_selection_flag_file(osa_dir):
     file = GainSel_dir / "GainSelFinished.txt"
     file.touch()
     return file
+
+
+class FakeScheduler(Scheduler):
+    """Scheduler recording the jobs submitted, throttled and cancelled instead of running them."""
+
+    name = "fake"
+
+    def __init__(self, first_job_id: int = 100):
+        self.next_job_id = first_job_id
+        self.submitted = []
+        self.throttles = {}
+        self.cancelled = []
+
+    def submit(self, commandargs: list, token: str, limiter=None, retries: int = 3):
+        self.submitted.append(commandargs)
+        self.next_job_id += 1
+        return str(self.next_job_id - 1)
+
+    def sacct_output(self) -> str:
+        return ""
+
+    def squeue_output(self) -> StringIO:
+        return StringIO("JOBID;NAME;STATE;TIME\n")
+
+    def set_array_throttle(self, job_id: str, limit: int) -> None:
+        self.throttles[job_id] = limit
+
+    def cancel(self, job_id: str) -> None:
+        self.cancelled.append(job_id)
+
+
+@pytest.fixture
+def fake_scheduler():
+    """Recording scheduler, to be returned by the patched `get_scheduler` of the tested module."""
+    return FakeScheduler()
+
+
+@pytest.fixture
+def job_script(tmp_path):
+    """Write a job script with the given #SBATCH directives in the test directory."""
+
+    def write(*directives, name="sequence.py"):
+        script = tmp_path / name
+        script.write_text(
+            "#!/bin/env python\n\n" + "".join(f"#SBATCH {directive}\n" for directive in directives)
+        )
+        return script
+
+    return write
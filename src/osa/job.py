@@ -1,52 +1,134 @@
 """Functions to handle the interaction with the job scheduler."""
 
 import datetime
+import fcntl
+import hashlib
+import json
 import logging
+import math
+import os
+import re
+import shlex
 import shutil
+import statistics
 import subprocess as sp
+import threading
 import time
-from io import StringIO
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from io import BytesIO, StringIO, TextIOBase
 from pathlib import Path
+from string import Template
 from textwrap import dedent
-from typing import Iterable
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 
 from osa.configs import options
 from osa.configs.config import cfg
 from osa.paths import (
-    pedestal_ids_file_exists,
     get_drive_file,
     get_summary_file,
     get_pedestal_ids_file,
+    get_pedestal_ids_runs,
+)
+from osa.accounting import archive_night_jobs, history_job_records, sacct_job_records
+from osa.joblogs import job_log_file
+from osa.numbacache import LOCK_FILE, POPULATED_MARKER, shared_numba_cache
+from osa.priority import night_priority, priority_options, sort_by_priority
+from osa.report import last_record_per_stage, read_history
+from osa.resources import (
+    array_throttle,
+    io_budget,
+    max_partition_time,
+    memory_to_gb,
+    predict_resources,
+    select_partitions,
+)
+from osa.scheduler import (
+    SCHEDULERS,
+    array_ranges,
+    array_task_ids,
+    get_scheduler,
+    read_sbatch_directives,
+    script_interpreter,
 )
-from osa.utils.iofile import write_to_file
 from osa.utils.logging import myLogger
-from osa.utils.utils import date_to_dir, time_to_seconds, stringify, date_to_iso
+from osa.utils.utils import (
+    date_to_dir,
+    time_to_seconds,
+    seconds_to_time,
+    stringify,
+    date_to_iso,
+)
 
 log = myLogger(logging.getLogger(__name__))
 
 __all__ = [
     "are_all_jobs_correctly_finished",
     "historylevel",
+    "history_index",
     "prepare_jobs",
     "sequence_filenames",
     "set_queue_values",
     "job_header_template",
     "plot_job_statistics",
     "scheduler_env_variables",
+    "subruns_per_task",
+    "packed_walltime",
+    "shell_pilot",
+    "python_numba_cache",
+    "shell_numba_cache",
+    "aggregated_job_logs",
     "set_cache_dirs",
     "submit_jobs",
+    "sbatch_submit",
+    "find_submitted_job",
+    "find_slurm_job",
+    "read_submission_manifest",
+    "SubmissionRateLimiter",
+    "SubmissionGuard",
+    "queued_jobs",
+    "estimated_cpu_hours",
     "check_history_level",
     "get_sacct_output",
     "get_squeue_output",
     "filter_jobs",
+    "summarize_sequence_jobs",
     "run_sacct",
+    "stream_sacct",
+    "read_slurm_table",
+    "read_sacct_table",
+    "split_job_ids",
     "run_squeue",
+    "run_slurm_squeue",
+    "fetch_sacct_output",
+    "fetch_slurm_sacct_output",
+    "get_sacct_snapshot",
+    "invalidate_sacct_snapshot",
+    "shared_sacct_snapshot",
+    "throttle_arrays",
+    "failed_array_tasks",
+    "resubmit_failed_tasks",
+    "io_saturation",
+    "get_job_states",
+    "get_job_resources",
+    "get_task_resources",
+    "wait_for_jobs",
     "calibration_sequence_job_template",
     "data_sequence_job_template",
+    "data_sequence_arguments",
+    "job_script_context",
+    "write_job_script",
     "save_job_information",
+    "archive_job_accounting",
 ]
 
 TAB = "\t".expandtabs(4)
@@ -62,6 +144,68 @@ FORMAT_SLURM = [
     "ExitCode",
 ]
 
+# Arrow types of the sacct and squeue columns. Job names, states and
+# exit codes repeat a lot, so they are dictionary encoded (categorical).
+_CATEGORY = pa.dictionary(pa.int32(), pa.string())
+SACCT_COLUMN_TYPES = {
+    "JobID": pa.string(),
+    "JobName": _CATEGORY,
+    "CPUTime": pa.string(),
+    "CPUTimeRAW": pa.int64(),
+    "Elapsed": pa.string(),
+    "TotalCPU": pa.string(),
+    "MaxRSS": pa.string(),
+    "State": _CATEGORY,
+    "ExitCode": _CATEGORY,
+}
+SQUEUE_COLUMN_TYPES = {
+    "JOBID": pa.string(),
+    "NAME": _CATEGORY,
+    "STATE": _CATEGORY,
+    "TIME": _CATEGORY,
+}
+JOB_ID_RE = r"^(?P<JobID>\d+)(?:[_+](?P<ArrayIndex>[^.]*))?(?:\.(?P<Step>.*))?$"
+CLOSER_JOBS_PATTERN = (
+    "lstchain_merge_hdf5_files|lstchain_check_dl1|lstchain_longterm_dl1_check"
+    "|lstchain_cherenkov_transparency|provproces|closer"
+)
+
+# Overlap between consecutive incremental sacct polls
+SACCT_JOURNAL_OVERLAP = datetime.timedelta(minutes=5)
+
+# Parsed sacct output shared within the process (see get_sacct_snapshot)
+_SACCT_SNAPSHOT = {}
+
+# Nesting depth of the blocks sharing a single sacct snapshot (see shared_sacct_snapshot)
+_SACCT_SHARING = {"depth": 0}
+
+# History files of a run (calibration) or of a subrun (data)
+HISTORY_FILE_RE = re.compile(r"^sequence_[^_]+_(?P<run>\d+)(?:\.(?P<subrun>\d+))?\.history$")
+
+# Parsed history files together with their modification time
+_HISTORY_RECORDS = {}
+
+# Job states after which a job can not change anymore
+TERMINAL_JOB_STATES = {
+    "BOOT_FAIL",
+    "CANCELLED",
+    "COMPLETED",
+    "DEADLINE",
+    "FAILED",
+    "NODE_FAIL",
+    "OUT_OF_MEMORY",
+    "PREEMPTED",
+    "REVOKED",
+    "TIMEOUT",
+}
+
+# Seconds of the latest subruns compared with previous nights (see io_saturation)
+IO_SATURATION_WINDOW = 3600
+
+# Seconds to wait before retrying a failed sbatch call (scaled by the attempt)
+SBATCH_RETRY_DELAY = 5
+_MANIFEST_LOCK = threading.Lock()
+
 PYTHON_IMPORTS = dedent(
     """\
 
@@ -73,6 +217,62 @@ PYTHON_IMPORTS = dedent(
     """
 )
 
+# Skeleton of the pilot scripts launching the analysis of a sequence
+PILOT_SCRIPT_TEMPLATE = Template(
+    "$header\n"
+    + PYTHON_IMPORTS
+    + "$setup\n"
+    + "with $numba_cache as tmpdirname:\n"
+    + f"{TAB}os.environ['NUMBA_CACHE_DIR'] = tmpdirname\n"
+    + f"{TAB}proc = $run([\n"
+    + "$arguments"
+    + f"{TAB * 2}'$tel_id'\n"
+    + f"{TAB}]$run_options)\n"
+    + "\n"
+    + "sys.exit(proc.returncode)"
+)
+
+# Skeleton of the shell pilot scripts. The analysis is the only Python
+# interpreter of the job, and its exit code that of the job.
+SHELL_PILOT_TEMPLATE = Template(
+    "$header\n"
+    "\n"
+    "$setup"
+    "$numba_cache"
+    "\n"
+    "$command\n"
+)
+
+# Numba cache of the shell pilot scripts, private to the task by default
+SHELL_PRIVATE_NUMBA_CACHE = (
+    "# Private numba cache of the task, removed on exit\n"
+    'export NUMBA_CACHE_DIR="$(mktemp -d)"\n'
+    "trap 'rm -rf \"$NUMBA_CACHE_DIR\"' EXIT\n"
+)
+
+# Shared numba cache of the shell pilot scripts (see `osa.numbacache.numba_cache`)
+SHELL_SHARED_NUMBA_CACHE = Template(
+    "# Numba cache shared by the tasks on nodes with the same CPU features,\n"
+    "# unless another task is populating it\n"
+    "numba_cache=$directory\n"
+    "cpu_key=\"$$(grep -m1 -E '^(flags|Features)' /proc/cpuinfo | md5sum | cut -c1-12)\"\n"
+    'export NUMBA_CACHE_DIR="$$numba_cache/$$cpu_key"\n'
+    'mkdir -p "$$NUMBA_CACHE_DIR"\n'
+    'exec 9>>"$$NUMBA_CACHE_DIR/$lock_file"\n'
+    'if [ ! -e "$$NUMBA_CACHE_DIR/$populated_marker" ] && ! flock -n 9; then\n'
+    f'{TAB}export NUMBA_CACHE_DIR="$$(mktemp -d)"\n'
+    f"{TAB}trap 'rm -rf \"$$NUMBA_CACHE_DIR\"' EXIT\n"
+    "fi\n"
+)
+
+# Subruns processed per array task, keyed by analysis directory
+_SUBRUNS_PER_TASK = {}
+# Measured subrun runtime, keyed by analysis directory
+_SUBRUN_RUNTIME = {}
+
+# Content hash of the job scripts, with the modification time and size they had
+_SCRIPT_HASHES = {}
+
 
 def are_all_jobs_correctly_finished(sequence_list):
     """
@@ -90,16 +290,12 @@ def are_all_jobs_correctly_finished(sequence_list):
     """
     # FIXME: check based on sequence.jobid exit status
     flag = True
-    analysis_directory = Path(options.directory)
+    run_types = {sequence.run: sequence.type for sequence in sequence_list}
+    index = history_index(Path(options.directory), run_types)
     for sequence in sequence_list:
-        history_files_list = analysis_directory.rglob(f"*{sequence.seq}*.history")
-        for history_file in history_files_list:
-            # TODO: s.history should be SubRunObj attribute not RunObj
-            # s.history only working for CALIBRATION sequence (run-wise), since it is
-            # looking for .../sequence_LST1_04180.history files
-            # we need to check all the subrun wise history files
-            # .../sequence_LST1_04180.XXXX.history
-            out, _ = historylevel(history_file, sequence.type)
+        # Run-wise history file for the calibration sequence and
+        # subrun-wise history files for the data sequences
+        for out, _ in index.get(sequence.run, {}).values():
             if out == 0:
                 log.debug(f"Job {sequence.seq} ({sequence.type}) correctly finished")
                 continue
@@ -139,18 +335,17 @@ def check_history_level(history_file: Path, program_levels: dict):
     # Check the program exit_status (last string of the line), if it is 0, go
     # to the next level and check the next program. If exit_status is not 0, return the
     # actual level and the exit status. Stop the iteration when reaching the level 0.
-    with open(history_file, "r") as file:
-        for line in file:
-            program = line.split()[1]
-            exit_status = int(line.split()[-1])
-            if program in program_levels:
-                if exit_status != 0:
-                    level = program_levels[program]
-                    return level, exit_status
+    for record in read_history(history_file):
+        program = record.stage
+        exit_status = record.return_code
+        if program in program_levels:
+            if exit_status != 0:
                 level = program_levels[program]
-                continue
+                return level, exit_status
+            level = program_levels[program]
+            continue
 
-        return level, exit_status
+    return level, exit_status
 
 
 def historylevel(history_file: Path, data_type: str):
@@ -178,6 +373,38 @@ def historylevel(history_file: Path, data_type: str):
     data_type: str
         Type of the sequence, either 'DATA' or 'PEDCALIB'
 
+    Returns
+    -------
+    level : int
+    exit_status : int
+    """
+    if not history_file.exists():
+        return history_records_level([], data_type)
+
+    # Only the last record of each stage sets the level, so the history file
+    # is read backwards until all the stages of the sequence are found.
+    if data_type == "DATA":
+        programs = ("r0_to_dl1", "dl1ab", "check_dl1", "dl1_to_dl2")
+    else:
+        programs = ("drs4_baseline", "charge_calibration")
+    stages = [cfg.get("lstchain", program) for program in programs]
+    records = last_record_per_stage(history_file, stages)
+    return history_records_level(list(records.values()), data_type)
+
+
+def history_records_level(records: list, data_type: str):
+    """
+    Returns the level from which the analysis should begin and
+    the rc of the last executable given the records of a history file.
+    See `historylevel` for the levels of each type of sequence.
+
+    Parameters
+    ----------
+    records: list of osa.report.HistoryRecord
+        Records of the history file.
+    data_type: str
+        Type of the sequence, either 'DATA' or 'PEDCALIB'
+
     Returns
     -------
     level : int
@@ -196,60 +423,116 @@ def historylevel(history_file: Path, data_type: str):
 
     exit_status = 0
 
-    if history_file.exists():
-        for line in history_file.read_text().splitlines():
-            words = line.split()
-            try:
-                program = words[1]
-                prod_id = words[2]
-                exit_status = int(words[-1])
-                log.debug(f"{program}, finished with error {exit_status} and prod ID {prod_id}")
-            except (IndexError, ValueError) as err:
-                log.exception(f"Malformed history file {history_file}, {err}")
+    drs4_baseline, charge_calibration, r0_to_dl1, dl1ab, check_dl1, dl1_to_dl2 = (
+        cfg.get("lstchain", program)
+        for program in (
+            "drs4_baseline",
+            "charge_calibration",
+            "r0_to_dl1",
+            "dl1ab",
+            "check_dl1",
+            "dl1_to_dl2",
+        )
+    )
+
+    for record in records:
+        program, prod_id, exit_status = record.stage, record.prod_id, record.return_code
+        log.debug(f"{program}, finished with error {exit_status} and prod ID {prod_id}")
+        # Calibration sequence
+        if program == drs4_baseline:
+            level = 1 if exit_status == 0 else 2
+        elif program == charge_calibration:
+            level = 0 if exit_status == 0 else 1
+        # Data sequence
+        elif program == r0_to_dl1:
+            level = 3 if exit_status == 0 else 4
+        elif program == dl1ab:
+            if (exit_status == 0) and (prod_id == options.dl1_prod_id):
+                log.debug(f"DL1ab prod ID: {options.dl1_prod_id} already produced")
+                level = 2
             else:
-                # Calibration sequence
-                if program == cfg.get("lstchain", "drs4_baseline"):
-                    level = 1 if exit_status == 0 else 2
-                elif program == cfg.get("lstchain", "charge_calibration"):
-                    level = 0 if exit_status == 0 else 1
-                # Data sequence
-                elif program == cfg.get("lstchain", "r0_to_dl1"):
-                    level = 3 if exit_status == 0 else 4
-                elif program == cfg.get("lstchain", "dl1ab"):
-                    if (exit_status == 0) and (prod_id == options.dl1_prod_id):
-                        log.debug(f"DL1ab prod ID: {options.dl1_prod_id} already produced")
-                        level = 2
-                    else:
-                        level = 3
-                        log.debug(f"DL1ab prod ID: {options.dl1_prod_id} not produced yet")
-                        break
-                elif program == cfg.get("lstchain", "check_dl1"):
-                    level = 1 if exit_status == 0 else 2
-                elif program == cfg.get("lstchain", "dl1_to_dl2"):
-                    if (exit_status == 0) and (prod_id == options.dl2_prod_id):
-                        log.debug(f"DL2 prod ID: {options.dl2_prod_id} already produced")
-                        level = 0
-                    else:
-                        level = 1
-                        log.debug(f"DL2 prod ID: {options.dl2_prod_id} not produced yet")
-
-                else:
-                    log.warning(f"Program name not identified: {program}")
+                level = 3
+                log.debug(f"DL1ab prod ID: {options.dl1_prod_id} not produced yet")
+                break
+        elif program == check_dl1:
+            level = 1 if exit_status == 0 else 2
+        elif program == dl1_to_dl2:
+            if (exit_status == 0) and (prod_id == options.dl2_prod_id):
+                log.debug(f"DL2 prod ID: {options.dl2_prod_id} already produced")
+                level = 0
+            else:
+                level = 1
+                log.debug(f"DL2 prod ID: {options.dl2_prod_id} not produced yet")
+
+        else:
+            log.warning(f"Program name not identified: {program}")
 
     return level, exit_status
 
 
+def cached_history_records(history_file: Path, mtime: int) -> list:
+    """Parse a history file only if it changed since it was last read."""
+    cached = _HISTORY_RECORDS.get(history_file)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, read_history(history_file))
+        _HISTORY_RECORDS[history_file] = cached
+
+    return cached[1]
+
+
+def history_index(directory: Path, run_types: dict) -> dict:
+    """
+    Compute the level and exit status of every run and subrun
+    from the history files found in a single scan of the directory.
+
+    Parameters
+    ----------
+    directory: pathlib.Path
+        Directory containing the history files, i.e. the analysis directory.
+    run_types: dict
+        Type of sequence ('DATA' or 'PEDCALIB') of each run number to index.
+
+    Returns
+    -------
+    index: dict
+        Level and exit status keyed by run number and then by subrun number,
+        the latter being None for run-wise history files.
+    """
+    index = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            match = HISTORY_FILE_RE.match(entry.name)
+            if match is None or not entry.is_file():
+                continue
+
+            run = int(match["run"])
+            if run not in run_types:
+                continue
+
+            subrun = None if match["subrun"] is None else int(match["subrun"])
+            records = cached_history_records(Path(entry.path), entry.stat().st_mtime_ns)
+            index.setdefault(run, {})[subrun] = history_records_level(records, run_types[run])
+
+    return index
+
+
 def prepare_jobs(sequence_list):
     """Prepare job file template for each sequence."""
     if not options.simulate:
         log.info("Building job scripts for each sequence.")
 
+    # The parts common to all the sequences of the night are computed only once
+    context = job_script_context(
+        n_arrays=sum(sequence.type == "DATA" for sequence in sequence_list),
+        max_priority=night_priority(sequence_list),
+    )
+
     for sequence in sequence_list:
         log.debug(f"Creating sequence.py for sequence {sequence.seq}")
         if sequence.type == "PEDCALIB":
-            calibration_sequence_job_template(sequence)
+            calibration_sequence_job_template(sequence, context)
         elif sequence.type == "DATA":
-            data_sequence_job_template(sequence)
+            data_sequence_job_template(sequence, context)
         else:
             raise ValueError(f"Type {sequence.type} not expected")
 
@@ -257,32 +540,66 @@ def prepare_jobs(sequence_list):
 def sequence_filenames(sequence):
     """Build names of the script, veto and history files."""
     basename = f"sequence_{sequence.jobname}"
-    sequence.script = Path(options.directory) / f"{basename}.py"
+    suffix = ".sh" if shell_pilot(sequence) else ".py"
+    sequence.script = Path(options.directory) / f"{basename}{suffix}"
     sequence.veto = Path(options.directory) / f"{basename}.veto"
     sequence.history = Path(options.directory) / f"{basename}.history"
 
 
-def save_job_information():
+def save_job_information(sequence_list: Iterable = None):
     """
     Write job information from sacct (elapsed time, memory used, number of
     completed, failed and running jobs in the queue) to a file.
+
+    The jobs of the given sequences and the analysis steps recorded in their
+    history files are also appended to the job accounting archive.
     """
     # Set directory and file path
     log_directory = Path(options.directory) / "log"
     log_directory.mkdir(exist_ok=True, parents=True)
     file_path = log_directory / "job_information.csv"
 
-    sacct_output = run_sacct()
-    jobs_df = get_sacct_output(sacct_output)
+    jobs_df = get_sacct_snapshot()
 
     # Fetch sacct output and prepare the data
     jobs_df_filtered = jobs_df.copy()
-    jobs_df_filtered = jobs_df_filtered.dropna()
+    jobs_df_filtered = jobs_df_filtered.dropna(subset=["MaxRSS"])
     # Remove the G from MaxRSS value and convert to float
     # jobs_df_filtered["MaxRSS"] = jobs_df_filtered["MaxRSS"].str.strip("G").astype(float)
 
     jobs_df_filtered.to_csv(file_path, index=False, sep=",")
 
+    if sequence_list and not options.simulate:
+        archive_job_accounting(sequence_list)
+
+
+def archive_job_accounting(sequence_list: Iterable):
+    """Archive the jobs of the sequences of the night with their analysis steps."""
+    runs = {sequence.run for sequence in sequence_list}
+    records = read_submission_manifest(submission_manifest_file())
+    packing = {
+        sequence.run: records.get(sequence.jobname, {}).get("subruns_per_task")
+        or subruns_per_task()
+        for sequence in sequence_list
+        if sequence.type == "DATA"
+    }
+    n_subruns = {sequence.run: sequence.subruns for sequence in sequence_list}
+    history_files = [
+        entry
+        for entry in Path(options.directory).iterdir()
+        if (match := HISTORY_FILE_RE.match(entry.name)) and int(match["run"]) in runs
+    ]
+    jobs = pd.concat(
+        [
+            sacct_job_records(
+                get_sacct_snapshot(parser=get_job_resources), runs, packing, n_subruns
+            ),
+            history_job_records(history_files),
+        ],
+        ignore_index=True,
+    )
+    archive_night_jobs(jobs, options.date, options.prod_id)
+
 
 def plot_job_statistics(sacct_output: pd.DataFrame, directory: Path):
     """
@@ -303,7 +620,7 @@ def plot_job_statistics(sacct_output: pd.DataFrame, directory: Path):
     # Plot a 2D histogram of the used memory (MaxRSS) as a function of the
     # elapsed time taking also into account the State of the job.
     sacct_output_filter = sacct_output.copy()
-    sacct_output_filter = sacct_output_filter.dropna()
+    sacct_output_filter = sacct_output_filter.dropna(subset=["MaxRSS"])
     # Remove the G from MaxRSS value and convert to float
     sacct_output_filter["MaxRSS"] = sacct_output_filter["MaxRSS"].str.strip("G").astype(float)
 
@@ -316,38 +633,306 @@ def plot_job_statistics(sacct_output: pd.DataFrame, directory: Path):
     plt.savefig(plot_path)
 
 
-def scheduler_env_variables(sequence, scheduler="slurm"):
-    """Return the environment variables for the scheduler."""
+def scheduler_env_variables(
+    sequence, scheduler="slurm", array_limit: Optional[int] = None, max_priority: int = 0
+):
+    """
+    Return the environment variables for the scheduler. The array of a
+    data sequence runs at most `array_limit` tasks at once, if given.
+    Its nice value and QOS depend on its priority below `max_priority`,
+    the highest one of the night (see `osa.priority.priority_options`).
+    """
     # TODO: Create a class with the SBATCH variables we want to use in the pilot job
     #  and then use the string representation of the class to create the header.
-    if scheduler != "slurm":
-        log.warning("No other schedulers are currently supported")
+    # The local scheduler reads the same SBATCH directives
+    if scheduler not in SCHEDULERS:
+        log.warning(f"Scheduler {scheduler} not supported")
         return None
 
+    walltime = cfg.get("SLURM", "WALLTIME")
+    partition = cfg.get("SLURM", f"PARTITION_{sequence.type}")
+    packing = subruns_per_task() if sequence.type == "DATA" else 1
+    if packing > 1:
+        # Each array task processes several subruns one after the other
+        walltime = packed_walltime(packing, partition)
+        partition = select_partitions(partition, time_to_seconds(walltime))
+
+    memory = cfg.get("SLURM", f"MEMSIZE_{sequence.type}")
+    if cfg.getboolean("SLURM", "ADAPTIVE_RESOURCES", fallback=False):
+        resources = predict_resources(
+            sequence.type,
+            get_sacct_snapshot(parser=get_task_resources),
+            run=sequence.run,
+            default_time=walltime,
+            packing=packing,
+        )
+        walltime, partition, memory = resources.time, resources.partition, resources.mem_per_cpu
+
     sbatch_parameters = [
         f"--job-name={sequence.jobname}",
-        f"--time={cfg.get('SLURM', 'WALLTIME')}",
+        f"--time={walltime}",
         f"--chdir={options.directory}",
-        f"--output=log/Run{sequence.run:05d}.%4a_jobid_%A.out",
-        f"--error=log/Run{sequence.run:05d}.%4a_jobid_%A.err",
     ]
+    if aggregated_job_logs(sequence):
+        # The tasks stream the output of the analysis into the log container
+        # of the run, this file only gets the messages of the pilot scripts.
+        sbatch_parameters.extend(
+            (f"--output=log/Run{sequence.run:05d}_jobid_%A.out", "--open-mode=append")
+        )
+    else:
+        # The array index is the subrun unless each task processes several
+        # of them, whose logs are then named after the task and the packing.
+        task = "%4a" if packing == 1 else f"task%4ax{packing}"
+        sbatch_parameters.extend(
+            (
+                f"--output=log/Run{sequence.run:05d}.{task}_jobid_%A.out",
+                f"--error=log/Run{sequence.run:05d}.{task}_jobid_%A.err",
+            )
+        )
 
-    # Get the number of subruns counting from 0.
-    subruns = sequence.subruns - 1
+    # Get the number of array tasks counting from 0.
+    tasks = math.ceil(sequence.subruns / packing) - 1
 
     # Depending on the type of sequence, we need to set
     # different sbatch environment variables
     if sequence.type == "DATA":
-        sbatch_parameters.append(f"--array=0-{subruns}")
+        array = f"0-{tasks}"
+        if array_limit:
+            array += f"%{min(array_limit, tasks + 1)}"
+        sbatch_parameters.append(f"--array={array}")
 
-    sbatch_parameters.append(f"--partition={cfg.get('SLURM', f'PARTITION_{sequence.type}')}")
-    sbatch_parameters.append(f"--mem-per-cpu={cfg.get('SLURM', f'MEMSIZE_{sequence.type}')}")
+    sbatch_parameters.append(f"--partition={partition}")
+    sbatch_parameters.append(f"--mem-per-cpu={memory}")
     sbatch_parameters.append(f"--account={cfg.get('SLURM', 'ACCOUNT')}")
 
+    # The calibration sequence is needed by all the data sequences, so it is never niced
+    priority = sequence.priority if sequence.type == "DATA" else max_priority
+    sbatch_parameters.extend(priority_options(priority, max_priority))
+
     return ["#SBATCH " + line for line in sbatch_parameters]
 
 
-def job_header_template(sequence):
+def shell_pilot(sequence) -> bool:
+    """
+    Whether the job of the sequence is run by a shell pilot script instead of
+    a Python one, set by the PILOT_SCRIPT option. Only for data sequences.
+    """
+    return (
+        sequence.type == "DATA"
+        and cfg.get("SLURM", "PILOT_SCRIPT", fallback="python").strip().lower() == "shell"
+    )
+
+
+def aggregated_job_logs(sequence) -> bool:
+    """
+    Whether the array tasks of the sequence write their output into the log
+    container of the run (see `osa.joblogs`), set by the AGGREGATED_JOB_LOGS option.
+    """
+    return sequence.type == "DATA" and cfg.getboolean(
+        "SLURM", "AGGREGATED_JOB_LOGS", fallback=False
+    )
+
+
+def subrun_runtimes(directory: Path, max_files: int = 200, since: float = None) -> list:
+    """
+    Time in seconds needed to process each subrun, from the stage durations
+    recorded in the subrun history files of an analysis directory.
+
+    Parameters
+    ----------
+    directory: Path
+        Analysis directory of a night.
+    max_files: int
+        Maximum number of history files read.
+    since: float, optional
+        Only read the history files modified after this time (seconds since epoch).
+    """
+    runtimes = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            match = HISTORY_FILE_RE.match(entry.name)
+            if match is None or match["subrun"] is None:
+                continue
+            if since is not None and entry.stat().st_mtime < since:
+                continue
+            durations = [
+                record.duration
+                for record in read_history(Path(entry.path))
+                if record.duration is not None and record.return_code == 0
+            ]
+            if durations:
+                runtimes.append(sum(durations))
+            if len(runtimes) >= max_files:
+                break
+
+    return runtimes
+
+
+def recent_nights(max_nights: int, include_current: bool = True) -> List[Path]:
+    """
+    Analysis directories of the latest nights processed with the same
+    prod ID, starting from the current one if `include_current`.
+    """
+    analysis_dir = Path(options.directory)
+    base_dir = analysis_dir.parent.parent
+    previous_nights = sorted(
+        (
+            night / analysis_dir.name
+            for night in base_dir.glob("????????")
+            if night.name < analysis_dir.parent.name
+        ),
+        reverse=True,
+    )
+    nights = [analysis_dir, *previous_nights] if include_current else previous_nights
+    return nights[:max_nights]
+
+
+def measured_subrun_runtime(
+    max_nights: int = 3, max_files: int = 200, include_current: bool = True
+) -> Optional[float]:
+    """
+    Median time in seconds needed to process a subrun, computed from the stage
+    durations recorded in the history files of the current night or, if there
+    are none, of the latest nights processed with the same prod ID.
+
+    Parameters
+    ----------
+    max_nights: int
+        Maximum number of nights to look into.
+    max_files: int
+        Maximum number of subrun history files read per night.
+    include_current: bool
+        Look also into the current night.
+
+    Returns
+    -------
+    runtime: float or None
+        None if no duration was recorded.
+    """
+    for directory in recent_nights(max_nights, include_current):
+        if not directory.is_dir():
+            continue
+
+        runtimes = subrun_runtimes(directory, max_files)
+        if runtimes:
+            return statistics.median(runtimes)
+
+    return None
+
+
+def io_saturation(window: float = IO_SATURATION_WINDOW) -> float:
+    """
+    Ratio between the median time to process a subrun in the last `window`
+    seconds of the current night and in the previous nights. It is above 1
+    when the subruns are slowed down, e.g. by the load of the filesystem.
+    """
+    analysis_dir = Path(options.directory)
+    if not analysis_dir.is_dir():
+        return 1.0
+
+    recent = subrun_runtimes(analysis_dir, since=time.time() - window)
+    usual = measured_subrun_runtime(include_current=False)
+    if not recent or not usual:
+        return 1.0
+
+    return statistics.median(recent) / usual
+
+
+def running_tasks(squeue_info: pd.DataFrame, exclude_jobs: Iterable = ()) -> int:
+    """Number of running sequence tasks in the queue, except those of the given jobs."""
+    running = squeue_info[squeue_info["State"] == "RUNNING"]
+    excluded = {str(job_id) for job_id in exclude_jobs}
+    return int((~running["JobID"].astype(str).isin(excluded)).sum())
+
+
+def throttle_arrays(sequence_list: Iterable) -> Optional[int]:
+    """
+    Update the limit of simultaneously running tasks of the queued arrays
+    of the data sequences, sharing the IO_BUDGET among them. The limit is
+    reduced while the subruns take longer than usual (see `io_saturation`).
+
+    Returns
+    -------
+    limit: int or None
+        New limit of the arrays, None if not updated.
+    """
+    budget = io_budget()
+    if budget is None or options.test or options.simulate:
+        return None
+
+    queued = [
+        sequence
+        for sequence in sequence_list
+        if sequence.type == "DATA" and sequence.jobid and sequence.state in ("PENDING", "RUNNING")
+    ]
+    if not queued:
+        return None
+
+    job_ids = [sequence.jobid for sequence in queued]
+    squeue_info = get_squeue_output(run_squeue())
+    saturation = io_saturation()
+    limit = array_throttle(
+        budget, running_tasks(squeue_info, exclude_jobs=job_ids), len(queued), saturation
+    )
+    log.info(f"Limiting the arrays to {limit} running tasks (subruns {saturation:.1f}x slower)")
+
+    scheduler = get_scheduler()
+    for job_id in job_ids:
+        scheduler.set_array_throttle(str(job_id), limit)
+
+    return limit
+
+
+def subruns_per_task() -> int:
+    """
+    Number of subruns processed by each array task of the data sequences.
+
+    It is given by the SUBRUNS_PER_TASK option. If set to "auto", it is derived
+    from the measured subrun runtime so that each task lasts PACKING_TARGET_TIME.
+    """
+    setting = (cfg.get("SLURM", "SUBRUNS_PER_TASK", fallback=None) or "1").strip()
+    if setting.lower() != "auto":
+        return max(int(setting), 1)
+
+    directory = str(options.directory)
+    if directory not in _SUBRUNS_PER_TASK:
+        runtime = night_subrun_runtime()
+        target_time = time_to_seconds(cfg.get("SLURM", "PACKING_TARGET_TIME", fallback="1:00:00"))
+        packing = max(int(target_time // runtime), 1) if runtime else 1
+        log.debug(f"Packing {packing} subruns per task (subrun runtime {runtime} s)")
+        _SUBRUNS_PER_TASK[directory] = packing
+
+    return _SUBRUNS_PER_TASK[directory]
+
+
+def night_subrun_runtime() -> Optional[float]:
+    """`measured_subrun_runtime` of the analysis directory, computed once per process."""
+    directory = str(options.directory)
+    if directory not in _SUBRUN_RUNTIME:
+        _SUBRUN_RUNTIME[directory] = measured_subrun_runtime()
+    return _SUBRUN_RUNTIME[directory]
+
+
+def packed_walltime(packing: int, partitions: str) -> str:
+    """
+    Walltime of the array tasks processing `packing` subruns each.
+
+    It is the measured time to process a subrun (see `measured_subrun_runtime`)
+    times the packing, increased by a RESOURCE_MARGIN safety margin. While
+    nothing was measured, it is WALLTIME per subrun. In any case, it does not
+    exceed the longest time limit of the partitions (PARTITION_TIME_LIMITS).
+    """
+    runtime = night_subrun_runtime()
+    if runtime:
+        margin = 1 + cfg.getfloat("SLURM", "RESOURCE_MARGIN", fallback=0.2)
+        walltime = math.ceil(packing * runtime * margin / 60) * 60
+    else:
+        walltime = packing * time_to_seconds(cfg.get("SLURM", "WALLTIME"))
+
+    return seconds_to_time(min(walltime, max_partition_time(partitions)))
+
+
+def job_header_template(sequence, context: "JobScriptContext" = None):
     """
     Returns a string with the job header template
     including SBATCH environment variables for sequencerXX.py script
@@ -355,17 +940,32 @@ def job_header_template(sequence):
     Parameters
     ----------
     sequence: sequence object
+    context: JobScriptContext, optional
+        Parts of the script common to the night.
 
     Returns
     -------
     header: str
         String with job header template
     """
-    python_shebang = "#!/bin/env python"
+    shebang = "#!/bin/bash" if shell_pilot(sequence) else "#!/bin/env python"
     if options.test:
-        return python_shebang
-    sbatch_parameters = "\n".join(scheduler_env_variables(sequence))
-    return python_shebang + 2 * "\n" + sbatch_parameters
+        return shebang
+    array_limit = context.array_limit if context else None
+    max_priority = context.max_priority if context else 0
+    sbatch_parameters = "\n".join(
+        scheduler_env_variables(sequence, array_limit=array_limit, max_priority=max_priority)
+    )
+    return shebang + 2 * "\n" + sbatch_parameters
+
+
+def cache_dir_variables() -> dict:
+    """Cache directories defined in the config file, keyed by their environment variable."""
+    return {
+        variable: path
+        for variable in ("CTAPIPE_CACHE", "CTAPIPE_SVC_PATH", "MPLCONFIGDIR")
+        if (path := cfg.get("CACHE", variable))
+    }
 
 
 def set_cache_dirs():
@@ -378,43 +978,222 @@ def set_cache_dirs():
     content: string
         String with the command to export the cache directories
     """
+    return "\n".join(
+        f"os.environ['{variable}'] = '{path}'" for variable, path in cache_dir_variables().items()
+    )
 
-    ctapipe_cache = cfg.get("CACHE", "CTAPIPE_CACHE")
-    ctapipe_svc_path = cfg.get("CACHE", "CTAPIPE_SVC_PATH")
-    mpl_config_path = cfg.get("CACHE", "MPLCONFIGDIR")
 
-    content = []
-    if ctapipe_cache:
-        content.append(f"os.environ['CTAPIPE_CACHE'] = '{ctapipe_cache}'")
+@dataclass(frozen=True)
+class JobScriptContext:
+    """Parts of the job scripts shared by all the sequences of a night."""
 
-    if ctapipe_svc_path:
-        content.append(f"os.environ['CTAPIPE_SVC_PATH'] = '{ctapipe_svc_path}'")
+    flat_date: str
+    drive_file: Path
+    summary_file: Path
+    cache_dirs: str
+    pedestal_ids_runs: frozenset
+    array_limit: Optional[int] = None
+    max_priority: int = 0
+    numba_cache: Optional[Path] = None
+
+
+def job_script_context(n_arrays: int = 1, max_priority: int = 0) -> JobScriptContext:
+    """
+    Compute once per night the parts of the job scripts common to all sequences.
+    If the IO_BUDGET option is set, the budget left by the running tasks is
+    shared by the `n_arrays` arrays of the night. The jobs are niced according
+    to their priority below `max_priority`, the highest one of the night.
+    """
+    flat_date = date_to_dir(options.date)
+    array_limit = None
+    budget = io_budget()
+    if budget is not None:
+        array_limit = array_throttle(
+            budget, running_tasks(get_squeue_output(run_squeue())), n_arrays
+        )
 
-    if mpl_config_path:
-        content.append(f"os.environ['MPLCONFIGDIR'] = '{mpl_config_path}'")
+    return JobScriptContext(
+        flat_date=flat_date,
+        drive_file=get_drive_file(flat_date),
+        summary_file=get_summary_file(flat_date),
+        cache_dirs=set_cache_dirs(),
+        pedestal_ids_runs=frozenset(get_pedestal_ids_runs()),
+        array_limit=array_limit,
+        max_priority=max_priority,
+        numba_cache=shared_numba_cache(),
+    )
 
-    return "\n".join(content)
 
+def render_job_script(
+    sequence,
+    context: JobScriptContext,
+    commandargs: list,
+    subruns_variable: str,
+    n_subruns_variable: Optional[str] = None,
+) -> str:
+    """
+    Fill the pilot script skeleton for a given sequence.
 
-def data_sequence_job_template(sequence):
+    Parameters
+    ----------
+    sequence : sequence object
+    context : JobScriptContext
+    commandargs : list
+        Arguments of the command launched by the pilot script, already quoted
+        as Python string literals.
+    subruns_variable : str
+        Python expression giving the subrun processed by the job.
+    n_subruns_variable : str, optional
+        Python expression giving the number of subruns processed by the job,
+        if it processes several.
     """
-    This file contains instruction to be submitted to job scheduler.
+    if not options.test:
+        # Use the SLURM env variables
+        setup = f"{context.cache_dirs}\nsubruns = {subruns_variable}\n"
+    else:
+        # Just process the first subrun without SLURM
+        setup = "subruns = 0\n"
+
+    arguments = "".join(f"{TAB * 2}{arg},\n" for arg in commandargs)
+
+    run, run_options = "subprocess.run", ""
+    if aggregated_job_logs(sequence):
+        job_log = job_log_file(Path(options.directory) / "log", sequence.run)
+        setup = f"from osa.joblogs import run_logged\n{setup}"
+        run, run_options = "run_logged", f", {str(job_log)!r}, subruns"
+        if n_subruns_variable:
+            # The output of the task is indexed under all its subruns
+            run_options += f", n_subruns={n_subruns_variable}"
+
+    numba_import, numba_cache = python_numba_cache(context)
+
+    return PILOT_SCRIPT_TEMPLATE.substitute(
+        header=job_header_template(sequence, context),
+        setup=numba_import + setup,
+        numba_cache=numba_cache,
+        arguments=arguments,
+        tel_id=options.tel_id,
+        run=run,
+        run_options=run_options,
+    )
+
+
+def python_numba_cache(context: JobScriptContext) -> Tuple[str, str]:
+    """
+    Import needed by the Python pilot scripts and context manager
+    giving the numba cache directory of the job.
+    """
+    if context.numba_cache is None:
+        return "", "tempfile.TemporaryDirectory()"
+
+    import_line = "from osa.numbacache import numba_cache\n"
+    return import_line, f"numba_cache({str(context.numba_cache)!r})"
+
+
+def shell_numba_cache(context: JobScriptContext) -> str:
+    """Lines of the shell pilot scripts setting the numba cache directory of the job."""
+    if context.numba_cache is None:
+        return SHELL_PRIVATE_NUMBA_CACHE
+
+    return SHELL_SHARED_NUMBA_CACHE.substitute(
+        directory=shlex.quote(str(context.numba_cache)),
+        lock_file=LOCK_FILE,
+        populated_marker=POPULATED_MARKER,
+    )
+
+
+def render_shell_job_script(
+    sequence,
+    context: JobScriptContext,
+    commandargs: list,
+    subruns_expression: str,
+    n_subruns_expression: Optional[str] = None,
+) -> str:
+    """
+    Fill the shell pilot script skeleton for a given sequence.
 
     Parameters
     ----------
     sequence : sequence object
+    context : JobScriptContext
+    commandargs : list
+        Arguments of the command launched by the pilot script, already quoted for the shell.
+    subruns_expression : str
+        Shell arithmetic expression giving the subrun processed by the job.
+    n_subruns_expression : str, optional
+        Shell arithmetic expression giving the number of subruns processed
+        by the job, if it processes several.
+    """
+    if not options.test:
+        exports = "".join(
+            f"export {variable}={shlex.quote(path)}\n"
+            for variable, path in cache_dir_variables().items()
+        )
+        setup = f"{exports}subruns=$(({subruns_expression}))\n"
+    else:
+        # Just process the first subrun without SLURM
+        setup = "subruns=0\n"
+
+    if aggregated_job_logs(sequence):
+        job_log = job_log_file(Path(options.directory) / "log", sequence.run)
+        # The output is streamed into the log container by a Python parent
+        subruns = '"$subruns"'
+        if n_subruns_expression:
+            # The output of the task is indexed under all its subruns
+            subruns = f'"$subruns:$(( {n_subruns_expression} ))"'
+        logger = ["python", "-m", "osa.joblogs", shlex.quote(str(job_log)), subruns]
+        commandargs = logger + commandargs
+
+    return SHELL_PILOT_TEMPLATE.substitute(
+        header=job_header_template(sequence, context),
+        setup=setup,
+        numba_cache=shell_numba_cache(context),
+        command=f" \\\n{TAB}".join([*commandargs, shlex.quote(options.tel_id)]),
+    )
+
+
+def write_job_script(script: Path, content: str) -> bool:
+    """
+    Write the job script unless it already has the same content, which is
+    checked by comparing content hashes. The hash of the scripts on disk is
+    only computed again if they were modified since they were last seen.
 
     Returns
     -------
-    job_template : string
+    bool
+        True if the script was written.
     """
-    # TODO: refactor this function creating wrappers that handle slurm part
+    digest = hashlib.sha256(content.encode()).hexdigest()
+
+    if script.is_file():
+        stat = script.stat()
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = _SCRIPT_HASHES.get(script)
+        if cached is None or cached[0] != key:
+            cached = (key, hashlib.sha256(script.read_bytes()).hexdigest())
+            _SCRIPT_HASHES[script] = cached
+        if cached[1] == digest:
+            log.debug(f"Job script {script} is up to date")
+            return False
+
+    tmp_file = script.with_name(f".{script.name}.tmp")
+    try:
+        tmp_file.write_text(content)
+        os.replace(tmp_file, script)
+    except OSError as error:
+        log.exception(f"{error.strerror} {error.filename}")
+        return False
 
-    # Get the job header template.
-    job_header = job_header_template(sequence)
+    stat = script.stat()
+    _SCRIPT_HASHES[script] = ((stat.st_mtime_ns, stat.st_size), digest)
+    return True
 
-    flat_date = date_to_dir(options.date)
 
+def data_sequence_arguments(sequence, context: JobScriptContext) -> list:
+    """
+    Command processing a data sequence, without the pedestal ids file
+    and the subruns which depend on the array task.
+    """
     commandargs = ["datasequence"]
 
     if options.verbose:
@@ -434,64 +1213,101 @@ def data_sequence_job_template(sequence):
             f"--time-calib-file={sequence.time_calibration_file}",
             f"--pedcal-file={sequence.calibration_file}",
             f"--systematic-correction-file={sequence.systematic_correction_file}",
-            f"--drive-file={get_drive_file(flat_date)}",
-            f"--run-summary={get_summary_file(flat_date)}",
+            f"--drive-file={context.drive_file}",
+            f"--run-summary={context.summary_file}",
         )
     )
+    return commandargs
 
-    content = job_header + "\n" + PYTHON_IMPORTS
 
-    if not options.test:
-        content += set_cache_dirs()
-        content += "\n"
-        # Use the SLURM env variables
-        content += "subruns = int(os.getenv('SLURM_ARRAY_TASK_ID'))\n"
-    else:
-        # Just process the first subrun without SLURM
-        content += "subruns = 0\n"
-
-    content += "\n"
-
-    content += "with tempfile.TemporaryDirectory() as tmpdirname:\n"
-    content += TAB + "os.environ['NUMBA_CACHE_DIR'] = tmpdirname\n"
-
-    content += TAB + "proc = subprocess.run([\n"
+def data_sequence_job_template(sequence, context: JobScriptContext = None):
+    """
+    This file contains instruction to be submitted to job scheduler.
 
-    for arg in commandargs:
-        content += TAB * 2 + f"'{arg}',\n"
+    Parameters
+    ----------
+    sequence : sequence object
+    context : JobScriptContext, optional
+        Parts of the script common to the night, computed if not given.
 
-    if pedestal_ids_file_exists(sequence.run):
-        pedestal_ids_file = get_pedestal_ids_file(sequence.run, flat_date)
-        content += TAB * 2 + f"f'--pedestal-ids-file={pedestal_ids_file}',\n"
+    Returns
+    -------
+    job_template : string
+    """
+    if context is None:
+        context = job_script_context()
+
+    commandargs = data_sequence_arguments(sequence, context)
+    packing = subruns_per_task()
+
+    if shell_pilot(sequence):
+        commandargs = [shlex.quote(arg) for arg in commandargs]
+        if sequence.run in context.pedestal_ids_runs:
+            # The subrun is filled in by the shell, as for the run argument
+            pedestal_ids_file = get_pedestal_ids_file(sequence.run, context.flat_date)
+            prefix, suffix = str(pedestal_ids_file).split("{subruns:04d}")
+            commandargs.append(
+                shlex.quote(f"--pedestal-ids-file={prefix}")
+                + '"$(printf %04d "$subruns")"'
+                + shlex.quote(suffix)
+            )
 
-    content += TAB * 2 + f"f'{sequence.run:05d}.{{subruns:04d}}',\n"
+        subruns_expression = "SLURM_ARRAY_TASK_ID"
+        n_subruns_expression = None
+        if packing > 1:
+            # Each task processes a block of subruns starting at $subruns
+            subruns_expression = f"{packing} * {subruns_expression}"
+            left = f"{sequence.subruns} - subruns"
+            n_subruns_expression = f"{left} < {packing} ? {left} : {packing}"
+            commandargs.append(f'"--n-subruns=$(( {n_subruns_expression} ))"')
+
+        commandargs.append(f'"{sequence.run:05d}.$(printf %04d "$subruns")"')
+        content = render_shell_job_script(
+            sequence, context, commandargs, subruns_expression, n_subruns_expression
+        )
 
-    content += TAB * 2 + f"'{options.tel_id}'\n"
-    content += TAB + "])\n"
-    content += "\n"
-    content += "sys.exit(proc.returncode)"
+    else:
+        commandargs = [f"'{arg}'" for arg in commandargs]
+
+        if sequence.run in context.pedestal_ids_runs:
+            pedestal_ids_file = get_pedestal_ids_file(sequence.run, context.flat_date)
+            commandargs.append(f"f'--pedestal-ids-file={pedestal_ids_file}'")
+
+        subruns_variable = "int(os.getenv('SLURM_ARRAY_TASK_ID'))"
+        n_subruns_variable = None
+        if packing > 1:
+            # Each task processes a block of subruns starting at `subruns`
+            subruns_variable = f"{packing} * {subruns_variable}"
+            n_subruns_variable = f"min({packing}, {sequence.subruns} - subruns)"
+            commandargs.append(f"f'--n-subruns={{{n_subruns_variable}}}'")
+
+        commandargs.append(f"f'{sequence.run:05d}.{{subruns:04d}}'")
+        content = render_job_script(
+            sequence, context, commandargs, subruns_variable, n_subruns_variable
+        )
 
     if not options.simulate:
-        write_to_file(sequence.script, content)
+        write_job_script(sequence.script, content)
 
     return content
 
 
-def calibration_sequence_job_template(sequence):
+def calibration_sequence_job_template(sequence, context: JobScriptContext = None):
     """
     This file contains instruction to be submitted to job scheduler.
 
     Parameters
     ----------
     sequence : sequence object
+    context : JobScriptContext, optional
+        Parts of the script common to the night, computed if not given.
 
     Returns
     -------
     job_template : string
     """
-
-    # Get the job header template.
-    job_header = job_header_template(sequence)
+    if context is None:
+        context = job_script_context()
 
     commandargs = ["calibration_pipeline"]
 
@@ -508,73 +1324,384 @@ def calibration_sequence_job_template(sequence):
             f"--pedcal-run={sequence.run:05d}",
         )
     )
+    commandargs = [f"'{arg}'" for arg in commandargs]
 
-    content = job_header + "\n" + PYTHON_IMPORTS
+    content = render_job_script(sequence, context, commandargs, "os.getenv('SLURM_ARRAY_TASK_ID')")
 
-    if not options.test:
-        content += set_cache_dirs()
-        content += "\n"
-        # Use the SLURM env variables
-        content += "subruns = os.getenv('SLURM_ARRAY_TASK_ID')\n"
-    else:
-        # Just process the first subrun without SLURM
-        content += "subruns = 0\n"
+    if not options.simulate:
+        write_job_script(sequence.script, content)
 
-    content += "\n"
+    return content
 
-    content += "with tempfile.TemporaryDirectory() as tmpdirname:\n"
-    content += TAB + "os.environ['NUMBA_CACHE_DIR'] = tmpdirname\n"
 
-    content += TAB + "proc = subprocess.run([\n"
+class SubmissionRateLimiter:
+    """
+    Spread the calls to the batch system so that no more than
+    `rate` submissions per second are issued, whatever the number
+    of threads sharing the limiter.
+    """
 
-    for arg in commandargs:
-        content += TAB * 2 + f"'{arg}',\n"
+    def __init__(self, rate: Optional[float] = None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
 
-    content += TAB * 2 + f"'{options.tel_id}'\n"
-    content += TAB + "])\n"
-    content += "\n"
-    content += "sys.exit(proc.returncode)"
+    def wait(self):
+        """Block until the next submission slot is available."""
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
 
-    if not options.simulate:
-        write_to_file(sequence.script, content)
+        if delay > 0:
+            time.sleep(delay)
 
-    return content
 
+def submission_manifest_file() -> Path:
+    """Path of the manifest keeping the job IDs submitted for the night."""
+    return Path(options.directory) / "log" / "submission_manifest.json"
 
-def submit_jobs(sequence_list, batch_command="sbatch"):
-    """
-    Submit the jobs to the cluster.
 
-    Parameters
-    ----------
-    sequence_list: list
-        List of sequences to submit.
-    batch_command: str
-        The batch command to submit the job (Default: sbatch)
+def read_submission_manifest(manifest: Path) -> dict:
+    """
+    Read the submission manifest of the night.
 
     Returns
     -------
-    job_list: list
-        List of submitted job IDs.
+    dict
+        Submission records keyed by job name.
     """
-    job_list = []
-    no_display_backend = "--export=ALL,MPLBACKEND=Agg"
+    if not manifest.exists():
+        return {}
 
-    for sequence in sequence_list:
-        commandargs = [batch_command, "--parsable", no_display_backend]
-        if sequence.type == "PEDCALIB":
+    try:
+        with open(manifest, "r") as file:
+            return json.load(file)
+    except json.JSONDecodeError:
+        log.warning(f"Corrupted submission manifest {manifest}, ignoring it")
+        return {}
+
+
+def record_submission(
+    manifest: Path, sequence, job_id: str, dependency: Optional[str] = None, **values
+):
+    """
+    Add the job ID of a submitted sequence to the submission manifest,
+    together with any other given values.
+    """
+    with _MANIFEST_LOCK:
+        records = read_submission_manifest(manifest)
+        records[sequence.jobname] = {
+            "jobid": job_id,
+            "type": sequence.type,
+            "script": str(sequence.script),
+            "dependency": dependency,
+            "submitted": datetime.datetime.now().isoformat(timespec="seconds"),
+            **values,
+        }
+        manifest.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = manifest.with_name(f".{manifest.name}.tmp")
+        with open(tmp_file, "w") as file:
+            json.dump(records, file, indent=2)
+        os.replace(tmp_file, manifest)
+
+
+def find_submitted_job(token: str) -> Optional[str]:
+    """
+    Look in the queue of the scheduler set in the config file for a job
+    submitted with the given token (stored in the job comment). It allows to
+    know whether a submission that failed on the client side was actually accepted.
+    """
+    return get_scheduler().find_job(token)
+
+
+def find_slurm_job(token: str) -> Optional[str]:
+    """Look in the SLURM queue for a job submitted with the given token."""
+    if shutil.which("squeue") is None:
+        return None
+
+    try:
+        output = sp.check_output(
+            ["squeue", "--me", "--noheader", "--format=%i;%k"],
+            universal_newlines=True,
+            shell=False,
+        )
+    except sp.CalledProcessError:
+        return None
+
+    for line in output.splitlines():
+        job_id, _, comment = line.partition(";")
+        if comment.strip() == token:
+            return job_id.strip()
+
+    return None
+
+
+def sbatch_submit(
+    commandargs: list,
+    token: str,
+    limiter: Optional[SubmissionRateLimiter] = None,
+    retries: int = 3,
+) -> Optional[str]:
+    """
+    Submit a job script and return its job ID.
+
+    The submission is tagged with a unique token, so that before
+    retrying a failed sbatch call the queue is checked for a job already
+    carrying it. Retries are thus idempotent: a submission accepted by
+    the scheduler but reported as failed is never duplicated.
+
+    Parameters
+    ----------
+    commandargs: list
+        Batch command and options, the job script being the last element.
+    token: str
+        Unique identifier of this submission.
+    limiter: SubmissionRateLimiter
+        Rate limiter shared by the concurrent submissions.
+    retries: int
+        Number of submission attempts.
+
+    Returns
+    -------
+    job_id: str or None
+        ID of the submitted job, None if it could not be submitted.
+    """
+    commandargs = commandargs[:-1] + [f"--comment={token}", commandargs[-1]]
+
+    for attempt in range(1, retries + 1):
+        if limiter is not None:
+            limiter.wait()
+        try:
+            output = sp.check_output(commandargs, universal_newlines=True, shell=False)
+            # With --parsable, sbatch prints "jobid[;cluster]"
+            return output.strip().split(";")[0]
+        except sp.CalledProcessError as error:
+            log.warning(
+                f"Submission of {commandargs[-1]} failed with error {error.returncode} "
+                f"(attempt {attempt}/{retries})"
+            )
+            job_id = find_submitted_job(token)
+            if job_id is not None:
+                log.info(f"Job {job_id} was already accepted by the scheduler")
+                return job_id
+            if attempt < retries:
+                time.sleep(SBATCH_RETRY_DELAY * attempt)
+
+    log.error(f"Could not submit {commandargs[-1]}")
+    return None
+
+
+def queued_jobs(squeue_info: pd.DataFrame) -> Dict[str, List[str]]:
+    """IDs of the jobs pending or running in the squeue snapshot by job name."""
+    if squeue_info.empty:
+        return {}
+
+    active = squeue_info[~squeue_info["State"].astype(str).isin(TERMINAL_JOB_STATES)]
+    return {
+        str(jobname): sorted({str(job_id) for job_id in job_ids})
+        for jobname, job_ids in active.groupby("JobName", observed=True)["JobID"]
+    }
+
+
+def estimated_cpu_hours(script: Path) -> float:
+    """
+    Upper bound of the CPU-hours used by a job script, i.e. its time limit
+    times its number of array tasks and CPUs per task.
+    """
+    try:
+        directives = read_sbatch_directives(script)
+    except OSError:
+        return 0.0
+
+    walltime = directives.get("--time")
+    if not walltime:
+        return 0.0
+
+    tasks = len(array_task_ids(directives.get("--array")))
+    cpus = int(directives.get("--cpus-per-task") or 1)
+    return tasks * cpus * time_to_seconds(walltime) / 3600
+
+
+class SubmissionGuard:
+    """
+    Keep a sequence from being submitted while a previous job of it is still
+    pending or running, e.g. with --force-submit or overlapping sequencer calls.
+
+    The previous jobs are looked for by job name in the squeue snapshot taken
+    before the submissions, and in the submission manifest of the night for
+    those submitted after the snapshot by another sequencer process. The
+    check and the submission of each job name are serialized among processes
+    with a lock file. Depending on `policy`, the duplicates are either refused
+    (the queued job is kept) or superseded (the queued jobs are cancelled
+    before the new submission).
+
+    Parameters
+    ----------
+    squeue_info: pd.DataFrame
+        Jobs in the queue (see `get_squeue_output`).
+    manifest: pathlib.Path
+        Submission manifest of the night.
+    policy: str
+        refuse or supersede.
+    """
+
+    def __init__(self, squeue_info: pd.DataFrame, manifest: Path, policy: str = "refuse"):
+        if policy not in ("refuse", "supersede"):
+            raise ValueError(f"Unknown duplicate submission policy {policy}")
+
+        self.queued = queued_jobs(squeue_info)
+        # The manifest records the submission times to the second
+        self.snapshot_time = datetime.datetime.now().replace(microsecond=0)
+        self.manifest = manifest
+        self.policy = policy
+        self.refused = []
+        self.cpu_hours_saved = 0.0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def lock(self, sequence):
+        """Hold the submission lock of the job name of a sequence."""
+        lock_file = self.manifest.parent / f".submit_{sequence.jobname}.lock"
+        lock_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(lock_file, "a") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            yield
+
+    def duplicates(self, sequence) -> List[str]:
+        """IDs of the previous jobs of a sequence still in the queue."""
+        job_ids = list(self.queued.get(sequence.jobname, []))
+        record = read_submission_manifest(self.manifest).get(sequence.jobname)
+        if record is not None and record["jobid"] not in job_ids:
+            submitted = datetime.datetime.fromisoformat(record["submitted"])
+            # Submitted by another process after the queue snapshot was taken
+            if submitted >= self.snapshot_time:
+                job_ids.append(record["jobid"])
+
+        return job_ids
+
+    def refuse(self, sequence, job_ids: List[str]):
+        """Skip the submission of a sequence already in the queue."""
+        cpu_hours = estimated_cpu_hours(sequence.script)
+        log.warning(
+            f"{sequence.jobname} is already queued as job {', '.join(job_ids)}, "
+            f"not submitting it again (up to {cpu_hours:.1f} CPU-hours saved)"
+        )
+        with self._lock:
+            self.refused.append(sequence.jobname)
+            self.cpu_hours_saved += cpu_hours
+
+    def supersede(self, sequence, job_ids: List[str]):
+        """Cancel the queued jobs of a sequence before submitting it again."""
+        for job_id in job_ids:
+            log.info(f"Cancelling job {job_id} of {sequence.jobname}, superseded by a new one")
+            get_scheduler().cancel(job_id)
+
+    def report(self):
+        """Log the duplicate submissions refused and the CPU-hours saved."""
+        if self.refused:
+            log.info(
+                f"Refused {len(self.refused)} duplicate submissions, "
+                f"saving up to {self.cpu_hours_saved:.1f} CPU-hours"
+            )
+
+
+def duplicate_submission_guard(manifest: Path) -> Optional[SubmissionGuard]:
+    """Guard against duplicate submissions, None if disabled in the config file."""
+    policy = cfg.get("SLURM", "DUPLICATE_SUBMISSION", fallback="refuse")
+    if not policy or policy == "allow":
+        return None
+
+    return SubmissionGuard(get_squeue_output(run_squeue()), manifest, policy)
+
+
+def submit_sequence(
+    sequence,
+    commandargs: list,
+    manifest: Path,
+    limiter: SubmissionRateLimiter,
+    retries: int,
+    dependency: Optional[str] = None,
+    guard: Optional[SubmissionGuard] = None,
+) -> Optional[str]:
+    """
+    Submit the job of a sequence and record it in the submission manifest.
+    If a previous job of the sequence is still queued and the guard refuses
+    duplicates, the ID of the queued job is returned instead.
+    """
+    if guard is None:
+        return _submit_sequence(sequence, commandargs, manifest, limiter, retries, dependency)
+
+    with guard.lock(sequence):
+        job_ids = guard.duplicates(sequence)
+        if job_ids and guard.policy == "refuse":
+            guard.refuse(sequence, job_ids)
+            return job_ids[-1]
+        if job_ids:
+            guard.supersede(sequence, job_ids)
+        return _submit_sequence(sequence, commandargs, manifest, limiter, retries, dependency)
+
+
+def _submit_sequence(sequence, commandargs, manifest, limiter, retries, dependency):
+    log.debug(f"Launching script {sequence.script}")
+    token = f"osa:{sequence.jobname}:{uuid.uuid4().hex[:12]}"
+    job_id = get_scheduler().submit(commandargs, token, limiter=limiter, retries=retries)
+    if job_id is not None:
+        # The packing is kept to map the array tasks back to their subruns
+        values = {}
+        if sequence.type == "DATA":
+            values = {"subruns_per_task": subruns_per_task(), "subruns": int(sequence.subruns)}
+        record_submission(manifest, sequence, job_id, dependency=dependency, **values)
+    return job_id
+
+
+def submit_jobs(sequence_list, batch_command="sbatch"):
+    """
+    Submit the jobs to the cluster.
+
+    The calibration sequence is submitted first. The data sequences,
+    which depend on it, are then submitted by decreasing priority by a
+    bounded pool of workers, without exceeding SUBMIT_RATE submissions per second.
+    The job IDs are recorded in the submission manifest of the night.
+    Sequences whose previous job is still queued are refused or superseded
+    according to DUPLICATE_SUBMISSION (see `SubmissionGuard`).
+
+    Parameters
+    ----------
+    sequence_list: list
+        List of sequences to submit.
+    batch_command: str
+        The batch command to submit the job (Default: sbatch)
+
+    Returns
+    -------
+    job_list: list
+        List of submitted job IDs.
+    """
+    job_list = []
+    no_display_backend = "--export=ALL,MPLBACKEND=Agg"
+    submit = not options.simulate and not options.test
+
+    manifest = submission_manifest_file()
+    limiter = SubmissionRateLimiter(cfg.getfloat("SLURM", "SUBMIT_RATE", fallback=None))
+    workers = cfg.getint("SLURM", "SUBMIT_WORKERS", fallback=4)
+    retries = cfg.getint("SLURM", "SUBMIT_RETRIES", fallback=3)
+    guard = duplicate_submission_guard(manifest) if submit else None
+
+    parent_jobid = None
+    data_jobs = []
+
+    # The data sequences of the most urgent sources are submitted first
+    for sequence in sort_by_priority(sequence_list):
+        commandargs = [batch_command, "--parsable", no_display_backend]
+        if sequence.type == "PEDCALIB":
             commandargs.append(str(sequence.script))
             if options.simulate or options.no_calib or options.test:
                 log.debug("SIMULATE Launching scripts")
             else:
-                try:
-                    log.debug(f"Launching script {sequence.script}")
-                    parent_jobid = sp.check_output(
-                        commandargs, universal_newlines=True, shell=False
-                    ).split()[0]
-                except sp.CalledProcessError as error:
-                    rc = error.returncode
-                    log.exception(f"Command '{batch_command}' not found, error {rc}")
+                parent_jobid = submit_sequence(
+                    sequence, commandargs, manifest, limiter, retries, guard=guard
+                )
 
             log.debug(stringify(commandargs))
 
@@ -583,10 +1710,17 @@ def submit_jobs(sequence_list, batch_command="sbatch"):
 
         # Add the job dependencies after calibration sequence
         if sequence.type == "DATA":
-            if not options.simulate and not options.no_calib and not options.test:
+            dependency = None
+            if submit and not options.no_calib:
+                if parent_jobid is None:
+                    log.error(
+                        f"Calibration sequence not submitted, skipping {sequence.script}"
+                    )
+                    job_list.append(sequence.script)
+                    continue
                 log.debug("Adding dependencies to job submission")
-                depend_string = f"--dependency=afterok:{parent_jobid}"
-                commandargs.append(depend_string)
+                dependency = f"afterok:{parent_jobid}"
+                commandargs.append(f"--dependency={dependency}")
 
             commandargs.append(sequence.script)
 
@@ -596,24 +1730,42 @@ def submit_jobs(sequence_list, batch_command="sbatch"):
                 log.debug(
                     "TEST launching datasequence scripts for " "first subrun without scheduler"
                 )
-                commandargs = ["python", sequence.script]
+                commandargs = [*script_interpreter(sequence.script), sequence.script]
                 sp.check_output(commandargs, shell=False)
             else:
-                log.info("Submitting jobs to the cluster.")
-                try:
-                    log.debug(f"Launching script {sequence.script}")
-                    sp.check_output(commandargs, shell=False)
-                except sp.CalledProcessError as error:
-                    log.exception(error)
+                data_jobs.append((sequence, commandargs, dependency))
 
             log.debug(stringify(commandargs))
 
         job_list.append(sequence.script)
 
+    if data_jobs:
+        log.info("Submitting jobs to the cluster.")
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            futures = [
+                executor.submit(
+                    submit_sequence, sequence, args, manifest, limiter, retries, dependency, guard
+                )
+                for sequence, args, dependency in data_jobs
+            ]
+            for future in futures:
+                future.result()
+
+    if guard is not None:
+        guard.report()
+
+    # The queue has changed, so the next sacct query must not reuse the snapshot
+    invalidate_sacct_snapshot()
+
     return job_list
 
 
 def run_squeue() -> StringIO:
+    """Get the status of the jobs in the queue of the scheduler set in the config file."""
+    return get_scheduler().squeue_output()
+
+
+def run_slurm_squeue() -> StringIO:
     """Run squeue command to get the status of the jobs."""
     if shutil.which("squeue") is None:
         log.warning("No job info available since squeue command is not available")
@@ -623,12 +1775,123 @@ def run_squeue() -> StringIO:
     return StringIO(sp.check_output(["squeue", "--me", "-o", out_fmt]).decode())
 
 
+def read_slurm_table(
+    source,
+    column_types: dict,
+    delimiter: str = ",",
+    header: bool = False,
+    name_column: str = None,
+    name_pattern: str = None,
+    job_id_column: str = None,
+) -> pd.DataFrame:
+    """
+    Read the output of a SLURM command with the column types given.
+
+    The output is read block by block, also from the pipe of a running
+    process. Rows whose name does not match the pattern are dropped from
+    each block, so only the jobs of interest are kept in memory.
+    Dictionary columns are returned as categorical columns.
+
+    Parameters
+    ----------
+    source: str, Path or file-like object
+        File, text buffer or binary stream (e.g. a process stdout) to read.
+    column_types: dict
+        Arrow type of each column, in the order of the columns.
+    delimiter: str
+        Column delimiter.
+    header: bool
+        Whether the first line contains the column names.
+    name_column: str, optional
+        Column with the job names.
+    name_pattern: str, optional
+        Regular expression searched in the job names to keep a row.
+    job_id_column: str, optional
+        Column with the job IDs to be split with `split_job_ids`. It is replaced
+        by the ID of the job and an ArrayIndex column is added.
+
+    Returns
+    -------
+    pd.DataFrame
+    """
+    if isinstance(source, TextIOBase):
+        source = BytesIO(source.read().encode())
+    elif isinstance(source, Path):
+        source = str(source)
+
+    read_options = pacsv.ReadOptions(column_names=None if header else list(column_types))
+    parse_options = pacsv.ParseOptions(delimiter=delimiter)
+    convert_options = pacsv.ConvertOptions(column_types=column_types, strings_can_be_null=True)
+
+    try:
+        reader = pacsv.open_csv(source, read_options, parse_options, convert_options)
+        schema = reader.schema
+    except pa.ArrowInvalid as error:
+        if "Empty CSV file" not in str(error):
+            raise
+        reader, schema = [], pa.schema(column_types.items())
+
+    batches = []
+    for batch in reader:
+        if name_pattern is not None:
+            names = batch.column(name_column)
+            # Match the pattern once per distinct name
+            matched = pc.match_substring_regex(names.dictionary, name_pattern)
+            batch = batch.filter(pc.fill_null(pc.take(matched, names.indices), False))
+        batches.append(batch)
+
+    table = pa.Table.from_batches(batches, schema=schema)
+
+    if job_id_column is not None:
+        job_ids, array_indices = split_job_ids(table.column(job_id_column))
+        index = table.schema.get_field_index(job_id_column)
+        table = table.set_column(index, job_id_column, job_ids)
+        table = table.append_column("ArrayIndex", array_indices)
+
+    return table.to_pandas(types_mapper=_string_dtype)
+
+
+def _string_dtype(arrow_type: pa.DataType):
+    """Keep the arrow strings in pandas, with NaN as missing value (pandas >= 2.3)."""
+    if arrow_type == pa.string():
+        return pd.StringDtype("pyarrow", na_value=np.nan)
+    return None
+
+
+def split_job_ids(job_ids: pa.ChunkedArray) -> Tuple[pa.ChunkedArray, pa.ChunkedArray]:
+    """
+    Split the SLURM job IDs (e.g. 1234, 1234_5, 1234_[0-10] or 1234_5.batch)
+    into the ID of the job and the index of the array task.
+
+    Returns
+    -------
+    job_ids: pa.ChunkedArray
+        Integer ID of the jobs.
+    array_indices: pa.ChunkedArray
+        Array task index (or range of pending indices), null if not an array job.
+    """
+    parts = pc.extract_regex(job_ids, JOB_ID_RE)
+    array_indices = pc.struct_field(parts, "ArrayIndex")
+    return (
+        pc.struct_field(parts, "JobID").cast(pa.int64()),
+        pc.if_else(pc.equal(array_indices, ""), pa.scalar(None, pa.string()), array_indices),
+    )
+
+
 def get_squeue_output(squeue_output: StringIO) -> pd.DataFrame:
     """
     Obtain the current job information from squeue output
     and return a pandas dataframe.
     """
-    df = pd.read_csv(squeue_output, delimiter=";")
+    df = read_slurm_table(
+        squeue_output,
+        SQUEUE_COLUMN_TYPES,
+        delimiter=";",
+        header=True,
+        name_column="NAME",
+        name_pattern="LST1",
+        job_id_column="JOBID",
+    )
     df.rename(
         inplace=True,
         columns={
@@ -639,26 +1902,25 @@ def get_squeue_output(squeue_output: StringIO) -> pd.DataFrame:
         },
     )
 
-    # Keep only the jobs corresponding to OSA sequences
-    df = df[df["JobName"].str.contains("LST1")]
-
-    try:
-        # Remove the job array part of the jobid
-        df["JobID"] = df["JobID"].apply(lambda x: x.split("_")[0]).astype("int")
-    except AttributeError:
-        log.debug("No job info could be obtained from squeue")
-
-    df["CPUTimeRAW"] = df["CPUTime"].apply(time_to_seconds)
+    # The elapsed times are categorical, so each distinct one is converted once
+    df["CPUTimeRAW"] = df["CPUTime"].map(time_to_seconds).astype("int64")
+    df["CPUTime"] = df["CPUTime"].astype(str)
 
     return df
 
 
-def run_sacct(job_id: str = None) -> StringIO:
-    """Run sacct to obtain the job information."""
-    if shutil.which("sacct") is None:
-        log.warning("No job info available since sacct command is not available")
-        return StringIO()
+def sacct_command(job_id: str = None, starttime: str = None) -> list:
+    """
+    Build the sacct command to obtain the job information.
 
+    Parameters
+    ----------
+    job_id: str, optional
+        Restrict the query to a given job.
+    starttime: str, optional
+        Only fetch the jobs in any state after this time (YYYY-MM-DD[THH:MM:SS]).
+        By default, it is set from the STARTTIME_DAYS_SACCT config option.
+    """
     sacct_cmd = [
         "sacct",
         "-n",
@@ -673,13 +1935,93 @@ def run_sacct(job_id: str = None) -> StringIO:
         sacct_cmd.append("--jobs")
         sacct_cmd.append(job_id)
 
-    if cfg.get("SLURM", "STARTTIME_DAYS_SACCT"):
+    if starttime:
+        sacct_cmd.extend(["--starttime", starttime])
+    elif cfg.get("SLURM", "STARTTIME_DAYS_SACCT"):
         days = int(cfg.get("SLURM", "STARTTIME_DAYS_SACCT"))
         start_date = (datetime.date.today() - datetime.timedelta(days=days)).isoformat()
         sacct_cmd.extend(["--starttime", start_date])
 
-    return StringIO(sp.check_output(sacct_cmd).decode())
-    
+    return sacct_cmd
+
+
+def run_sacct(job_id: str = None, starttime: str = None) -> StringIO:
+    """
+    Run sacct to obtain the job information.
+
+    Parameters
+    ----------
+    job_id: str, optional
+        Restrict the query to a given job.
+    starttime: str, optional
+        Only fetch the jobs in any state after this time (YYYY-MM-DD[THH:MM:SS]).
+        By default, it is set from the STARTTIME_DAYS_SACCT config option.
+    """
+    if shutil.which("sacct") is None:
+        log.warning("No job info available since sacct command is not available")
+        return StringIO()
+
+    return StringIO(sp.check_output(sacct_command(job_id, starttime)).decode())
+
+
+def stream_sacct(
+    parser: Callable = None, job_id: str = None, starttime: str = None
+) -> pd.DataFrame:
+    """
+    Run sacct and parse its output as it is read from the pipe,
+    without keeping the whole output in memory.
+
+    Parameters
+    ----------
+    parser: Callable, optional
+        Function parsing the sacct output, `get_sacct_output` by default.
+    job_id: str, optional
+        Restrict the query to a given job.
+    starttime: str, optional
+        Only fetch the jobs in any state after this time (YYYY-MM-DD[THH:MM:SS]).
+    """
+    if parser is None:
+        parser = get_sacct_output
+
+    if shutil.which("sacct") is None:
+        log.warning("No job info available since sacct command is not available")
+        return parser(StringIO())
+
+    sacct_cmd = sacct_command(job_id, starttime)
+    with sp.Popen(sacct_cmd, stdout=sp.PIPE) as process:
+        sacct_output = parser(process.stdout)
+
+    if process.returncode != 0:
+        raise sp.CalledProcessError(process.returncode, sacct_cmd)
+
+    return sacct_output
+
+
+def read_sacct_table(
+    sacct_output, name_pattern: str = None, split_ids: bool = False
+) -> pd.DataFrame:
+    """
+    Read the sacct output with explicit column types. The job names, states
+    and exit codes are categorical. See `read_slurm_table`.
+
+    Parameters
+    ----------
+    sacct_output: str, Path or file-like object
+        Output of `run_sacct`, or the pipe of a running sacct process.
+    name_pattern: str, optional
+        Regular expression searched in the job names to keep a job.
+    split_ids: bool
+        Give the steps and array tasks the integer ID of their job, adding
+        the ArrayIndex column.
+    """
+    return read_slurm_table(
+        sacct_output,
+        SACCT_COLUMN_TYPES,
+        name_column="JobName",
+        name_pattern=name_pattern,
+        job_id_column="JobID" if split_ids else None,
+    )
+
 
 def get_sacct_output(sacct_output: StringIO) -> pd.DataFrame:
     """
@@ -690,22 +2032,8 @@ def get_sacct_output(sacct_output: StringIO) -> pd.DataFrame:
     -------
     queue_list: pd.DataFrame
     """
-    sacct_output = pd.read_csv(sacct_output, names=FORMAT_SLURM)
-
     # Keep only the jobs corresponding to OSA sequences
-    sacct_output = sacct_output[
-        (sacct_output["JobName"].str.contains("batch"))
-        | (sacct_output["JobName"].str.contains("LST1"))
-    ]
-
-    try:
-        sacct_output["JobID"] = sacct_output["JobID"].apply(lambda x: x.split("_")[0])
-        sacct_output["JobID"] = sacct_output["JobID"].str.strip(".batch").astype(int)
-
-    except AttributeError:
-        log.debug("No job info could be obtained from sacct")
-
-    return sacct_output
+    return read_sacct_table(sacct_output, name_pattern="batch|LST1", split_ids=True)
 
 
 def get_closer_sacct_output(sacct_output) -> pd.DataFrame:
@@ -717,33 +2045,455 @@ def get_closer_sacct_output(sacct_output) -> pd.DataFrame:
     -------
     queue_list: pd.DataFrame
     """
-    sacct_output = pd.read_csv(sacct_output, names=FORMAT_SLURM)
-
     # Keep only the jobs corresponding to AUTOCLOSER sequences 
     # Until the merging of muon files is fixed, check all jobs except "lstchain_merge_muon_files"
-    sacct_output = sacct_output[
-        (sacct_output["JobName"].str.contains("lstchain_merge_hdf5_files"))
-        | (sacct_output["JobName"].str.contains("lstchain_check_dl1"))
-        | (sacct_output["JobName"].str.contains("lstchain_longterm_dl1_check"))
-        | (sacct_output["JobName"].str.contains("lstchain_cherenkov_transparency"))
-        | (sacct_output["JobName"].str.contains("provproces"))
-    ]
+    return read_sacct_table(sacct_output, name_pattern=CLOSER_JOBS_PATTERN, split_ids=True)
+
+
+def read_sacct_journal(journal: Path) -> Tuple[Optional[datetime.datetime], dict]:
+    """
+    Read the journal of job states previously fetched from sacct.
+
+    The first line keeps the time of the last sacct poll and the rest of the lines
+    are the sacct records prefixed with the time they were last seen.
+
+    Returns
+    -------
+    last_poll: datetime.datetime or None
+        Time of the last sacct poll, None if there is no journal yet.
+    records: dict
+        Raw sacct records (last_seen, line) indexed by the full JobID (including
+        array index and job step).
+    """
+    if not journal.is_file():
+        return None, {}
 
+    lines = journal.read_text().splitlines()
     try:
-        sacct_output["JobID"] = sacct_output["JobID"].apply(lambda x: x.split("_")[0])
-        sacct_output["JobID"] = sacct_output["JobID"].str.strip(".batch").astype(int)
+        last_poll = datetime.datetime.fromisoformat(lines[0].lstrip("#"))
+    except (IndexError, ValueError):
+        log.warning(f"Malformed sacct journal {journal}. Ignoring it.")
+        return None, {}
 
-    except AttributeError:
-        log.debug("No job info could be obtained from sacct")
+    records = {}
+    for line in lines[1:]:
+        last_seen, _, record = line.partition(",")
+        records[record.split(",", 1)[0]] = (last_seen, record)
 
-    return sacct_output
+    return last_poll, records
+
+
+def write_sacct_journal(journal: Path, last_poll: datetime.datetime, records: dict) -> None:
+    """Atomically write the journal of job states (see `read_sacct_journal`)."""
+    journal.parent.mkdir(parents=True, exist_ok=True)
+    content = [f"#{last_poll.isoformat(timespec='seconds')}"]
+    content.extend(f"{last_seen},{record}" for last_seen, record in records.values())
+    # Write to a temporary file and rename it so that concurrent cron
+    # processes never read a truncated journal.
+    journal_temp = journal.with_name(f"{journal.name}.{os.getpid()}.tmp")
+    journal_temp.write_text("\n".join(content) + "\n")
+    os.replace(journal_temp, journal)
+
+
+def fetch_sacct_output() -> str:
+    """
+    Get the sacct output of the jobs from the scheduler set in the config file.
+
+    Returns
+    -------
+    sacct_output: str
+        Raw sacct output as produced by `run_sacct`.
+    """
+    return get_scheduler().sacct_output()
+
+
+def fetch_slurm_sacct_output() -> str:
+    """
+    Get the sacct output of the jobs, only querying sacct for the jobs that
+    changed since the last poll if the SACCT_JOURNAL option is set.
+
+    Returns
+    -------
+    sacct_output: str
+        Raw sacct output as produced by `run_sacct`.
+    """
+    # The watch mode of the sequencer keeps a journal of the night by default
+    journal_file = cfg.get("SLURM", "SACCT_JOURNAL", fallback=None) or options.sacct_journal
+    if not journal_file or shutil.which("sacct") is None:
+        return run_sacct().getvalue()
+
+    journal = Path(journal_file)
+    last_poll, records = read_sacct_journal(journal)
+    poll_time = datetime.datetime.now()
+
+    if last_poll is None:
+        new_output = run_sacct()
+    else:
+        # Overlap consecutive polls to avoid missing state changes around the last poll
+        starttime = last_poll - SACCT_JOURNAL_OVERLAP
+        new_output = run_sacct(starttime=starttime.isoformat(timespec="seconds"))
+
+    poll_string = poll_time.isoformat(timespec="seconds")
+    for line in new_output.getvalue().splitlines():
+        if line:
+            records[line.split(",", 1)[0]] = (poll_string, line)
+
+    # Forget the jobs that would not be fetched by sacct anymore
+    if cfg.get("SLURM", "STARTTIME_DAYS_SACCT"):
+        days = int(cfg.get("SLURM", "STARTTIME_DAYS_SACCT"))
+        oldest = (poll_time - datetime.timedelta(days=days)).isoformat(timespec="seconds")
+        records = {key: value for key, value in records.items() if value[0] >= oldest}
+
+    write_sacct_journal(journal, poll_time, records)
+    log.debug(f"sacct journal {journal} updated with {len(records)} records")
+
+    return "".join(f"{record}\n" for _, record in records.values())
+
+
+def sacct_cache_ttl() -> float:
+    """Return the time (in seconds) during which a sacct snapshot is valid."""
+    ttl = cfg.get("SLURM", "SACCT_CACHE_TTL", fallback=None)
+    return float(ttl) if ttl else 0.0
+
+
+def get_sacct_snapshot(parser: Callable = None, max_age: float = None) -> pd.DataFrame:
+    """
+    Return the parsed sacct output shared by all the callers within the process.
+
+    sacct is only queried again once the snapshot is older than `max_age`,
+    and each parser is only applied once per snapshot.
+
+    Parameters
+    ----------
+    parser: Callable, optional
+        Function parsing the sacct output, `get_sacct_output` by default.
+    max_age: float, optional
+        Maximum age of the snapshot in seconds. By default, SACCT_CACHE_TTL.
+
+    Returns
+    -------
+    sacct_info: pd.DataFrame
+        Copy of the parsed sacct output.
+    """
+    if parser is None:
+        parser = get_sacct_output
+
+    if max_age is None:
+        max_age = math.inf if _SACCT_SHARING["depth"] else sacct_cache_ttl()
+
+    now = time.monotonic()
+    if not _SACCT_SNAPSHOT or now - _SACCT_SNAPSHOT["timestamp"] > max_age:
+        log.debug("Fetching a new sacct snapshot")
+        _SACCT_SNAPSHOT.clear()
+        _SACCT_SNAPSHOT.update(timestamp=now, output=fetch_sacct_output(), tables={})
+
+    tables = _SACCT_SNAPSHOT["tables"]
+    if parser not in tables:
+        tables[parser] = parser(StringIO(_SACCT_SNAPSHOT["output"]))
+
+    return tables[parser].copy()
+
+
+def invalidate_sacct_snapshot() -> None:
+    """Drop the sacct snapshot, e.g. after submitting new jobs."""
+    if _SACCT_SHARING["depth"]:
+        # Jobs submitted for one night do not change the state of the others
+        return
+    _SACCT_SNAPSHOT.clear()
+
+
+@contextmanager
+def shared_sacct_snapshot():
+    """
+    Share a single sacct snapshot among all the nights processed within
+    the block. sacct is queried once, unless an explicit `max_age` is
+    requested, and the submissions do not invalidate the snapshot.
+    """
+    _SACCT_SHARING["depth"] += 1
+    try:
+        yield
+    finally:
+        _SACCT_SHARING["depth"] -= 1
+        if not _SACCT_SHARING["depth"]:
+            _SACCT_SNAPSHOT.clear()
+
+
+def get_job_resources(sacct_output: StringIO) -> pd.DataFrame:
+    """
+    Fetch the resources used by each job (or array task) of the OSA
+    sequences from the sacct output.
+
+    Returns
+    -------
+    job_resources: pd.DataFrame
+        Table with the JobID, JobName, run, type (DATA for array tasks,
+        PEDCALIB otherwise), State, Elapsed (seconds) and MaxRSS (GB) columns.
+    """
+    sacct_output = read_sacct_table(sacct_output)
+    task_ids = sacct_output["JobID"].str.split(".").str[0]
+    # The memory is accounted in the steps of each job
+    memory = memory_to_gb(sacct_output["MaxRSS"]).groupby(task_ids).max()
+
+    run = sacct_output["JobName"].str.extract(r"^LST1_(\d+)$")[0]
+    tasks = sacct_output[run.notna() & (task_ids == sacct_output["JobID"])]
+    tasks_ids = task_ids[tasks.index]
+
+    return pd.DataFrame(
+        {
+            "JobID": tasks_ids,
+            "JobName": tasks["JobName"],
+            "run": run[tasks.index].astype(int),
+            "type": tasks_ids.str.contains("_").map({True: "DATA", False: "PEDCALIB"}),
+            "State": tasks["State"].str.split().str[0],
+            "Elapsed": tasks["Elapsed"].fillna("00:00:00").map(time_to_seconds),
+            "MaxRSS": memory.reindex(tasks_ids).to_numpy(),
+        }
+    ).reset_index(drop=True)
+
+
+def get_task_resources(sacct_output: StringIO) -> pd.DataFrame:
+    """
+    Resources used by each job (or array task) of the OSA sequences, as given
+    by `get_job_resources`, with the number of subruns each one processed.
+    It is taken from the packing recorded in the submission manifests of the
+    nights covered by sacct. Jobs not found there processed a single subrun.
+    """
+    usage = get_job_resources(sacct_output)
+    max_nights = int(cfg.get("SLURM", "STARTTIME_DAYS_SACCT", fallback=None) or 0) + 1
+    packing = {}
+    for directory in recent_nights(max_nights):
+        manifest = directory / "log" / "submission_manifest.json"
+        for record in read_submission_manifest(manifest).values():
+            if record.get("subruns_per_task"):
+                # The arrays resubmitted with the failed tasks run the same script
+                for job_id in [record["jobid"], *record.get("previous_jobids", [])]:
+                    packing[str(job_id)] = record
+
+    job_ids = usage["JobID"].str.split("_").str[0]
+    task_ids = pd.to_numeric(usage["JobID"].str.extract(r"_(\d+)$")[0])
+    per_task = job_ids.map(lambda job_id: packing.get(job_id, {}).get("subruns_per_task", 1))
+    n_subruns = job_ids.map(lambda job_id: packing.get(job_id, {}).get("subruns"))
+    # The last task of an array processes the remaining subruns
+    remaining = pd.to_numeric(n_subruns) - task_ids * per_task
+    return usage.assign(subruns=per_task.clip(lower=1, upper=remaining).astype(int))
+
+
+def get_job_states(sacct_output: StringIO) -> pd.DataFrame:
+    """
+    Fetch the state of every job in the sacct output, whatever its name.
+    The steps and array tasks of a job are given the ID of the parent job.
+
+    Returns
+    -------
+    job_states: pd.DataFrame
+        Table with the JobID and State columns.
+    """
+    job_states = read_sacct_table(sacct_output, split_ids=True)[["JobID", "State"]]
+    job_states["JobID"] = job_states["JobID"].astype(str)
+    return job_states
+
+
+def summarize_job_states(job_states: pd.DataFrame) -> dict:
+    """
+    Reduce the states of the steps and array tasks of each job to a single one.
+
+    A job is only considered finished once all its tasks are. It is
+    then COMPLETED if all of them completed, otherwise it takes the state of
+    the first one which did not.
+
+    Returns
+    -------
+    dict
+        Job state keyed by job ID.
+    """
+    states = job_states["State"].astype(str).str.split().str[0]
+    job_ids = job_states["JobID"].astype(str)
+
+    summary = {}
+    for job_id, job_state in states.groupby(job_ids, sort=False):
+        ongoing = job_state[~job_state.isin(TERMINAL_JOB_STATES)]
+        failed = job_state[job_state != "COMPLETED"]
+        if not ongoing.empty:
+            summary[job_id] = ongoing.iloc[0]
+        elif not failed.empty:
+            summary[job_id] = failed.iloc[0]
+        else:
+            summary[job_id] = "COMPLETED"
+
+    return summary
+
+
+def wait_for_jobs(
+    job_ids: Iterable = None,
+    parser: Callable = None,
+    timeout: float = None,
+    min_interval: float = None,
+    max_interval: float = None,
+    sleep: Callable[[float], None] = time.sleep,
+) -> dict:
+    """
+    Wait until the given jobs reach a final state.
+
+    All the watched jobs are checked with a single sacct query per poll.
+    The interval between polls starts at `min_interval` and is doubled,
+    up to `max_interval`, every time no job changed its state.
+
+    Parameters
+    ----------
+    job_ids: Iterable, optional
+        IDs of the jobs to watch. By default, all the jobs found by `parser`.
+    parser: Callable, optional
+        Function parsing the sacct output into a table with the JobID and
+        State columns, `get_job_states` by default.
+    timeout: float, optional
+        Maximum waiting time in seconds. By default, JOB_WAIT_TIMEOUT.
+    min_interval: float, optional
+        Initial interval between polls in seconds. By default, JOB_WAIT_MIN_INTERVAL.
+    max_interval: float, optional
+        Maximum interval between polls in seconds. By default, JOB_WAIT_MAX_INTERVAL.
+    sleep: Callable
+        Function used to wait between polls.
+
+    Returns
+    -------
+    states: dict
+        Last known state of each job keyed by job ID, None if not found in sacct.
+    """
+    if parser is None:
+        parser = get_job_states
+    if timeout is None:
+        timeout = cfg.getfloat("SLURM", "JOB_WAIT_TIMEOUT", fallback=3600)
+    if min_interval is None:
+        min_interval = cfg.getfloat("SLURM", "JOB_WAIT_MIN_INTERVAL", fallback=10)
+    if max_interval is None:
+        max_interval = cfg.getfloat("SLURM", "JOB_WAIT_MAX_INTERVAL", fallback=300)
+
+    watched = None if job_ids is None else [str(job_id) for job_id in job_ids]
+    interval = min_interval
+    waited = 0.0
+    previous_states = None
+
+    while True:
+        states = summarize_job_states(get_sacct_snapshot(parser=parser, max_age=0))
+        if watched is not None:
+            states = {job_id: states.get(job_id) for job_id in watched}
+
+        unfinished = [
+            job_id for job_id, state in states.items() if state not in TERMINAL_JOB_STATES
+        ]
+        if not unfinished:
+            return states
+
+        if waited >= timeout:
+            log.warning(f"Jobs {', '.join(unfinished)} did not finish after {waited:.0f} s")
+            return states
+
+        # Poll again soon while the jobs progress, back off otherwise
+        if states != previous_states:
+            interval = min_interval
+        else:
+            interval = min(2 * interval, max_interval)
+        previous_states = states
+
+        log.debug(f"{len(unfinished)} jobs not finished yet, checking again in {interval:.0f} s")
+        sleep(interval)
+        waited += interval
 
 
 def filter_jobs(job_info: pd.DataFrame, sequence_list: Iterable):
     """Filter the job info list to get the values of the jobs in the current queue."""
-    sequences_info = pd.DataFrame([vars(seq) for seq in sequence_list])
+    jobnames = [sequence.jobname for sequence in sequence_list]
     # Keep the jobs in the sacct output that are present in the sequence list
-    return job_info[job_info["JobName"].isin(sequences_info["jobname"])]
+    return job_info[job_info["JobName"].isin(jobnames)]
+
+
+def summarize_sequence_jobs(job_info: pd.DataFrame) -> pd.DataFrame:
+    """
+    Compute in a single pass the job values of every sequence (i.e. job name)
+    present in the job info table. Only the latest job submitted for a given
+    sequence determines its state, exit code and CPU time.
+
+    Parameters
+    ----------
+    job_info: pd.DataFrame
+        Concatenated sacct and squeue information of the jobs.
+
+    Returns
+    -------
+    summary: pd.DataFrame
+        Table indexed by job name with columns tries, jobid, cputime, state and exit.
+        State and exit are None if they cannot be inferred from the jobs.
+    """
+    job_info = job_info.reset_index(drop=True)
+    names = job_info["JobName"].astype(str)
+    by_name = job_info["JobID"].groupby(names, sort=False)
+    summary = pd.DataFrame({"tries": by_name.nunique(), "jobid": by_name.max()})
+
+    # Keep only the latest job of each sequence
+    latest = job_info[job_info["JobID"] == by_name.transform("max")]
+    latest_names = names[latest.index]
+    state = latest["State"].astype(str)
+    flags = pd.DataFrame(
+        {
+            "completed": state == "COMPLETED",
+            "pending": state == "PENDING",
+            "failed": state.str.contains("FAILED", regex=False),
+            "cancelled": state.str.contains("CANCELLED", regex=False),
+            "timeout": state.str.contains("TIMEOUT", regex=False),
+            "running": state.str.contains("RUNNING", regex=False),
+        }
+    )
+    all_flags = flags.groupby(latest_names, sort=False).all().reindex(summary.index)
+    any_flags = flags.groupby(latest_names, sort=False).any().reindex(summary.index)
+
+    # Conditions sorted by precedence: e.g. a sequence with any failed
+    # subrun is FAILED, even if other subruns are still running.
+    conditions = [
+        ("COMPLETED", all_flags["completed"]),
+        ("PENDING", all_flags["pending"]),
+        ("FAILED", any_flags["failed"]),
+        ("CANCELLED", any_flags["cancelled"]),
+        ("TIMEOUT", any_flags["timeout"]),
+        ("RUNNING", any_flags["running"]),
+    ]
+    summary["state"] = None
+    for sequence_state, condition in reversed(conditions):
+        summary.loc[condition, "state"] = sequence_state
+
+    # Exit code of the first job in the state that defines the sequence state
+    summary["exit"] = None
+    for sequence_state, mask in (
+        ("COMPLETED", flags["completed"]),
+        ("FAILED", flags["failed"]),
+        ("CANCELLED", flags["cancelled"]),
+    ):
+        first_rows = latest_names[mask].drop_duplicates()
+        first_exit = pd.Series(
+            latest.loc[first_rows.index, "ExitCode"].to_numpy(), index=first_rows.to_numpy()
+        )
+        in_state = summary["state"] == sequence_state
+        summary.loc[in_state, "exit"] = first_exit.reindex(summary.index[in_state])
+    summary.loc[summary["state"] == "TIMEOUT", "exit"] = "0:15"
+
+    # Median CPU time is undefined if any of the jobs lacks it
+    cputime = latest["CPUTimeRAW"].astype(float)
+    median_cputime = cputime.groupby(latest_names, sort=False).median()
+    median_cputime = median_cputime.mask(cputime.isna().groupby(latest_names).any())
+    summary["cputime"] = pd.Series(
+        [_format_cputime(seconds) for seconds in median_cputime.reindex(summary.index)],
+        index=summary.index,
+        dtype=object,
+    )
+
+    return summary
+
+
+def _format_cputime(seconds: float):
+    """Format a time in seconds as HH:MM:SS, None if it is not defined."""
+    try:
+        return time.strftime("%H:%M:%S", time.gmtime(seconds))
+    except (ValueError, OverflowError):
+        return None
 
 
 def set_queue_values(
@@ -762,64 +2512,180 @@ def set_queue_values(
     if sacct_info.empty and squeue_info.empty or sequence_list is None:
         return
 
-    job_info = pd.concat([sacct_info, squeue_info])
+    job_info = pd.concat([sacct_info, squeue_info], ignore_index=True)
+
+    # Avoid a circular import, the speculation module builds on this one
+    from osa.speculation import mask_superseded_tasks
+
+    # Array tasks cancelled in favour of their speculative execution processed their subruns
+    job_info = mask_superseded_tasks(job_info, sacct_info)
 
     # Filter the jobs in the sacct output that are present in the sequence list
     job_info_filtered = filter_jobs(job_info, sequence_list)
 
+    summary = {}
+    if not job_info_filtered.empty:
+        summary = summarize_sequence_jobs(job_info_filtered).to_dict("index")
+
     for sequence in sequence_list:
-        df_jobname = job_info_filtered[job_info_filtered["JobName"] == sequence.jobname]
-        sequence.tries = df_jobname["JobID"].nunique()
         sequence.action = "Check"
+        values = summary.get(sequence.jobname)
 
-        if not df_jobname.empty:
-            sequence.jobid = df_jobname["JobID"].max()  # Get latest JobID
-            df_jobid_filtered = df_jobname[df_jobname["JobID"] == sequence.jobid]
-            try:
-                sequence.cputime = time.strftime(
-                    "%H:%M:%S",
-                    time.gmtime(df_jobid_filtered["CPUTimeRAW"].median(skipna=False)),
-                )
-            except ValueError:
-                sequence.cputime = None
-
-            update_sequence_state(sequence, df_jobid_filtered)
-
+        if values is None:
+            sequence.tries = 0
+            continue
 
-def update_sequence_state(sequence, filtered_job_info: pd.DataFrame) -> None:
-    """
-    Update the state of the sequence based on the job info.
-
-    Parameters
-    ----------
-    sequence: Sequence object
-    filtered_job_info: pd.DataFrame
-    """
-    if (filtered_job_info.State.values == "COMPLETED").all():
-        sequence.state = "COMPLETED"
-        sequence.exit = filtered_job_info["ExitCode"].iloc[0]
-    elif (filtered_job_info.State.values == "PENDING").all():
-        sequence.state = "PENDING"
-    elif any("FAILED" in job for job in filtered_job_info.State):
-        sequence.state = "FAILED"
-        sequence.exit = filtered_job_info[filtered_job_info.State.values == "FAILED"][
-            "ExitCode"
-        ].iloc[0]
-    elif any("CANCELLED" in job for job in filtered_job_info.State):
-        sequence.state = "CANCELLED"
-        mask = ["CANCELLED" in job for job in filtered_job_info.State]
-        sequence.exit = filtered_job_info[mask]["ExitCode"].iloc[0]
-    elif any("TIMEOUT" in job for job in filtered_job_info.State):
-        sequence.state = "TIMEOUT"
-        sequence.exit = "0:15"
-    elif any("RUNNING" in job for job in filtered_job_info.State):
-        sequence.state = "RUNNING"
+        sequence.tries = values["tries"]
+        sequence.jobid = values["jobid"]  # Latest JobID
+        sequence.cputime = values["cputime"]
+        if values["state"] is not None:
+            sequence.state = values["state"]
+        if values["exit"] is not None:
+            sequence.exit = values["exit"]
 
 
 def job_finished_in_timeout(job_id: str) -> bool:
     """Return True if the input job_id finished in TIMEOUT state."""
-    job_status = get_sacct_output(run_sacct(job_id=job_id))["State"]
+    job_status = stream_sacct(job_id=job_id)["State"]
     if job_id and job_status.item() == "TIMEOUT":
         return True
     else:
         return False
+
+
+def failed_array_tasks(sequence, sacct_info: pd.DataFrame, index: dict) -> Dict[int, Optional[str]]:
+    """
+    Find the array tasks of a data sequence that have to be run again, i.e.
+    those no longer queued whose subruns are not all completed according to
+    their history files. Only the latest execution of each task is considered,
+    so tasks already resubmitted are not counted twice.
+
+    Parameters
+    ----------
+    sequence: sequence object
+    sacct_info: pd.DataFrame
+        Jobs in sacct (see `get_sacct_output`).
+    index: dict
+        Level and exit status of the subruns (see `history_index`).
+
+    Returns
+    -------
+    tasks: dict
+        State of the latest execution of each task to resubmit keyed by
+        array index, None for the tasks of the array not found in sacct.
+        Empty if the sequence was never submitted.
+    """
+    jobs = sacct_info[
+        (sacct_info["JobName"] == sequence.jobname) & sacct_info["ArrayIndex"].notna()
+    ].sort_values("JobID", kind="stable")
+    if jobs.empty:
+        return {}
+
+    latest_states = {}
+    for array_index, state in zip(jobs["ArrayIndex"], jobs["State"].astype(str)):
+        # Pending tasks are reported as a range, e.g. [3-10%5]
+        for task_id in array_task_ids(array_index.strip("[]")):
+            latest_states[task_id] = state
+
+    completed_level = 1 if options.no_dl2 else 0
+    subrun_levels = index.get(sequence.run, {})
+    packing = subruns_per_task()
+    tasks = {}
+
+    for task_id in range(math.ceil(sequence.subruns / packing)):
+        state = latest_states.get(task_id)
+        if state is not None and state not in TERMINAL_JOB_STATES:
+            continue
+
+        subruns = range(task_id * packing, min((task_id + 1) * packing, sequence.subruns))
+        if all(
+            subrun_levels.get(subrun, (math.inf, None))[0] <= completed_level
+            for subrun in subruns
+        ):
+            continue
+
+        tasks[task_id] = state
+
+    return tasks
+
+
+def resubmit_failed_tasks(sequence_list, walltime_factor: float = None) -> Dict[str, str]:
+    """
+    Submit again for each data sequence an array containing only its failed
+    or missing tasks (see `failed_array_tasks`) rather than the whole run.
+
+    Parameters
+    ----------
+    sequence_list: list
+        Sequences of the night, whose job scripts are already written.
+    walltime_factor: float, optional
+        Factor applied to the walltime of the job script if any of the tasks
+        ended in TIMEOUT. By default, RESUBMIT_WALLTIME_FACTOR.
+
+    Returns
+    -------
+    job_ids: dict
+        Job ID of the resubmitted arrays keyed by job name.
+    """
+    if walltime_factor is None:
+        walltime_factor = cfg.getfloat("SLURM", "RESUBMIT_WALLTIME_FACTOR", fallback=1.0)
+
+    data_sequences = [sequence for sequence in sequence_list if sequence.type == "DATA"]
+    if not data_sequences:
+        return {}
+
+    sacct_info = get_sacct_snapshot()
+    index = history_index(
+        Path(options.directory), {sequence.run: sequence.type for sequence in data_sequences}
+    )
+    manifest = submission_manifest_file()
+    retries = cfg.getint("SLURM", "SUBMIT_RETRIES", fallback=3)
+    job_ids = {}
+
+    for sequence in data_sequences:
+        tasks = failed_array_tasks(sequence, sacct_info, index)
+        if not tasks:
+            continue
+
+        directives = read_sbatch_directives(sequence.script) if sequence.script.exists() else {}
+        array = array_ranges(tasks)
+        # Keep the concurrency limit the array was submitted with
+        _, _, limit = (directives.get("--array") or "").partition("%")
+        if limit:
+            array += f"%{limit}"
+
+        commandargs = ["sbatch", "--parsable", "--export=ALL,MPLBACKEND=Agg", f"--array={array}"]
+        if "TIMEOUT" in tasks.values() and walltime_factor > 1:
+            walltime = directives.get("--time") or cfg.get("SLURM", "WALLTIME")
+            walltime = seconds_to_time(walltime_factor * time_to_seconds(walltime))
+            commandargs.append(f"--time={walltime}")
+        commandargs.append(str(sequence.script))
+
+        log.info(f"Resubmitting {len(tasks)} array tasks of {sequence.jobname}: {array}")
+
+        if options.simulate or options.test:
+            log.debug(f"SIMULATE Launching {stringify(commandargs)}")
+            continue
+
+        token = f"osa:{sequence.jobname}:{uuid.uuid4().hex[:12]}"
+        job_id = get_scheduler().submit(commandargs, token, retries=retries)
+        if job_id is not None:
+            # Keep the packing of the script and the arrays submitted before
+            record = read_submission_manifest(manifest).get(sequence.jobname, {})
+            previous_jobids = record.get("previous_jobids", [])
+            if "jobid" in record:
+                previous_jobids = [*previous_jobids, record["jobid"]]
+            record_submission(
+                manifest,
+                sequence,
+                job_id,
+                subruns_per_task=record.get("subruns_per_task") or subruns_per_task(),
+                subruns=int(sequence.subruns),
+                previous_jobids=previous_jobids,
+            )
+            job_ids[sequence.jobname] = job_id
+
+    if job_ids:
+        invalidate_sacct_snapshot()
+
+    return job_ids
@@ -0,0 +1,328 @@
+"""
+Aggregated logs of the array tasks of a run.
+
+Instead of writing a .out and a .err file per array task, the pilot scripts
+can stream the output of each subrun into a single log container per run
+(log/RunXXXXX.joblog). The output is appended in chunks, each one recorded
+in the index of the container (log/RunXXXXX.joblog.index) together with its
+subrun, job ID, stream, byte range and number of subruns (those processed by
+a task packing several subruns), so that the log of a subrun is extracted
+without reading the whole container. Concurrent tasks lock the container for
+each append.
+"""
+
+import fcntl
+import logging
+import os
+import re
+import signal
+import subprocess as sp
+import sys
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, List, Optional
+
+from osa.utils.logging import myLogger
+
+__all__ = [
+    "LogChunk",
+    "JobLogWriter",
+    "job_log_file",
+    "job_log_index_file",
+    "append_job_log",
+    "read_job_log_index",
+    "extract_job_log",
+    "run_logged",
+    "compact_job_logs",
+]
+
+log = myLogger(logging.getLogger(__name__))
+
+JOB_LOG_SUFFIX = ".joblog"
+INDEX_SUFFIX = ".index"
+
+# Output buffered by a task before it is appended to the container,
+# in bytes and seconds since the previous append.
+CHUNK_SIZE = 64 * 1024
+FLUSH_INTERVAL = 30
+
+# Log files written by each array task, e.g. Run01807.0012_jobid_1234.out, or
+# Run01807.task0003x4_jobid_1234.out by the task 3 processing 4 subruns (12 to 15)
+TASK_LOG_RE = re.compile(
+    r"^Run(?P<run>\d{5})\.(?:(?P<subrun>\d{4})|task(?P<task>\d{4})x(?P<packing>\d+))"
+    r"_jobid_(?P<job_id>\d+)\.(?P<stream>out|err)$"
+)
+
+
+@dataclass(frozen=True)
+class LogChunk:
+    """
+    Byte range of the container holding a chunk of the output of a subrun,
+    or of the `n_subruns` subruns from `subrun` on processed by a packed task.
+    """
+
+    subrun: int
+    job_id: str
+    stream: str
+    offset: int
+    length: int
+    n_subruns: int = 1
+
+    def covers(self, subrun: int) -> bool:
+        """Whether the chunk holds the output of a subrun."""
+        return self.subrun <= subrun < self.subrun + self.n_subruns
+
+
+def job_log_file(log_dir: Path, run: int) -> Path:
+    """Log container of the array tasks of a run."""
+    return Path(log_dir) / f"Run{run:05d}{JOB_LOG_SUFFIX}"
+
+
+def job_log_index_file(job_log: Path) -> Path:
+    """Index of the chunks of a log container."""
+    return job_log.with_name(job_log.name + INDEX_SUFFIX)
+
+
+def append_job_log(
+    job_log: Path, data: bytes, subrun: int, job_id: str, stream: str, n_subruns: int = 1
+) -> LogChunk:
+    """
+    Append a chunk of output to the log container and record it in its index.
+
+    Parameters
+    ----------
+    job_log: Path
+        Log container of the run.
+    data: bytes
+        Output to append.
+    subrun: int
+        Subrun whose processing produced the output, the first one if several.
+    job_id: str
+        ID of the job producing the output.
+    stream: str
+        Either 'out' or 'err'.
+    n_subruns: int
+        Number of subruns processed by the job producing the output.
+    """
+    with open(job_log, "ab") as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            offset = file.seek(0, os.SEEK_END)
+            file.write(data)
+            file.flush()
+            chunk = LogChunk(subrun, str(job_id), stream, offset, len(data), n_subruns)
+            with open(job_log_index_file(job_log), "a") as index:
+                index.write(f"{subrun},{job_id},{stream},{offset},{len(data)},{n_subruns}\n")
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+    return chunk
+
+
+def read_job_log_index(job_log: Path) -> List[LogChunk]:
+    """Chunks of a log container in the order they were appended."""
+    index = job_log_index_file(job_log)
+    if not index.exists():
+        return []
+
+    chunks = []
+    with open(index) as file:
+        for line in file:
+            # Indexes written before the number of subruns was recorded have 5 columns
+            subrun, job_id, stream, offset, length, *extra = line.strip().split(",")
+            n_subruns = int(extra[0]) if extra else 1
+            chunks.append(
+                LogChunk(int(subrun), job_id, stream, int(offset), int(length), n_subruns)
+            )
+
+    return chunks
+
+
+def extract_job_log(
+    job_log: Path, subrun: int, stream: Optional[str] = None, job_id: Optional[str] = None
+) -> bytes:
+    """
+    Extract the output of a subrun from the log container. If the subrun was
+    processed by a task packing several subruns, that of the whole task.
+
+    Parameters
+    ----------
+    job_log: Path
+        Log container of the run.
+    subrun: int
+        Subrun to extract.
+    stream: str, optional
+        Either 'out' or 'err', both streams as they were appended by default.
+    job_id: str, optional
+        Only the output of this job, that of every job processing the subrun
+        (e.g. after a resubmission) by default.
+    """
+    content = []
+    with open(job_log, "rb") as file:
+        for chunk in read_job_log_index(job_log):
+            if (
+                not chunk.covers(subrun)
+                or (stream is not None and chunk.stream != stream)
+                or (job_id is not None and chunk.job_id != str(job_id))
+            ):
+                continue
+            file.seek(chunk.offset)
+            content.append(file.read(chunk.length))
+
+    return b"".join(content)
+
+
+class JobLogWriter:
+    """Buffer the output of a stream and append it to the log container in chunks."""
+
+    def __init__(
+        self,
+        job_log: Path,
+        subrun: int,
+        job_id: str,
+        stream: str,
+        n_subruns: int = 1,
+        chunk_size: int = CHUNK_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+    ):
+        self.job_log = Path(job_log)
+        self.subrun = subrun
+        self.job_id = job_id
+        self.stream = stream
+        self.n_subruns = n_subruns
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self._buffer = bytearray()
+        self._last_flush = time.monotonic()
+
+    def write(self, data: bytes) -> None:
+        self._buffer.extend(data)
+        if (
+            len(self._buffer) >= self.chunk_size
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        if self._buffer:
+            append_job_log(
+                self.job_log,
+                bytes(self._buffer),
+                self.subrun,
+                self.job_id,
+                self.stream,
+                self.n_subruns,
+            )
+            self._buffer.clear()
+        self._last_flush = time.monotonic()
+
+    def capture(self, source: IO[bytes]) -> None:
+        """Copy the output read from a pipe until it is closed."""
+        for line in iter(source.readline, b""):
+            self.write(line)
+        self.flush()
+
+
+def run_logged(
+    args: list, job_log: Path, subrun: int, job_id: Optional[str] = None, n_subruns: int = 1
+) -> sp.CompletedProcess:
+    """
+    Run a command streaming its stdout and stderr into the log container.
+
+    A SIGTERM received while the command runs (e.g. when the job reaches its
+    time limit) is forwarded to it, so that its output is flushed before exiting.
+
+    Parameters
+    ----------
+    args: list
+        Command to run.
+    job_log: Path
+        Log container of the run.
+    subrun: int
+        Subrun processed by the command, the first one if it processes several.
+    job_id: str, optional
+        By default, the ID of the SLURM array job or job.
+    n_subruns: int
+        Number of subruns processed by the command.
+
+    Returns
+    -------
+    sp.CompletedProcess
+        Completed process with the return code of the command.
+    """
+    if job_id is None:
+        job_id = os.getenv("SLURM_ARRAY_JOB_ID") or os.getenv("SLURM_JOB_ID") or "0"
+
+    Path(job_log).parent.mkdir(parents=True, exist_ok=True)
+    process = sp.Popen(args, stdout=sp.PIPE, stderr=sp.PIPE)
+    previous_handler = signal.signal(signal.SIGTERM, lambda *_: process.terminate())
+    try:
+        threads = [
+            threading.Thread(
+                target=JobLogWriter(job_log, subrun, job_id, stream, n_subruns).capture,
+                args=(pipe,),
+            )
+            for stream, pipe in (("out", process.stdout), ("err", process.stderr))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        process.wait()
+    finally:
+        signal.signal(signal.SIGTERM, previous_handler)
+
+    return sp.CompletedProcess(args, process.returncode)
+
+
+def compact_job_logs(log_dir: Path) -> int:
+    """
+    Pack the log files written by each array task (e.g. Run01807.0012_jobid_1234.out)
+    into the log container of their run, removing them afterwards. The logs of
+    the tasks processing several subruns are indexed under all of them.
+
+    Returns
+    -------
+    int
+        Number of log files packed.
+    """
+    task_logs = defaultdict(list)
+    with os.scandir(log_dir) as entries:
+        for entry in entries:
+            match = TASK_LOG_RE.match(entry.name)
+            if match is not None and entry.is_file():
+                if match["task"] is None:
+                    subrun, n_subruns = int(match["subrun"]), 1
+                else:
+                    n_subruns = int(match["packing"])
+                    subrun = int(match["task"]) * n_subruns
+                key = (subrun, int(match["job_id"]), match["stream"], n_subruns)
+                task_logs[int(match["run"])].append((key, Path(entry.path)))
+
+    n_files = 0
+    for run, files in task_logs.items():
+        job_log = job_log_file(log_dir, run)
+        for (subrun, job_id, stream, n_subruns), file in sorted(files):
+            data = file.read_bytes()
+            if data:
+                append_job_log(job_log, data, subrun, str(job_id), stream, n_subruns)
+            file.unlink()
+            n_files += 1
+
+    if n_files:
+        log.info(f"{n_files} job log files packed into {len(task_logs)} run log containers")
+
+    return n_files
+
+
+if __name__ == "__main__":
+    # Used by the shell pilot scripts: python -m osa.joblogs JOB_LOG SUBRUN[:N_SUBRUNS] COMMAND...
+    first_subrun, _, n_subruns = sys.argv[2].partition(":")
+    sys.exit(
+        run_logged(
+            sys.argv[3:], Path(sys.argv[1]), int(first_subrun), n_subruns=int(n_subruns or 1)
+        ).returncode
+    )
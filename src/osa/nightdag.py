@@ -0,0 +1,348 @@
+"""
+Dependency graph of the post-processing jobs of a night.
+
+Instead of waiting for the closer at the end of the night, the jobs merging
+the products of each run can be submitted by the sequencer together with the
+data sequences, so that they start as soon as the jobs they depend on finish:
+
+- the output files of each run are moved to their final directories once the
+  array job of the run is completed. The run-wise merging of the DL1b, muon,
+  DL2 and DL1 datacheck files depends on it, while the provenance extraction
+  only depends on the array job.
+- the daily longterm DL1 datacheck depends on the datacheck merging of every
+  run, and the Cherenkov transparency on the longterm datacheck.
+
+With SPECULATIVE_EXECUTION, a straggling array task is cancelled once its
+speculative execution completes, so the array job does not complete. The job
+moving the files of the run then waits for the array job to finish whatever
+its state (afterany) and fails unless all its tasks completed or were
+superseded, and the provenance extraction depends on it.
+
+Each job is launched by a small pilot script, which works with any of the
+schedulers in `osa.scheduler`. The job IDs are recorded in the submission
+manifest of the night, so that the closer does not launch them again. Jobs
+which failed, were cancelled or are unknown to the scheduler are submitted
+again by a later execution of the sequencer with --force-submit, and their
+runs are merged by the closer as usual.
+"""
+
+import logging
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from string import Template
+from typing import Dict, List, Optional
+
+from osa.configs import options
+from osa.configs.config import cfg
+from osa.job import (
+    TAB,
+    TERMINAL_JOB_STATES,
+    get_job_states,
+    get_sacct_snapshot,
+    invalidate_sacct_snapshot,
+    read_submission_manifest,
+    record_submission,
+    submission_manifest_file,
+    summarize_job_states,
+    write_job_script,
+)
+from osa.priority import night_priority, priority_options, sort_by_priority
+from osa.scheduler import get_scheduler
+from osa.utils.logging import myLogger
+from osa.utils.utils import date_to_iso, stringify
+
+__all__ = [
+    "DagJob",
+    "night_dag",
+    "dag_job_template",
+    "submit_night_dag",
+    "night_dag_jobs",
+    "dag_job_states",
+    "dag_job_failed",
+    "missing_dag_jobs",
+]
+
+log = myLogger(logging.getLogger(__name__))
+
+DAG_JOB_TYPE = "POSTPROCESS"
+
+DAG_SCRIPT_TEMPLATE = Template(
+    "#!/bin/env python\n"
+    "\n"
+    "$header\n"
+    "\n"
+    "import subprocess\n"
+    "import sys\n"
+    "\n"
+    "proc = subprocess.run([\n"
+    "$arguments"
+    "])\n"
+    "\n"
+    "sys.exit(proc.returncode)\n"
+)
+
+
+@dataclass
+class DagJob:
+    """
+    Post-processing job of the night dependency graph.
+
+    The job name, type and script attributes follow those of the
+    sequences, so that the job can be recorded in the submission manifest.
+    """
+
+    jobname: str
+    command: List[str]
+    parents: List[str] = field(default_factory=list)
+    run: Optional[int] = None
+    type: str = DAG_JOB_TYPE
+    sbatch_options: List[str] = field(default_factory=list)
+
+    @property
+    def script(self) -> Path:
+        return Path(options.directory) / f"dag_{self.jobname}.py"
+
+
+def night_dag(sequence_list) -> List[DagJob]:
+    """
+    Build the post-processing jobs of the night, sorted so that
+    every job comes after the jobs it depends on.
+
+    The parents of the jobs are given by their job names, that of the
+    data sequences (e.g. LST1_01807) or of other jobs of the graph. The jobs
+    of the runs of the most urgent sources come first and are niced the least.
+    """
+    # Avoid a circular import, the closer builds the commands of the jobs
+    from osa.scripts.closer import (
+        extract_provenance_cmd,
+        longterm_check_cmd,
+        merge_dl1_datacheck_cmd,
+        merge_files_cmd,
+        merge_muon_files_cmd,
+        transparency_update_cmd,
+    )
+
+    dag = []
+    datacheck_jobs = []
+    merge_datacheck = cfg.getboolean("lstchain", "merge_dl1_datacheck")
+    speculative = cfg.getboolean("SLURM", "SPECULATIVE_EXECUTION", fallback=False)
+    max_priority = night_priority(sequence_list)
+
+    for sequence in sort_by_priority(sequence_list):
+        if sequence.type != "DATA":
+            continue
+
+        run_jobs_start = len(dag)
+        run = f"{sequence.run:05d}"
+        closer_cmd = [
+            "closer",
+            "-c",
+            str(Path(options.configfile).resolve()),
+            f"--date={date_to_iso(options.date)}",
+            "--yes",
+            "--files-only",
+            f"--seq={run}",
+        ]
+        if options.no_dl2:
+            closer_cmd.append("--no-dl2")
+        closer_cmd.append(options.tel_id)
+
+        register = DagJob(f"closer_{run}", closer_cmd, [sequence.jobname], sequence.run)
+        dag.append(register)
+        dag.append(
+            DagJob(
+                f"provprocess_{run}",
+                extract_provenance_cmd(sequence),
+                [register.jobname if speculative else sequence.jobname],
+                sequence.run,
+            )
+        )
+        dag.append(
+            DagJob(
+                f"merge_dl1_{run}",
+                merge_files_cmd(sequence, data_level="DL1AB"),
+                [register.jobname],
+                sequence.run,
+            )
+        )
+        dag.append(
+            DagJob(
+                f"merge_muon_{run}",
+                merge_muon_files_cmd(sequence),
+                [register.jobname],
+                sequence.run,
+            )
+        )
+        if not options.no_dl2:
+            dag.append(
+                DagJob(
+                    f"merge_dl2_{run}",
+                    merge_files_cmd(sequence, data_level="DL2"),
+                    [register.jobname],
+                    sequence.run,
+                )
+            )
+        if merge_datacheck:
+            datacheck = DagJob(
+                f"merge_dl1_datacheck_{run}",
+                merge_dl1_datacheck_cmd(sequence),
+                [register.jobname],
+                sequence.run,
+            )
+            dag.append(datacheck)
+            datacheck_jobs.append(datacheck.jobname)
+
+        for job in dag[run_jobs_start:]:
+            job.sbatch_options = priority_options(sequence.priority, max_priority)
+
+    if datacheck_jobs:
+        longterm = DagJob("longterm_daily", longterm_check_cmd(), datacheck_jobs)
+        dag.append(longterm)
+        dag.append(
+            DagJob("cherenkov_transparency", transparency_update_cmd(), [longterm.jobname])
+        )
+
+    return dag
+
+
+def dag_job_template(job: DagJob) -> str:
+    """Write the pilot script of a job of the graph and return its content."""
+    # Name the job after its program, as the jobs launched by the closer
+    jobname = job.command[0] if job.run is None else f"{job.command[0]}_{job.run:05d}"
+    sbatch_parameters = [
+        f"--job-name={jobname}",
+        f"--chdir={options.directory}",
+        f"--output=log/{job.jobname}_%j.log",
+        f"--account={cfg.get('SLURM', 'ACCOUNT')}",
+        *job.sbatch_options,
+    ]
+    arguments = "".join(f"{TAB}{str(arg)!r},\n" for arg in job.command)
+
+    content = DAG_SCRIPT_TEMPLATE.substitute(
+        header="\n".join("#SBATCH " + line for line in sbatch_parameters),
+        arguments=arguments,
+    )
+
+    if not options.simulate:
+        write_job_script(job.script, content)
+
+    return content
+
+
+def submit_night_dag(sequence_list) -> Dict[str, str]:
+    """
+    Submit the post-processing jobs of the night. Each job depends (afterok)
+    on its parents and is cancelled if any of them fails. The jobs whose
+    parents were not submitted are skipped. With SPECULATIVE_EXECUTION, the
+    jobs depending on the array jobs only wait for them to finish (afterany).
+
+    The jobs already submitted are only submitted again if they failed, were
+    cancelled or are unknown to the scheduler. Their children do not depend
+    on the parents which already completed.
+
+    Parameters
+    ----------
+    sequence_list: list
+        Sequences of the night, already submitted.
+
+    Returns
+    -------
+    job_ids: dict
+        Job IDs of the submitted jobs keyed by job name.
+    """
+    manifest = submission_manifest_file()
+    job_ids = {
+        jobname: record["jobid"]
+        for jobname, record in read_submission_manifest(manifest).items()
+        if record.get("type") != DAG_JOB_TYPE
+    }
+    completed = set()
+    if not options.simulate and not options.test:
+        dag_jobs = night_dag_jobs()
+        for jobname, state in dag_job_states(dag_jobs).items():
+            if not dag_job_failed(state):
+                job_ids[jobname] = dag_jobs[jobname]
+            if state == "COMPLETED":
+                completed.add(jobname)
+
+    retries = cfg.getint("SLURM", "SUBMIT_RETRIES", fallback=3)
+    speculative = cfg.getboolean("SLURM", "SPECULATIVE_EXECUTION", fallback=False)
+    sequence_jobs = {sequence.jobname for sequence in sequence_list}
+    submitted = {}
+
+    for job in night_dag(sequence_list):
+        if job.jobname in job_ids:
+            log.debug(f"{job.jobname} already submitted, skipping it")
+            continue
+
+        dag_job_template(job)
+        commandargs = ["sbatch", "--parsable", "--kill-on-invalid-dep=yes"]
+
+        if options.simulate or options.test:
+            log.debug(f"SIMULATE Launching {stringify(commandargs + [str(job.script)])}")
+            continue
+
+        if any(parent not in job_ids for parent in job.parents):
+            log.warning(f"Parent jobs of {job.jobname} were not submitted, skipping it")
+            continue
+
+        # The superseded tasks of an array are cancelled, the job checks them itself
+        after = "afterany" if speculative and set(job.parents) <= sequence_jobs else "afterok"
+        parent_ids = [job_ids[parent] for parent in job.parents if parent not in completed]
+        dependency = f"{after}:" + ":".join(parent_ids) if parent_ids else None
+        if dependency is not None:
+            commandargs.append(f"--dependency={dependency}")
+        commandargs.append(str(job.script))
+        token = f"osa:{job.jobname}:{uuid.uuid4().hex[:12]}"
+        job_id = get_scheduler().submit(commandargs, token, retries=retries)
+
+        if job_id is not None:
+            record_submission(manifest, job, job_id, dependency=dependency)
+            job_ids[job.jobname] = submitted[job.jobname] = job_id
+
+    if submitted:
+        log.info(f"{len(submitted)} post-processing jobs of the night submitted")
+        invalidate_sacct_snapshot()
+
+    return submitted
+
+
+def night_dag_jobs() -> Dict[str, str]:
+    """Job IDs of the post-processing jobs submitted for the night, keyed by job name."""
+    return {
+        jobname: record["jobid"]
+        for jobname, record in read_submission_manifest(submission_manifest_file()).items()
+        if record.get("type") == DAG_JOB_TYPE
+    }
+
+
+def dag_job_states(dag_jobs: Dict[str, str]) -> Dict[str, Optional[str]]:
+    """
+    State of the submitted post-processing jobs keyed by job name,
+    None for the jobs unknown to the scheduler.
+    """
+    if not dag_jobs:
+        return {}
+
+    states = summarize_job_states(get_sacct_snapshot(parser=get_job_states))
+    return {jobname: states.get(str(job_id)) for jobname, job_id in dag_jobs.items()}
+
+
+def dag_job_failed(state: Optional[str]) -> bool:
+    """Whether a post-processing job failed, was cancelled or is unknown to the scheduler."""
+    return state is None or (state in TERMINAL_JOB_STATES and state != "COMPLETED")
+
+
+def missing_dag_jobs(sequence_list) -> List[DagJob]:
+    """
+    Post-processing jobs of the night which were not submitted,
+    or whose job failed, was cancelled or is unknown to the scheduler.
+    """
+    dag_jobs = night_dag_jobs()
+    states = dag_job_states(dag_jobs)
+    return [
+        job
+        for job in night_dag(sequence_list)
+        if job.jobname not in dag_jobs or dag_job_failed(states[job.jobname])
+    ]
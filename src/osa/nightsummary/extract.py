@@ -24,6 +24,7 @@ from osa.job import sequence_filenames
 from osa.nightsummary import database
 from osa.nightsummary.nightsummary import run_summary_table
 from osa.paths import sequence_calibration_files, get_run_date
+from osa.priority import source_priority
 from osa.utils.logging import myLogger
 from osa.utils.utils import date_to_iso, date_to_dir
 
@@ -199,6 +200,10 @@ def extract_runs(summary_table):
         # Save table to disk
         run_table.write(source_catalog_file, overwrite=True, delimiter=",")
 
+    # Priority of the runs given by the source observed
+    for run in run_list:
+        run.priority = source_priority(run.source_name)
+
     log.debug("Subrun list extracted")
 
     return run_list
@@ -1,20 +1,36 @@
 """Handle the creation and reading of the run summary files."""
 
+import json
 import logging
+import os
 import subprocess
 from pathlib import Path
+from typing import Optional
 
+import numpy as np
 from astropy.table import Table
 
 from osa.configs.config import cfg
 from osa.utils.logging import myLogger
 from osa.utils.utils import date_to_dir, stringify
 
-__all__ = ["produce_run_summary_file", "get_run_summary_file", "run_summary_table"]
+__all__ = [
+    "produce_run_summary_file",
+    "get_run_summary_file",
+    "run_summary_table",
+    "read_run_summary",
+    "run_summary_sidecar",
+]
 
 
 log = myLogger(logging.getLogger(__name__))
 
+# Run summary tables already read, with the modification time of their file
+_RUN_SUMMARY_TABLES = {}
+
+# Version of the binary sidecar files, those of other versions are ignored
+SIDECAR_VERSION = 1
+
 
 def produce_run_summary_file(date) -> None:
     """
@@ -74,11 +90,97 @@ def run_summary_table(date) -> Table:
         log.info(f"Run summary file {night_summary_file} not found. Producing it.")
         produce_run_summary_file(date)
 
-    table = Table.read(night_summary_file)
-    table.add_index(["run_id"])
+    # The table is only read again if the file changed since it was last read
+    stat = night_summary_file.stat()
+    cached = _RUN_SUMMARY_TABLES.get(night_summary_file)
+    if cached is None or cached[0] != stat.st_mtime_ns:
+        table = read_run_summary(night_summary_file, stat)
+        table.add_index(["run_id"])
+        cached = (stat.st_mtime_ns, table)
+        _RUN_SUMMARY_TABLES[night_summary_file] = cached
+
+    return cached[1].copy()
+
+
+def run_summary_sidecar(summary_file: Path) -> Path:
+    """
+    Binary copy of a run summary file, e.g. .RunSummary_20200117.bin. It is
+    kept in the RUN_SUMMARY_SIDECAR_DIR directory of the CACHE section, or
+    next to the run summary if not set.
+    """
+    directory = cfg.get("CACHE", "RUN_SUMMARY_SIDECAR_DIR", fallback=None)
+    name = f".{summary_file.stem}.bin"
+    return Path(directory) / name if directory else summary_file.with_name(name)
+
+
+def read_run_summary(summary_file: Path, stat: os.stat_result) -> Table:
+    """
+    Read a run summary file. Unless the RUN_SUMMARY_SIDECAR option of the CACHE
+    section is disabled, the table is read from its binary sidecar, an order of
+    magnitude faster to load than the ECSV file, as long as it was written
+    from the current version of the file. Otherwise, the sidecar is written again.
+    """
+    if not cfg.getboolean("CACHE", "RUN_SUMMARY_SIDECAR", fallback=True):
+        return Table.read(summary_file)
+
+    sidecar = run_summary_sidecar(summary_file)
+    source = [stat.st_mtime_ns, stat.st_size]
+    table = _read_sidecar(sidecar, source)
+    if table is None:
+        table = Table.read(summary_file)
+        _write_sidecar(sidecar, table, source)
+
     return table
 
 
+def _read_sidecar(sidecar: Path, source: list) -> Optional[Table]:
+    """
+    Table in a sidecar file, None if missing, invalid or outdated. The
+    sidecar holds a JSON header line followed by the rows of the table.
+    """
+    try:
+        with open(sidecar, "rb") as file:
+            content = file.read()
+        header, _, rows = content.partition(b"\n")
+        header = json.loads(header)
+        if header["version"] != SIDECAR_VERSION or header["source"] != source:
+            return None
+        dtype = np.lib.format.descr_to_dtype([tuple(field) for field in header["dtype"]])
+        return Table(np.frombuffer(rows, dtype=dtype), meta=header["meta"])
+    except FileNotFoundError:
+        return None
+    except (OSError, KeyError, TypeError, ValueError) as error:
+        log.debug(f"Ignoring run summary sidecar {sidecar}: {error}")
+        return None
+
+
+def _write_sidecar(sidecar: Path, table: Table, source: list) -> None:
+    """
+    Write the binary sidecar of a run summary. Tables with missing values
+    are not cached, nor are those of directories which are not writable.
+    """
+    if table.has_masked_values:
+        return
+
+    rows = table.as_array()
+    header = {
+        "version": SIDECAR_VERSION,
+        "source": source,
+        "dtype": np.lib.format.dtype_to_descr(rows.dtype),
+        "meta": dict(table.meta),
+    }
+    tmp_file = sidecar.with_name(f"{sidecar.name}.{os.getpid()}.tmp")
+    try:
+        sidecar.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_file, "wb") as file:
+            file.write(json.dumps(header, default=str).encode() + b"\n")
+            file.write(rows.tobytes())
+        os.replace(tmp_file, sidecar)
+    except OSError as error:
+        log.debug(f"Could not write the run summary sidecar {sidecar}: {error}")
+        tmp_file.unlink(missing_ok=True)
+
+
 def get_run_summary_file(date) -> Path:
     """
     Builds the file name of the run summary ECSV file.
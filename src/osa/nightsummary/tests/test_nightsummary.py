@@ -29,3 +29,57 @@ def test_produce_run_summary_file():
     produce_run_summary_file(date)
     summary_file = Path(cfg.get("LST1", "RUN_SUMMARY_DIR")) / "RunSummary_20200101.ecsv"
     assert summary_file.exists()
+
+
+def test_run_summary_sidecar(monkeypatch, tmp_path):
+    from astropy.table import Table
+
+    from osa.nightsummary import nightsummary
+    from osa.nightsummary.nightsummary import run_summary_sidecar, run_summary_table
+
+    monkeypatch.setitem(cfg["LST1"], "RUN_SUMMARY_DIR", str(tmp_path))
+    monkeypatch.setitem(cfg["CACHE"], "RUN_SUMMARY_SIDECAR", "True")
+    monkeypatch.setattr(nightsummary, "_RUN_SUMMARY_TABLES", {})
+    date = datetime.fromisoformat("2020-01-17")
+    summary_file = tmp_path / "RunSummary_20200117.ecsv"
+    table = Table(
+        {"run_id": [1807, 1808], "n_subruns": [11, 9], "run_type": ["DATA", "DATA"]},
+        meta={"date": "2020-01-17"},
+    )
+    table.write(summary_file)
+
+    summary = run_summary_table(date)
+    assert run_summary_sidecar(summary_file).exists()
+
+    # Once written, the sidecar is read instead of the ECSV file
+    def read_ecsv(*args, **kwargs):
+        raise AssertionError("ECSV file read")
+
+    monkeypatch.setattr(nightsummary, "_RUN_SUMMARY_TABLES", {})
+    with monkeypatch.context() as m:
+        m.setattr(nightsummary.Table, "read", read_ecsv)
+        cached = run_summary_table(date)
+
+    assert cached.dtype == summary.dtype
+    assert cached.meta == {"date": "2020-01-17"}
+    assert cached.loc[1808]["n_subruns"] == 9
+    assert list(cached["run_type"]) == ["DATA", "DATA"]
+
+    # The sidecar is written again when the run summary changes
+    table.add_row([1809, 5, "PEDCALIB"])
+    table.write(summary_file, overwrite=True)
+    monkeypatch.setattr(nightsummary, "_RUN_SUMMARY_TABLES", {})
+    assert list(run_summary_table(date)["run_id"]) == [1807, 1808, 1809]
+    monkeypatch.setattr(nightsummary, "_RUN_SUMMARY_TABLES", {})
+    with monkeypatch.context() as m:
+        m.setattr(nightsummary.Table, "read", read_ecsv)
+        assert len(run_summary_table(date)) == 3
+
+    # Enabled by default, optionally in a separate cache directory
+    cache_dir = tmp_path / "cache"
+    monkeypatch.delitem(cfg["CACHE"], "RUN_SUMMARY_SIDECAR")
+    monkeypatch.setitem(cfg["CACHE"], "RUN_SUMMARY_SIDECAR_DIR", str(cache_dir))
+    monkeypatch.setattr(nightsummary, "_RUN_SUMMARY_TABLES", {})
+    run_summary_table(date)
+    assert run_summary_sidecar(summary_file) == cache_dir / ".RunSummary_20200117.bin"
+    assert run_summary_sidecar(summary_file).exists()
@@ -0,0 +1,191 @@
+"""
+Persistent numba cache shared by the jobs of the sequences.
+
+By default, each job compiles the numba functions of lstchain in a private
+temporary cache. If the NUMBA_CACHE_DIR option of the CACHE section is set,
+the jobs share instead a cache kept in a subdirectory of it per software
+version (Python, numba and lstchain) and CPU features of the node, since
+the compiled code depends on both:
+
+    NUMBA_CACHE_DIR/py3.11-numba0.60.0-lstchain0.10.7/<CPU features hash>
+
+The cache is populated by a single job at a time, the one holding the lock of
+the cache directory, while the jobs running concurrently compile in a private
+cache as before. Once a job using it succeeds (or the `numba_cache` warm-up
+command is run), the cache is marked as populated and every job uses it.
+Numba writes the cache files atomically, so later additions to a populated
+cache (e.g. new function signatures) are safe.
+"""
+
+import fcntl
+import hashlib
+import logging
+import os
+import re
+import shutil
+import subprocess as sp
+import sys
+import tempfile
+from contextlib import contextmanager
+from importlib import metadata
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from osa.configs.config import cfg
+from osa.utils.logging import myLogger
+
+__all__ = [
+    "software_key",
+    "cpu_key",
+    "shared_numba_cache",
+    "numba_cache",
+    "is_populated",
+    "mark_populated",
+    "warm_up",
+    "prune_numba_cache",
+]
+
+log = myLogger(logging.getLogger(__name__))
+
+LOCK_FILE = ".lock"
+POPULATED_MARKER = ".populated"
+
+# Line of /proc/cpuinfo listing the CPU features (x86 and ARM respectively)
+CPU_FEATURES_RE = re.compile(rb"^(flags|Features)")
+
+
+def software_key() -> str:
+    """Versions of Python, numba and lstchain, which invalidate the cached code."""
+    versions = [f"py{sys.version_info.major}.{sys.version_info.minor}"]
+    for package in ("numba", "lstchain"):
+        try:
+            versions.append(f"{package}{metadata.version(package)}")
+        except metadata.PackageNotFoundError:
+            versions.append(f"{package}none")
+
+    return "-".join(versions)
+
+
+def cpu_key() -> str:
+    """
+    Hash of the CPU features of the node, the same as that computed
+    by the shell pilot scripts with
+    grep -m1 -E '^(flags|Features)' /proc/cpuinfo | md5sum | cut -c1-12
+    """
+    line = b""
+    try:
+        with open("/proc/cpuinfo", "rb") as file:
+            line = next((line for line in file if CPU_FEATURES_RE.match(line)), b"")
+    except OSError:
+        pass
+
+    return hashlib.md5(line).hexdigest()[:12]
+
+
+def shared_numba_cache() -> Optional[Path]:
+    """
+    Directory of the numba cache shared by the jobs running this software
+    version, without the CPU features subdirectory. None if not enabled.
+    """
+    root = cfg.get("CACHE", "NUMBA_CACHE_DIR", fallback=None)
+    if not root:
+        return None
+
+    return Path(root) / software_key()
+
+
+def is_populated(cache_dir: Path) -> bool:
+    """Whether a job or the warm-up command already populated the cache."""
+    return (Path(cache_dir) / POPULATED_MARKER).exists()
+
+
+def mark_populated(cache_dir: Optional[str]) -> None:
+    """
+    Mark a shared cache as populated, e.g. by a job which succeeded with
+    it. Private temporary caches, which have no lock file, are ignored.
+    """
+    if cache_dir and (Path(cache_dir) / LOCK_FILE).exists():
+        (Path(cache_dir) / POPULATED_MARKER).touch()
+
+
+@contextmanager
+def numba_cache(directory: str) -> Iterator[str]:
+    """
+    Numba cache directory of a job. The shared cache of the node is used
+    if it is already populated or no other job is populating it, otherwise
+    a private temporary cache, removed afterwards, is given.
+
+    Parameters
+    ----------
+    directory: str
+        Shared cache of the software version (see `shared_numba_cache`).
+    """
+    cache_dir = Path(directory) / cpu_key()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    # The lock is kept while the job populates the cache
+    with open(cache_dir / LOCK_FILE, "a") as lock:
+        shared = is_populated(cache_dir)
+        if not shared:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                shared = True
+            except BlockingIOError:
+                log.debug(f"Numba cache {cache_dir} being populated, using a private one")
+
+        if shared:
+            yield str(cache_dir)
+            return
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        yield tmpdirname
+
+
+def warm_up(command: List[str], directory: Path) -> int:
+    """
+    Run a command (e.g. the analysis of a subrun) with the shared cache of
+    the node, waiting for the job populating it, if any. The cache is marked
+    as populated if the command succeeds.
+
+    Returns
+    -------
+    rc: int
+        Return code of the command.
+    """
+    cache_dir = Path(directory) / cpu_key()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    with open(cache_dir / LOCK_FILE, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        log.info(f"Populating the numba cache {cache_dir}")
+        rc = sp.run(command, env={**os.environ, "NUMBA_CACHE_DIR": str(cache_dir)}).returncode
+
+    if rc == 0:
+        mark_populated(str(cache_dir))
+    else:
+        log.warning(f"Warm-up command failed with return code {rc}")
+
+    return rc
+
+
+def prune_numba_cache(directory: Path) -> List[Path]:
+    """
+    Remove the caches of the software versions other than that of the given
+    shared cache, which can not be used anymore.
+
+    Returns
+    -------
+    removed: list
+        Cache directories removed.
+    """
+    directory = Path(directory)
+    if not directory.parent.is_dir():
+        return []
+
+    removed = []
+    for path in directory.parent.iterdir():
+        if path.is_dir() and path.name != directory.name:
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path)
+
+    return removed
@@ -5,8 +5,6 @@ import re
 from datetime import datetime
 from pathlib import Path
 from typing import List
-import subprocess
-import time
 
 import lstchain
 from astropy.table import Table
@@ -23,11 +21,17 @@ from osa.utils.logging import myLogger
 
 log = myLogger(logging.getLogger(__name__))
 
+PEDESTAL_IDS_RE = re.compile(r"^pedestal_ids_Run(?P<run>\d+)\..*\.h5$")
+
+# Merged run summary table, with the modification time of its file
+_MERGED_SUMMARY = {}
+
 __all__ = [
     "get_calibration_filename",
     "get_drs4_pedestal_filename",
     "pedestal_ids_file_exists",
     "get_run_date",
+    "merged_run_summary_table",
     "drs4_pedestal_exists",
     "calibration_file_exists",
     "sequence_calibration_files",
@@ -37,6 +41,7 @@ __all__ = [
     "get_drive_file",
     "get_summary_file",
     "get_pedestal_ids_file",
+    "get_pedestal_ids_runs",
     "DATACHECK_WEB_BASEDIR",
     "DEFAULT_CFG",
     "create_source_directories",
@@ -72,14 +77,28 @@ def analysis_path(tel) -> Path:
     return directory
 
 
+def merged_run_summary_table() -> Table:
+    """
+    Read the merged run summaries file. It is only read again if the file
+    changed, since it is looked up for every calibration run of every night.
+    """
+    merged_run_summaries_file = Path(cfg.get("LST1", "MERGED_SUMMARY"))
+    mtime = merged_run_summaries_file.stat().st_mtime_ns
+    cached = _MERGED_SUMMARY.get(merged_run_summaries_file)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, Table.read(merged_run_summaries_file))
+        _MERGED_SUMMARY[merged_run_summaries_file] = cached
+
+    return cached[1]
+
+
 def get_run_date(run_id: int) -> datetime:
     """
     Return the date (YYYYMMDD) when the given run was taken. The search for this date
     is done by looking at the date corresponding to each run in the merged run summaries
     file.
     """
-    merged_run_summaries_file = cfg.get("LST1", "MERGED_SUMMARY")
-    summary_table = Table.read(merged_run_summaries_file)
+    summary_table = merged_run_summary_table()
 
     try:
         date_string = summary_table[summary_table["run_id"] == run_id]["date"][0]
@@ -163,6 +182,17 @@ def pedestal_ids_file_exists(run_id: int) -> bool:
     return bool(file_list)
 
 
+def get_pedestal_ids_runs() -> set:
+    """Return the runs having files with pedestal interleaved event identification."""
+    pedestal_ids_dir = Path(cfg.get("LST1", "PEDESTAL_FINDER_DIR"))
+    runs = set()
+    for file in pedestal_ids_dir.rglob("pedestal_ids_Run*.*.h5"):
+        match = PEDESTAL_IDS_RE.match(file.name)
+        if match:
+            runs.add(int(match["run"]))
+    return runs
+
+
 def drs4_pedestal_exists(run_id: int, prod_id: str) -> bool:
     """Return true if drs4 pedestal file was already produced."""
     files = search_drs4_files(run_id, prod_id)
@@ -363,22 +393,19 @@ def get_latest_version_file(longterm_files: List[str]) -> Path:
 
 def is_job_completed(job_id: str):
     """
-    Check whether SLURM job `job_id` has finished.
-    
-    It keeps checking every 10 minutes for one our.
+    Check whether SLURM job `job_id` has finished successfully.
+
+    It waits for the job to reach a final state for JOB_WAIT_TIMEOUT seconds at most.
     """
-    n_max = 10
-    n = 0
-    while n < n_max:
-        # Check if the status of the SLURM job is "COMPLETED"
-        status = subprocess.run(["sacct", "--format=state", "--jobs", job_id], capture_output=True, text=True)
-        if "COMPLETED" in status.stdout:
-            log.debug(f"Job {job_id} finished successfully!")
-            return True
-        n += 1
-        log.debug(f"Job {job_id} is not completed yet, checking again in 10 minutes...")
-        time.sleep(600)  # wait 10 minutes to check again
-    log.info(f"The maximum number of checks of job {job_id} was reached, job {job_id} did not finish succesfully yet.")
+    # Imported here since osa.job depends on this module
+    from osa.job import wait_for_jobs
+
+    state = wait_for_jobs([job_id])[str(job_id)]
+    if state == "COMPLETED":
+        log.debug(f"Job {job_id} finished successfully!")
+        return True
+
+    log.info(f"Job {job_id} did not finish successfully yet (state {state}).")
     return False
 
 
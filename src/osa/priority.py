@@ -0,0 +1,96 @@
+"""
+Priority of the sequences according to the source observed in their run.
+
+The SOURCE_PRIORITY section of the config file maps source names (or
+shell-style patterns, e.g. GRB*) to an integer priority, 0 for the sources
+not listed. The sequences of the most urgent sources, e.g. transients or
+targets of opportunity, are submitted, merged and closed first, and the
+jobs of the rest of the night are given a higher nice value so that they
+do not delay them in the queue.
+"""
+
+import fnmatch
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from osa.configs.config import cfg
+from osa.utils.logging import myLogger
+
+__all__ = [
+    "source_priorities",
+    "source_priority",
+    "night_priority",
+    "sort_by_priority",
+    "priority_options",
+]
+
+log = myLogger(logging.getLogger(__name__))
+
+PRIORITY_SECTION = "SOURCE_PRIORITY"
+
+
+def source_priorities() -> Dict[str, int]:
+    """Priority of the source name patterns of the SOURCE_PRIORITY config section."""
+    if not cfg.has_section(PRIORITY_SECTION):
+        return {}
+
+    priorities = {}
+    for pattern, value in cfg.items(PRIORITY_SECTION, raw=True):
+        if pattern in cfg.defaults():
+            continue
+        try:
+            priorities[pattern.lower()] = int(value)
+        except (TypeError, ValueError):
+            log.warning(f"Priority {value} of source {pattern} is not an integer, ignoring it")
+
+    return priorities
+
+
+def source_priority(source_name: Optional[str]) -> int:
+    """
+    Priority of a source, that of the first pattern matching its name
+    (case-insensitive), 0 if it matches none or it is not known.
+    """
+    if not source_name:
+        return 0
+
+    name = str(source_name).strip().lower()
+    for pattern, priority in source_priorities().items():
+        if fnmatch.fnmatchcase(name, pattern):
+            return priority
+
+    return 0
+
+
+def night_priority(sequence_list: Iterable) -> int:
+    """Highest priority among the data sequences of the night, at least 0."""
+    return max(
+        (sequence.priority for sequence in sequence_list if sequence.type == "DATA"), default=0
+    )
+
+
+def sort_by_priority(sequence_list: Iterable) -> list:
+    """
+    Sort the data sequences by decreasing priority, keeping the run order
+    among those of equal priority. Calibration sequences are kept first.
+    """
+    return sorted(sequence_list, key=lambda seq: (seq.type == "DATA", -seq.priority))
+
+
+def priority_options(priority: int, max_priority: int) -> List[str]:
+    """
+    sbatch options of the jobs of a sequence with the given priority when the most
+    urgent one of the night has `max_priority`. The jobs are niced PRIORITY_NICE_STEP
+    per level below `max_priority`, and those of prioritized sources (priority above 0)
+    are submitted with the PRIORITY_QOS quality of service, if set.
+    """
+    sbatch_options = []
+    nice = cfg.getint("SLURM", "PRIORITY_NICE_STEP", fallback=0) * (max_priority - priority)
+    if nice > 0:
+        sbatch_options.append(f"--nice={nice}")
+
+    qos = cfg.get("SLURM", "PRIORITY_QOS", fallback=None)
+    if qos and priority > 0:
+        sbatch_options.append(f"--qos={qos}")
+
+    return sbatch_options
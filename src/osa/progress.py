@@ -0,0 +1,246 @@
+"""
+Heartbeat records of the subruns being processed.
+
+The jobs processing the subruns of a run append small records to a single
+progress file per run, in the log directory of the analysis directory:
+
+    <analysis directory>/log/Run01807.progress
+
+Each record is a JSON line with the subrun, the analysis stage being run,
+the status of the subrun (running, or done or failed once its sequence
+script finished or a stage failed), the start time of the stage, the time of
+the record, the bytes written so far by the stage and its return code. The
+analysis stages write a record when they start and finish, and a heartbeat
+every `heartbeat_interval` seconds (option of the lstchain section) while
+they run. The records are written
+with a single append, so that those of concurrent jobs are not interleaved.
+Readers (the sequencer and the webmakers) only parse the lines appended
+since their last read and keep the latest record of each subrun, which gives
+the live status of the run without querying the scheduler or listing the
+output directories.
+"""
+
+import json
+import logging
+import os
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+
+from osa.configs import options
+from osa.configs.config import cfg
+from osa.paths import analysis_path
+from osa.utils.logging import myLogger
+
+__all__ = [
+    "ProgressRecord",
+    "progress_file",
+    "heartbeat_interval",
+    "emit",
+    "bytes_written",
+    "read_progress",
+    "run_progress",
+    "progress_counts",
+    "night_progress",
+]
+
+log = myLogger(logging.getLogger(__name__))
+
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Latest records of each progress file, with the offset up to which it was read
+_PROGRESS = {}
+
+
+@dataclass
+class ProgressRecord:
+    """Heartbeat of the analysis stage of a subrun."""
+
+    subrun: Optional[int]
+    stage: str
+    status: str
+    start: str
+    time: str
+    bytes: Optional[int] = None
+    rc: Optional[int] = None
+
+    def age(self, now: Optional[datetime] = None) -> float:
+        """Seconds since the record was written."""
+        now = now or datetime.utcnow()
+        return (now - datetime.fromisoformat(self.time)).total_seconds()
+
+
+def progress_file(run: str, directory: Optional[Path] = None) -> Path:
+    """
+    Progress file of a run.
+
+    Parameters
+    ----------
+    run: str
+        Run number, optionally with the subrun (XXXXX.XXXX).
+    directory: pathlib.Path, optional
+        Analysis directory, that of the night by default.
+    """
+    if directory is None:
+        directory = analysis_path(options.tel_id)
+
+    run_number = run.split(".")[0]
+    return Path(directory) / "log" / f"Run{run_number}.progress"
+
+
+def heartbeat_interval() -> float:
+    """Seconds between the heartbeats of a running stage, 0 if disabled."""
+    return cfg.getfloat("lstchain", "heartbeat_interval", fallback=60)
+
+
+def emit(
+    run: str,
+    stage: str,
+    status: str,
+    start: datetime,
+    bytes_written: Optional[int] = None,
+    rc: Optional[int] = None,
+    directory: Optional[Path] = None,
+) -> None:
+    """
+    Append a heartbeat record to the progress file of the run. The progress
+    is only informative, so failing to write it does not stop the analysis.
+
+    Parameters
+    ----------
+    run: str
+        XXXXX.XXXX (run_number.subrun_number), or XXXXX for calibration runs.
+    stage: str
+        Analysis stage, e.g. the lstchain command being executed.
+    status: str
+        Status of the subrun: running, done or failed.
+    start: datetime.datetime
+        Start time of the stage.
+    bytes_written: int, optional
+        Bytes written so far by the stage.
+    rc: int, optional
+        Return code of the finished stage.
+    directory: pathlib.Path, optional
+        Analysis directory, that of the night by default.
+    """
+    if options.simulate or heartbeat_interval() <= 0:
+        return
+
+    subrun = run.split(".")[1] if "." in run else None
+    record = ProgressRecord(
+        subrun=None if subrun is None else int(subrun),
+        stage=stage,
+        status=status,
+        start=start.isoformat(timespec="seconds"),
+        time=datetime.utcnow().isoformat(timespec="seconds"),
+        bytes=bytes_written,
+        rc=rc,
+    )
+    line = (json.dumps(asdict(record), separators=(",", ":")) + "\n").encode()
+
+    try:
+        path = progress_file(run, directory)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # A single write in append mode is not interleaved with those of other jobs
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o664)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+    except OSError as error:
+        log.debug(f"Could not write the progress of run {run}: {error}")
+
+
+def bytes_written(pid: int) -> Optional[int]:
+    """Bytes written so far by a process, None if not available."""
+    try:
+        with open(f"/proc/{pid}/io") as file:
+            for line in file:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+
+    return None
+
+
+def read_progress(path: Path) -> Dict[Optional[int], ProgressRecord]:
+    """
+    Latest record of each subrun in a progress file. Only the lines appended
+    since the previous read are parsed.
+
+    Returns
+    -------
+    records: dict
+        Latest record by subrun number (None for calibration runs).
+    """
+    path = Path(path)
+    offset, records = _PROGRESS.get(path, (0, {}))
+
+    try:
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size < offset:
+                # The file was replaced, read it again
+                offset, records = 0, {}
+            file.seek(offset)
+            content = file.read()
+    except FileNotFoundError:
+        _PROGRESS.pop(path, None)
+        return {}
+
+    # Leave an incomplete last line for the next read
+    complete = content.rfind(b"\n") + 1
+    for line in content[:complete].splitlines():
+        try:
+            record = ProgressRecord(**json.loads(line))
+        except (ValueError, TypeError):
+            log.debug(f"Skipping malformed progress record in {path}: {line!r}")
+            continue
+        records[record.subrun] = record
+
+    _PROGRESS[path] = (offset + complete, records)
+    return records
+
+
+def run_progress(
+    run: str, directory: Optional[Path] = None
+) -> Dict[Optional[int], ProgressRecord]:
+    """Latest record of each subrun of a run (see `read_progress`)."""
+    return read_progress(progress_file(run, directory))
+
+
+def progress_counts(
+    records: Dict[Optional[int], ProgressRecord], stale_after: Optional[float] = None
+) -> Dict[str, int]:
+    """
+    Number of subruns by status. Running subruns without a heartbeat for
+    longer than `stale_after` seconds (three heartbeat intervals by default),
+    e.g. because their job was killed, are counted as stale.
+    """
+    if stale_after is None:
+        stale_after = 3 * heartbeat_interval()
+
+    now = datetime.utcnow()
+    counts = {RUNNING: 0, DONE: 0, FAILED: 0, "stale": 0}
+    for record in records.values():
+        if record.status == RUNNING and stale_after > 0 and record.age(now) > stale_after:
+            counts["stale"] += 1
+        else:
+            counts[record.status] = counts.get(record.status, 0) + 1
+
+    return counts
+
+
+def night_progress(directory: Path) -> Dict[str, Dict[Optional[int], ProgressRecord]]:
+    """Latest records of the subruns of every run with a progress file in a night."""
+    log_directory = Path(directory) / "log"
+    if not log_directory.is_dir():
+        return {}
+
+    return {
+        path.stem[3:]: read_progress(path)
+        for path in sorted(log_directory.glob("Run*.progress"))
+    }
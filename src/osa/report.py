@@ -1,9 +1,13 @@
+import json
 import logging
+import os
+from dataclasses import asdict, dataclass
 from datetime import datetime, timezone
 from fnmatch import fnmatchcase
 from glob import glob
 from os.path import basename, getsize, join
 from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
 
 from osa.configs import config, options
 from osa.configs.config import cfg
@@ -14,7 +18,15 @@ from osa.utils.utils import date_to_iso
 
 log = myLogger(logging.getLogger(__name__))
 
-__all__ = ["history", "start", "finished_assignments"]
+__all__ = [
+    "history",
+    "start",
+    "finished_assignments",
+    "HistoryRecord",
+    "read_history",
+    "read_last_history_records",
+    "last_record_per_stage",
+]
 
 
 def start(parent_tag: str):
@@ -116,6 +128,167 @@ def finished_assignments(sequence_list):
     return dictionary
 
 
+@dataclass
+class HistoryRecord:
+    """Outcome of the execution of an analysis stage, i.e. a line of a history file."""
+
+    run: str
+    stage: str
+    prod_id: Optional[str]
+    return_code: int
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    duration: Optional[float] = None
+    input_file: Optional[str] = None
+    config_file: Optional[str] = None
+
+    def to_json(self) -> str:
+        """Serialize the record as a single JSON line."""
+        record = asdict(self)
+        for key in ("start", "end"):
+            if record[key] is not None:
+                record[key] = record[key].isoformat()
+        return json.dumps(record)
+
+    @classmethod
+    def from_line(cls, line: str) -> "HistoryRecord":
+        """
+        Parse a line of a history file. Both the JSON records and the
+        space-separated lines written by previous versions are understood.
+
+        Raises
+        ------
+        ValueError
+            If the line is malformed.
+        """
+        line = line.strip()
+        if line.startswith("{"):
+            record = json.loads(line)
+            for key in ("start", "end"):
+                if record.get(key) is not None:
+                    record[key] = datetime.fromisoformat(record[key])
+            record["return_code"] = int(record["return_code"])
+            return cls(**record)
+
+        # Legacy format: run stage prod_id date input_file config_file return_code
+        words = line.split()
+        try:
+            return_code = int(words[-1])
+            run, stage, prod_id = words[0], words[1], words[2]
+        except IndexError as err:
+            raise ValueError(f"Malformed history line: {line}") from err
+
+        try:
+            end = datetime.fromisoformat(f"{words[3]} {words[4]}")
+        except (IndexError, ValueError):
+            end = None
+
+        input_file, config_file = (words[-3], words[-2]) if len(words) >= 7 else (None, None)
+
+        return cls(
+            run=run,
+            stage=stage,
+            prod_id=None if prod_id == "None" else prod_id,
+            return_code=return_code,
+            end=end,
+            input_file=None if input_file == "None" else input_file,
+            config_file=None if config_file == "None" else config_file,
+        )
+
+
+def read_history(history_file: Path) -> List[HistoryRecord]:
+    """
+    Read all the records of a history file, skipping the malformed lines.
+
+    Parameters
+    ----------
+    history_file : pathlib.Path
+
+    Returns
+    -------
+    records : list of HistoryRecord
+    """
+    records = []
+    with open(history_file, "r") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                records.append(HistoryRecord.from_line(line))
+            except (ValueError, TypeError, KeyError) as err:
+                log.exception(f"Malformed history file {history_file}, {err}")
+
+    return records
+
+
+def reversed_lines(history_file: Path, block_size: int = 4096) -> Iterator[str]:
+    """Yield the lines of a file from the last one, reading it backwards by blocks."""
+    with open(history_file, "rb") as file:
+        position = file.seek(0, os.SEEK_END)
+        remainder = b""
+        while position > 0:
+            size = min(block_size, position)
+            position -= size
+            file.seek(position)
+            lines = (file.read(size) + remainder).split(b"\n")
+            # The first piece may be an incomplete line
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                if line.strip():
+                    yield line.decode()
+        if remainder.strip():
+            yield remainder.decode()
+
+
+def read_last_history_records(history_file: Path, n_records: int = 1) -> List[HistoryRecord]:
+    """
+    Read the last records of a history file, without scanning the whole file.
+
+    Returns
+    -------
+    records : list of HistoryRecord
+        Up to `n_records` records, in the order they were written.
+    """
+    records = []
+    for line in reversed_lines(history_file):
+        if len(records) == n_records:
+            break
+        try:
+            records.append(HistoryRecord.from_line(line))
+        except (ValueError, TypeError, KeyError) as err:
+            log.exception(f"Malformed history file {history_file}, {err}")
+
+    return records[::-1]
+
+
+def last_record_per_stage(history_file: Path, stages: Iterable[str]) -> Dict[str, HistoryRecord]:
+    """
+    Get the last record of each of the given stages, reading the history
+    file backwards only until all of them are found.
+
+    Returns
+    -------
+    records : dict
+        Last record keyed by stage, for the stages present in the file,
+        in the order they were written.
+    """
+    pending = set(stages)
+    records = {}
+    for line in reversed_lines(history_file):
+        if not pending:
+            break
+        try:
+            record = HistoryRecord.from_line(line)
+        except (ValueError, TypeError, KeyError) as err:
+            log.exception(f"Malformed history file {history_file}, {err}")
+            continue
+        if record.stage in pending:
+            records[record.stage] = record
+            pending.remove(record.stage)
+
+    return dict(reversed(records.items()))
+
+
 def history(
     run: str,
     prod_id: str,
@@ -124,9 +297,10 @@ def history(
     history_file: Path,
     input_file=None,
     config_file=None,
+    start_time: Optional[datetime] = None,
 ) -> None:
     """
-    Appends a history line to the history file. A history line
+    Appends a history record to the history file. A history record
     reports the outcome of the execution of a lstchain executable.
 
     Parameters
@@ -145,9 +319,19 @@ def history(
         If needed, input file used for the lstchain executable
     config_file : str, optional
         Input card used for the lstchain executable.
+    start_time : datetime, optional
+        UTC time at which the execution of the stage started.
     """
-    date_string = datetime.utcnow().isoformat(sep=" ", timespec="minutes")
-    string_to_write = (
-        f"{run} {stage} {prod_id} {date_string} " f"{input_file} {config_file} {return_code}\n"
+    end_time = datetime.utcnow()
+    record = HistoryRecord(
+        run=str(run),
+        stage=stage,
+        prod_id=prod_id,
+        return_code=int(return_code),
+        start=start_time,
+        end=end_time,
+        duration=(end_time - start_time).total_seconds() if start_time else None,
+        input_file=None if input_file is None else str(input_file),
+        config_file=None if config_file is None else str(config_file),
     )
-    append_to_file(history_file, string_to_write)
+    append_to_file(history_file, f"{record.to_json()}\n")
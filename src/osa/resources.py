@@ -0,0 +1,189 @@
+"""
+Model of the resources (memory, walltime and partition) needed by the jobs
+of each sequence, learned from the accounting of previous jobs, and share of
+the I/O budget of the shared filesystem among the job arrays.
+"""
+
+import logging
+import math
+from dataclasses import dataclass
+from typing import Optional
+
+import pandas as pd
+
+from osa.configs.config import cfg
+from osa.utils.logging import myLogger
+from osa.utils.utils import seconds_to_time, time_to_seconds
+
+__all__ = [
+    "SequenceResources",
+    "predict_resources",
+    "select_partitions",
+    "partition_time_limits",
+    "max_partition_time",
+    "memory_to_gb",
+    "io_budget",
+    "array_throttle",
+]
+
+log = myLogger(logging.getLogger(__name__))
+
+# Conversion factors of the sacct memory units to GB
+MEMORY_UNITS = {"": 1 / 1024**3, "K": 1 / 1024**2, "M": 1 / 1024, "G": 1, "T": 1024}
+
+
+@dataclass
+class SequenceResources:
+    """Resources requested for the jobs of a sequence."""
+
+    mem_per_cpu: str
+    time: str
+    partition: str
+    n_samples: int = 0
+
+
+def memory_to_gb(memory: pd.Series) -> pd.Series:
+    """Convert sacct memory values (e.g. 1.5G, 300M) to GB."""
+    parts = memory.astype(str).str.extract(r"^([\d.]+)([KMGT]?)$")
+    return pd.to_numeric(parts[0], errors="coerce") * parts[1].map(MEMORY_UNITS)
+
+
+def partition_time_limits() -> dict:
+    """Time limit in seconds of each partition (PARTITION_TIME_LIMITS option)."""
+    limits = {}
+    for item in (cfg.get("SLURM", "PARTITION_TIME_LIMITS", fallback=None) or "").split(","):
+        if "=" in item:
+            name, limit = item.split("=")
+            limits[name.strip()] = time_to_seconds(limit.strip())
+    return limits
+
+
+def max_partition_time(partitions: str) -> float:
+    """Longest time limit in seconds of the given partitions, infinite if any has none set."""
+    limits = partition_time_limits()
+    return max(limits.get(name.strip(), math.inf) for name in partitions.split(","))
+
+
+def select_partitions(partitions: str, time: float) -> str:
+    """
+    Keep the partitions whose time limit (PARTITION_TIME_LIMITS option)
+    allows a job lasting `time` seconds. Partitions with no limit set are kept.
+    If none is long enough, the last one is chosen.
+    """
+    limits = partition_time_limits()
+    names = [name.strip() for name in partitions.split(",")]
+    selected = [name for name in names if limits.get(name, math.inf) >= time]
+    return ", ".join(selected or names[-1:])
+
+
+def predict_resources(
+    sequence_type: str,
+    usage: pd.DataFrame,
+    run: Optional[int] = None,
+    default_time: Optional[str] = None,
+    packing: int = 1,
+) -> SequenceResources:
+    """
+    Predict the memory per CPU, walltime and partition for the jobs of a sequence.
+
+    The requests are the RESOURCE_QUANTILE of the memory and elapsed time of
+    the completed jobs of the same type, increased by a RESOURCE_MARGIN
+    safety margin. If the run already had jobs, their usage is a lower bound,
+    doubled if they ran out of memory or time. The values in the config
+    file are used while there are less than RESOURCE_MIN_SAMPLES jobs.
+    The walltime does not exceed the longest partition time limit.
+
+    The elapsed time of each job is divided by the subruns it processed
+    (subruns column of the usage, one if missing) and the walltime is that
+    of `packing` subruns.
+
+    Parameters
+    ----------
+    sequence_type: str
+        Either 'DATA' or 'PEDCALIB'.
+    usage: pd.DataFrame
+        Resources used by each job task (see `osa.job.get_task_resources`).
+    run: int, optional
+        Run number of the sequence.
+    default_time: str, optional
+        Walltime to fall back to, by default the WALLTIME option.
+    packing: int
+        Subruns processed by each job (array task) of the sequence.
+
+    Returns
+    -------
+    SequenceResources
+    """
+    quantile = cfg.getfloat("SLURM", "RESOURCE_QUANTILE", fallback=0.95)
+    margin = 1 + cfg.getfloat("SLURM", "RESOURCE_MARGIN", fallback=0.2)
+    min_samples = cfg.getint("SLURM", "RESOURCE_MIN_SAMPLES", fallback=20)
+
+    default_memory = cfg.get("SLURM", f"MEMSIZE_{sequence_type}")
+    default_time = default_time or cfg.get("SLURM", "WALLTIME")
+    memory = memory_to_gb(pd.Series([default_memory.upper().removesuffix("B")])).iloc[0]
+    time = time_to_seconds(default_time)
+
+    usage = usage[usage["type"] == sequence_type]
+    subruns = usage["subruns"].fillna(1) if "subruns" in usage else 1
+    usage = usage.assign(subrun_elapsed=usage["Elapsed"] / subruns)
+    completed = usage[usage["State"] == "COMPLETED"].dropna(subset=["MaxRSS", "Elapsed"])
+
+    if len(completed) >= min_samples:
+        memory = completed["MaxRSS"].quantile(quantile) * margin
+        time = completed["subrun_elapsed"].quantile(quantile) * packing * margin
+    else:
+        log.debug(f"Only {len(completed)} {sequence_type} jobs accounted, using defaults")
+
+    if run is not None:
+        previous = usage[usage["run"] == run]
+        if not previous.empty:
+            memory_factor = 2 if (previous["State"] == "OUT_OF_MEMORY").any() else 1
+            time_factor = 2 if (previous["State"] == "TIMEOUT").any() else 1
+            memory = max(memory, previous["MaxRSS"].max() * margin * memory_factor)
+            time = max(
+                time, previous["subrun_elapsed"].max() * packing * margin * time_factor
+            )
+
+    partitions = cfg.get("SLURM", f"PARTITION_{sequence_type}")
+    time = min(math.ceil(time / 60) * 60, max_partition_time(partitions))
+
+    return SequenceResources(
+        mem_per_cpu=f"{max(math.ceil(memory), 1)}GB",
+        time=seconds_to_time(time),
+        partition=select_partitions(partitions, time),
+        n_samples=len(completed),
+    )
+
+
+def io_budget() -> Optional[int]:
+    """Maximum number of sequence tasks running at once (IO_BUDGET option), if any."""
+    budget = cfg.get("SLURM", "IO_BUDGET", fallback=None)
+    return int(budget) if budget else None
+
+
+def array_throttle(
+    budget: int, running_tasks: int, n_arrays: int, saturation: float = 1.0
+) -> int:
+    """
+    Maximum number of simultaneously running tasks of each job array.
+
+    The budget left by the tasks already running is split evenly among the
+    arrays. If the tasks are slowed down by the I/O saturation of the
+    filesystem, i.e. they last more than IO_SATURATION_FACTOR times the
+    usual, the share is reduced in the same proportion.
+
+    Parameters
+    ----------
+    budget: int
+        Maximum number of sequence tasks running at once.
+    running_tasks: int
+        Tasks already running outside these arrays.
+    n_arrays: int
+        Number of arrays sharing the budget.
+    saturation: float
+        Ratio between the current and the usual subrun processing time.
+    """
+    share = max(budget - running_tasks, 0) // max(n_arrays, 1)
+    if saturation > cfg.getfloat("SLURM", "IO_SATURATION_FACTOR", fallback=1.5):
+        share = int(share / saturation)
+    return max(share, 1)
@@ -0,0 +1,493 @@
+"""
+Batch systems the sequence jobs are submitted to.
+
+Besides SLURM, a local scheduler runs the job pilot scripts on the current
+node. It reads the same #SBATCH directives and reports the state of the jobs
+in the sacct and squeue formats, so that the rest of OSA handles both alike.
+"""
+
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess as sp
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from pathlib import Path
+from typing import List, Optional
+
+import psutil
+
+from osa.configs import options
+from osa.configs.config import cfg
+from osa.utils.logging import myLogger
+from osa.utils.utils import seconds_to_time
+
+__all__ = [
+    "Scheduler",
+    "SlurmScheduler",
+    "LocalScheduler",
+    "SCHEDULERS",
+    "get_scheduler",
+    "read_sbatch_directives",
+    "array_task_ids",
+    "array_ranges",
+    "script_interpreter",
+]
+
+log = myLogger(logging.getLogger(__name__))
+
+SBATCH_DIRECTIVE_RE = re.compile(r"^#SBATCH\s+(--[\w-]+)(?:=(.*))?$")
+LOG_PATTERN_RE = re.compile(r"%(\d*)([aAj])")
+FINISHED_STATES = {"COMPLETED", "FAILED", "CANCELLED"}
+
+
+class Scheduler(ABC):
+    """
+    Interface of the batch systems the sequence jobs are submitted to.
+
+    A scheduler lacking any of the abstract methods cannot be instantiated,
+    so that it fails when it is created rather than in the middle of a night.
+    """
+
+    name = None
+
+    @abstractmethod
+    def submit(self, commandargs: list, token: str, limiter=None, retries: int = 3):
+        """
+        Submit a job script given sbatch-like command line arguments
+        (the job script being the last one) and return its job ID.
+        """
+
+    @abstractmethod
+    def sacct_output(self) -> str:
+        """Information of the jobs in the sacct format (see `osa.job.run_sacct`)."""
+
+    @abstractmethod
+    def squeue_output(self) -> StringIO:
+        """Jobs in the queue in the squeue format (see `osa.job.run_squeue`)."""
+
+    def wait(self) -> None:
+        """Wait for the jobs that depend on this process to finish."""
+
+    def set_array_throttle(self, job_id: str, limit: int) -> None:
+        """Change the maximum number of simultaneously running tasks of a job array."""
+
+    def find_job(self, token: str) -> Optional[str]:
+        """ID of the job submitted with the given token, None if it is not found."""
+        return None
+
+    @abstractmethod
+    def cancel(self, job_id: str) -> None:
+        """Cancel a job or an array task (e.g. 1234_5)."""
+
+
+class SlurmScheduler(Scheduler):
+    """Submit the jobs to SLURM with sbatch."""
+
+    name = "slurm"
+
+    def submit(self, commandargs: list, token: str, limiter=None, retries: int = 3):
+        from osa.job import sbatch_submit
+
+        return sbatch_submit(commandargs, token, limiter=limiter, retries=retries)
+
+    def sacct_output(self) -> str:
+        from osa.job import fetch_slurm_sacct_output
+
+        return fetch_slurm_sacct_output()
+
+    def squeue_output(self) -> StringIO:
+        from osa.job import run_slurm_squeue
+
+        return run_slurm_squeue()
+
+    def find_job(self, token: str) -> Optional[str]:
+        from osa.job import find_slurm_job
+
+        return find_slurm_job(token)
+
+    def set_array_throttle(self, job_id: str, limit: int) -> None:
+        if shutil.which("scontrol") is None:
+            log.warning("Array throttle not updated since scontrol command is not available")
+            return
+
+        cmd = ["scontrol", "update", f"JobId={job_id}", f"ArrayTaskThrottle={limit}"]
+        try:
+            sp.run(cmd, check=True, capture_output=True)
+        except sp.CalledProcessError as error:
+            log.warning(f"Could not update the throttle of job {job_id}: {error.stderr}")
+
+    def cancel(self, job_id: str) -> None:
+        if shutil.which("scancel") is None:
+            log.warning(f"Job {job_id} not cancelled since scancel command is not available")
+            return
+
+        try:
+            sp.run(["scancel", job_id], check=True, capture_output=True)
+        except sp.CalledProcessError as error:
+            log.warning(f"Could not cancel job {job_id}: {error.stderr}")
+
+
+def read_sbatch_directives(script: Path) -> dict:
+    """Read the #SBATCH options of the header of a job script."""
+    directives = {}
+    with open(script) as file:
+        for line in file:
+            if not line.startswith("#"):
+                if line.strip():
+                    break
+                continue
+            match = SBATCH_DIRECTIVE_RE.match(line.strip())
+            if match:
+                directives[match[1]] = match[2]
+    return directives
+
+
+def array_task_ids(array: Optional[str]) -> List[Optional[int]]:
+    """
+    Expand the --array option (e.g. 0-10 or 0,2,4-6, with an optional %
+    concurrency limit) to the list of task IDs. A job which is not an array
+    has a single task with ID None.
+    """
+    if not array:
+        return [None]
+
+    task_ids = []
+    for item in array.split("%")[0].split(","):
+        first, _, last = item.partition("-")
+        task_ids.extend(range(int(first), int(last or first) + 1))
+    return task_ids
+
+
+def array_ranges(task_ids) -> str:
+    """Compress a list of task IDs to the --array syntax, e.g. 0-3,7,9-10."""
+    ranges = []
+    for task_id in sorted(set(task_ids)):
+        if ranges and task_id == ranges[-1][1] + 1:
+            ranges[-1][1] = task_id
+        else:
+            ranges.append([task_id, task_id])
+
+    return ",".join(str(first) if first == last else f"{first}-{last}" for first, last in ranges)
+
+
+def script_interpreter(script: Path) -> List[str]:
+    """Command running a job script, either a Python or a shell pilot script."""
+    return ["bash"] if Path(script).suffix == ".sh" else [sys.executable]
+
+
+def expand_log_pattern(pattern: str, job_id: str, task_id: Optional[int]) -> str:
+    """Replace the %A, %a and %j symbols of the sbatch output file names."""
+
+    def replace(match):
+        width, symbol = match.groups()
+        value = job_id if symbol in "Aj" or task_id is None else str(task_id)
+        return value.zfill(int(width)) if width else value
+
+    return LOG_PATTERN_RE.sub(replace, pattern)
+
+
+class LocalScheduler(Scheduler):
+    """
+    Run the job scripts on this node in a pool of LOCAL_WORKERS processes.
+
+    Every array task is a process with the same SLURM_* variables SLURM would
+    set. A job with an afterok dependency waits until all the tasks of its
+    parent jobs completed and is cancelled if any of them failed. With an
+    afterany dependency, it waits until they finished in any state.
+    The jobs are kept in the local_jobs.json file of the log directory,
+    from where their state is reported.
+    """
+
+    name = "local"
+
+    def __init__(self, workers: Optional[int] = None):
+        if workers is None:
+            workers = cfg.get("SLURM", "LOCAL_WORKERS", fallback=None)
+        self.workers = int(workers) if workers else os.cpu_count() or 1
+        self._executor = None
+        self._lock = threading.RLock()
+        self._done = threading.Condition(self._lock)
+        self._waiting = []
+        self._active = 0
+
+    @staticmethod
+    def jobs_file() -> Path:
+        """File keeping the jobs run locally for the analysed night."""
+        return Path(options.directory) / "log" / "local_jobs.json"
+
+    def read_tasks(self) -> dict:
+        """
+        Read the tasks of the jobs keyed by their task ID (e.g. 3_0).
+        Tasks left unfinished by a process no longer running are cancelled.
+        """
+        try:
+            tasks = json.loads(self.jobs_file().read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+        for task in tasks.values():
+            if task["State"] not in FINISHED_STATES and not psutil.pid_exists(task["owner"]):
+                task["State"] = "CANCELLED"
+        return tasks
+
+    def update_tasks(self, updates: dict) -> None:
+        """Merge the given task values into the jobs file."""
+        with self._lock:
+            tasks = self.read_tasks()
+            for task_id, values in updates.items():
+                tasks.setdefault(task_id, {}).update(values)
+            jobs_file = self.jobs_file()
+            jobs_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = jobs_file.with_suffix(".tmp")
+            tmp_file.write_text(json.dumps(tasks, indent=1))
+            os.replace(tmp_file, jobs_file)
+
+    def submit(self, commandargs: list, token: str, limiter=None, retries: int = 3):
+        script = Path(commandargs[-1])
+        directives = read_sbatch_directives(script)
+        for argument in commandargs[1:-1]:
+            option, _, value = str(argument).partition("=")
+            directives[option] = value
+
+        dependency_type, _, parents = (directives.get("--dependency") or "").partition(":")
+        with self._lock:
+            job_ids = [int(task.split("_")[0]) for task in self.read_tasks()]
+            job_id = str(max(job_ids, default=0) + 1)
+            job = {
+                "job_id": job_id,
+                "script": script,
+                "name": directives.get("--job-name") or script.stem,
+                "directives": directives,
+                "parents": [parent for parent in parents.split(":") if parent],
+                "afterany": dependency_type == "afterany",
+                "tasks": array_task_ids(directives.get("--array")),
+            }
+            self.update_tasks(
+                {
+                    self.task_key(job_id, task): {
+                        "JobName": job["name"],
+                        "State": "PENDING",
+                        "ExitCode": "0:0",
+                        "Comment": token,
+                        "owner": os.getpid(),
+                    }
+                    for task in job["tasks"]
+                }
+            )
+            self._waiting.append(job)
+            self.release_jobs()
+
+        log.debug(f"Job {job_id} {script} submitted to the local scheduler")
+        return job_id
+
+    @staticmethod
+    def task_key(job_id: str, task_id: Optional[int]) -> str:
+        return job_id if task_id is None else f"{job_id}_{task_id}"
+
+    def release_jobs(self) -> None:
+        """Start the waiting jobs whose dependencies are satisfied."""
+        with self._lock:
+            tasks = self.read_tasks()
+            for job in list(self._waiting):
+                parent_states = [
+                    task["State"]
+                    for key, task in tasks.items()
+                    if key.split("_")[0] in job["parents"]
+                ]
+                failed = any(state in ("FAILED", "CANCELLED") for state in parent_states)
+                if failed and not job["afterany"]:
+                    log.warning(f"Dependency of job {job['job_id']} failed, cancelling it")
+                    self._waiting.remove(job)
+                    self.update_tasks(
+                        {
+                            self.task_key(job["job_id"], task): {"State": "CANCELLED"}
+                            for task in job["tasks"]
+                        }
+                    )
+                elif all(
+                    state in FINISHED_STATES if job["afterany"] else state == "COMPLETED"
+                    for state in parent_states
+                ):
+                    self._waiting.remove(job)
+                    if self._executor is None:
+                        self._executor = ThreadPoolExecutor(max_workers=max(self.workers, 1))
+                    for task in job["tasks"]:
+                        key = self.task_key(job["job_id"], task)
+                        if tasks.get(key, {}).get("State") == "CANCELLED":
+                            continue
+                        self._active += 1
+                        self._executor.submit(self.run_task, job, task)
+            self._done.notify_all()
+
+    def run_task(self, job: dict, task_id: Optional[int]) -> None:
+        """Execute an array task of a job and record its outcome."""
+        key = self.task_key(job["job_id"], task_id)
+        directives = job["directives"]
+        env = os.environ.copy()
+        env.update(SLURM_JOB_ID=job["job_id"], SLURM_JOB_NAME=job["name"])
+        if task_id is not None:
+            env.update(SLURM_ARRAY_JOB_ID=job["job_id"], SLURM_ARRAY_TASK_ID=str(task_id))
+        for item in (directives.get("--export") or "").split(","):
+            if "=" in item:
+                variable, value = item.split("=", 1)
+                env[variable] = value
+
+        workdir = Path(directives.get("--chdir") or job["script"].parent)
+        output = {}
+        for option, default in (("--output", "slurm-%j.out"), ("--error", None)):
+            pattern = directives.get(option) or default
+            if pattern:
+                output[option] = workdir / expand_log_pattern(pattern, job["job_id"], task_id)
+                output[option].parent.mkdir(parents=True, exist_ok=True)
+
+        # The tasks of an array may share the same log file
+        mode = "a" if directives.get("--open-mode") == "append" else "w"
+        start = time.time()
+        self.update_tasks({key: {"State": "RUNNING", "start": start}})
+        try:
+            with open(output["--output"], mode) as stdout:
+                stderr = open(output["--error"], mode) if "--error" in output else sp.STDOUT
+                try:
+                    process = sp.Popen(
+                        [*script_interpreter(job["script"]), str(job["script"])],
+                        cwd=workdir,
+                        env=env,
+                        stdout=stdout,
+                        stderr=stderr,
+                    )
+                    self.update_tasks({key: {"pid": process.pid}})
+                    # Collect the process with wait4 to also account its resources
+                    _, status, usage = os.wait4(process.pid, 0)
+                    process.returncode = os.waitstatus_to_exitcode(status)
+                finally:
+                    if stderr is not sp.STDOUT:
+                        stderr.close()
+            rc = process.returncode
+            values = {
+                "MaxRSS": f"{usage.ru_maxrss}K",
+                "TotalCPU": seconds_to_time(round(usage.ru_utime + usage.ru_stime)),
+            }
+        except OSError as error:
+            log.error(f"Could not run {job['script']}: {error}")
+            rc, values = 1, {}
+
+        values.update(
+            State="COMPLETED" if rc == 0 else "FAILED",
+            ExitCode=f"{max(rc, 0)}:{max(-rc, 0)}",
+            end=time.time(),
+        )
+        log.debug(f"Local job {key} finished with exit code {rc}")
+
+        with self._lock:
+            if self.read_tasks().get(key, {}).get("State") == "CANCELLED":
+                values["State"] = "CANCELLED"
+            self.update_tasks({key: values})
+            self._active -= 1
+            self.release_jobs()
+
+    def cancel(self, job_id: str) -> None:
+        with self._lock:
+            tasks = self.read_tasks()
+            keys = [
+                key
+                for key, task in tasks.items()
+                if job_id in (key, key.split("_")[0]) and task["State"] not in FINISHED_STATES
+            ]
+            for job in list(self._waiting):
+                if job["job_id"] == job_id:
+                    self._waiting.remove(job)
+            for key in keys:
+                pid = tasks[key].get("pid")
+                if tasks[key]["State"] == "RUNNING" and pid and psutil.pid_exists(pid):
+                    psutil.Process(pid).terminate()
+            self.update_tasks({key: {"State": "CANCELLED"} for key in keys})
+            self.release_jobs()
+
+        log.debug(f"Local job {job_id} cancelled")
+
+    def sacct_output(self) -> str:
+        lines = []
+        now = time.time()
+        for key, task in self.read_tasks().items():
+            elapsed = 0
+            if "start" in task:
+                elapsed = round(task.get("end", now) - task["start"])
+            elapsed_time = seconds_to_time(elapsed)
+            lines.append(
+                ",".join(
+                    [
+                        key,
+                        task["JobName"],
+                        elapsed_time,
+                        str(elapsed),
+                        elapsed_time,
+                        task.get("TotalCPU", ""),
+                        task.get("MaxRSS", ""),
+                        task["State"],
+                        task["ExitCode"],
+                    ]
+                )
+            )
+        return "".join(f"{line}\n" for line in lines)
+
+    def find_job(self, token: str) -> Optional[str]:
+        for key, task in self.read_tasks().items():
+            if task.get("Comment") == token:
+                return key.split("_")[0]
+        return None
+
+    def squeue_output(self) -> StringIO:
+        lines = ["JOBID;NAME;STATE;TIME"]
+        now = time.time()
+        for key, task in self.read_tasks().items():
+            if task["State"] in FINISHED_STATES:
+                continue
+            elapsed = round(now - task["start"]) if "start" in task else 0
+            lines.append(f"{key};{task['JobName']};{task['State']};{seconds_to_time(elapsed)}")
+        return StringIO("\n".join(lines) + "\n")
+
+    def wait(self) -> None:
+        with self._done:
+            if self._waiting or self._active:
+                log.info("Waiting for the jobs running in the local scheduler to finish")
+            # Jobs waiting for a dependency are released as their parents finish
+            while self._active:
+                self._done.wait()
+
+        if self._waiting:
+            scripts = ", ".join(str(job["script"]) for job in self._waiting)
+            log.warning(f"Cancelling jobs whose dependencies never finished: {scripts}")
+            self.update_tasks(
+                {
+                    self.task_key(job["job_id"], task): {"State": "CANCELLED"}
+                    for job in self._waiting
+                    for task in job["tasks"]
+                }
+            )
+            self._waiting.clear()
+
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+SCHEDULERS = {"slurm": SlurmScheduler, "local": LocalScheduler}
+_SCHEDULER = {}
+
+
+def get_scheduler() -> Scheduler:
+    """Return the scheduler set in the SCHEDULER option (slurm by default)."""
+    name = cfg.get("SLURM", "SCHEDULER", fallback=None) or "slurm"
+    if name not in SCHEDULERS:
+        raise ValueError(f"Scheduler {name} not supported, use one of {list(SCHEDULERS)}")
+
+    if name not in _SCHEDULER:
+        _SCHEDULER[name] = SCHEDULERS[name]()
+    return _SCHEDULER[name]
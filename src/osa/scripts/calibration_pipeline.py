@@ -10,12 +10,14 @@ onsite calibration scripts from lstchain.
 
 import logging
 import sys
+from datetime import datetime
 from pathlib import Path
 
 from osa.configs import options
 from osa.configs.config import cfg
 from osa.job import historylevel
 from osa.paths import drs4_pedestal_exists, calibration_file_exists
+from osa.progress import DONE, FAILED, RUNNING, emit
 from osa.provenance.capture import trace
 from osa.utils.cliopts import calibration_pipeline_cliparsing
 from osa.utils.logging import myLogger
@@ -83,6 +85,8 @@ def calibration_sequence(drs4_pedestal_run_id: int, pedcal_run_id: int) -> int:
     rc : int
         Return code
     """
+    start_time = datetime.utcnow()
+    emit(f"{pedcal_run_id:05d}", "calibration_pipeline", RUNNING, start_time)
     analysis_dir = Path(options.directory)
     history_file = analysis_dir / f"sequence_LST1_{pedcal_run_id:05d}.history"
 
@@ -101,6 +105,8 @@ def calibration_sequence(drs4_pedestal_run_id: int, pedcal_run_id: int) -> int:
     if level == 0:
         log.info(f"Job for sequence {pedcal_run_id} finished without fatal errors")
 
+    status = DONE if rc == 0 else FAILED
+    emit(f"{pedcal_run_id:05d}", "calibration_pipeline", status, start_time, rc=rc)
     return rc
 
 
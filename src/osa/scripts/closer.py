@@ -8,7 +8,6 @@ import re
 import shutil
 import subprocess
 import sys
-import time
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Tuple, Iterable, List
@@ -17,20 +16,26 @@ from osa import osadb
 from osa.configs import options
 from osa.configs.config import cfg
 from osa.job import (
-    are_all_jobs_correctly_finished, 
-    save_job_information, 
-    run_sacct, 
-    get_closer_sacct_output
+    TERMINAL_JOB_STATES,
+    are_all_jobs_correctly_finished,
+    save_job_information,
+    get_sacct_snapshot,
+    get_closer_sacct_output,
+    wait_for_jobs,
 )
-from osa.nightsummary.extract import extract_runs, extract_sequences
+from osa.joblogs import compact_job_logs
+from osa.nightdag import dag_job_states, missing_dag_jobs, night_dag_jobs
+from osa.nightsummary.extract import build_sequences, extract_runs, extract_sequences
 from osa.nightsummary.nightsummary import run_summary_table
 from osa.paths import (
     destination_dir,
     create_longterm_symlink,
     dl1_datacheck_longterm_file_exits
 )
+from osa.priority import night_priority, priority_options, sort_by_priority
 from osa.raw import is_raw_data_available
 from osa.report import start
+from osa.speculation import sequence_array_completed
 from osa.utils.cliopts import closercliparsing
 from osa.utils.logging import myLogger
 from osa.utils.register import register_found_pattern
@@ -49,6 +54,8 @@ __all__ = [
     "is_sequencer_successful",
     "ask_for_closing",
     "post_process",
+    "launch_post_processing",
+    "relaunch_missing_dag_jobs",
     "post_process_files",
     "is_finished_check",
     "extract_provenance",
@@ -58,6 +65,13 @@ __all__ = [
     "daily_datacheck",
     "daily_longterm_cmd",
     "observation_finished",
+    "merge_files_cmd",
+    "merge_muon_files_cmd",
+    "merge_dl1_datacheck_cmd",
+    "extract_provenance_cmd",
+    "longterm_check_cmd",
+    "transparency_update_cmd",
+    "sequence_files_to_close",
 ]
 
 log = myLogger(logging.getLogger())
@@ -79,6 +93,18 @@ def main():
     tag = gettag()
     start(tag)
 
+    # Move the files of a single run, e.g. from a job of the night dependency graph
+    if options.files_only:
+        sequences = sequence_files_to_close()
+        # With speculative execution, the job runs once the array job finished in any state
+        if cfg.getboolean("SLURM", "SPECULATIVE_EXECUTION", fallback=False) and not all(
+            sequence_array_completed(sequence) for sequence in sequences
+        ):
+            log.error(f"Array job of sequence {options.seqtoclose} did not complete")
+            sys.exit(1)
+        post_process_files(sequences)
+        sys.exit(0)
+
     # starting the algorithm
     if not observation_finished():
         log.warning("Observations not over, it is earlier than 08:00 UTC.")
@@ -106,7 +132,7 @@ def main():
             log.error("Never thought about this possibility, please check the code")
             sys.exit(-1)
 
-        save_job_information()
+        save_job_information(sequencer_tuple[1])
         post_process(sequencer_tuple)
 
 
@@ -157,51 +183,33 @@ def ask_for_closing():
 
 def post_process(seq_tuple):
     """Set of last instructions."""
-    seq_list = seq_tuple[1]
-    
+    # The runs of the most urgent sources are merged first
+    seq_list = sort_by_priority(seq_tuple[1])
+
+    dag_jobs = night_dag_jobs()
+
     if dl1_datacheck_longterm_file_exits() and not options.test:
         create_longterm_symlink()
 
+    elif dag_jobs:
+        # The merging jobs were already submitted by the sequencer
+        # with the dependency graph of the night, just close the sequences.
+        log.info(f"{len(dag_jobs)} post-processing jobs already submitted by the sequencer")
+        post_process_files(seq_list)
+        relaunched = relaunch_missing_dag_jobs(seq_list, dag_jobs)
+        if not relaunched and "cherenkov_transparency" in dag_jobs:
+            create_longterm_symlink(dag_jobs["cherenkov_transparency"])
+
     else:
         # Close the sequences
         post_process_files(seq_list)
-
-        # Extract the provenance info
-        extract_provenance(seq_list)
-
-        # Merge DL1b files run-wise
-        merge_files(seq_list, data_level="DL1AB")
-
-        merge_muon_files(seq_list)
-
-        # Merge DL2 files run-wise
-        if not options.no_dl2:
-            merge_files(seq_list, data_level="DL2")
-
-        # Merge DL1 datacheck files and produce PDFs. It also produces
-        # the daily datacheck report using the longterm script, and updates
-        # the longterm DL1 datacheck file with the cherenkov_transparency script.
-        if cfg.getboolean("lstchain", "merge_dl1_datacheck"):
-            list_job_id = merge_dl1_datacheck(seq_list)
-            longterm_job_id = daily_datacheck(daily_longterm_cmd(list_job_id))
-            cherenkov_job_id = cherenkov_transparency(cherenkov_transparency_cmd(longterm_job_id))
-            create_longterm_symlink(cherenkov_job_id)
-
-        time.sleep(600)
+        launch_post_processing(seq_list)
 
     # Check if all jobs launched by autocloser finished correctly 
     # before creating the NightFinished.txt file
-    n_max = 6
-    n = 0
-    while not all_closer_jobs_finished_correctly() and n <= n_max:
-        log.info(
-            "All jobs launched by autocloser did not finished correctly yet. "
-            "Checking again in 10 minutes..."
-        )
-        time.sleep(600)
-        n += 1
-
-    if n > n_max:
+    wait_for_jobs(parser=get_closer_sacct_output)
+    if not all_closer_jobs_finished_correctly():
+        log.info("All jobs launched by autocloser did not finished correctly.")
         send_warning_mail(date=date_to_iso(options.date))
         return False
 
@@ -209,12 +217,98 @@ def post_process(seq_tuple):
         database = cfg.get("database", "path")
         if database:
             osadb.end_processing(date_to_iso(options.date))
+        # Pack the log files of the array tasks into the log container of each run
+        log_directory = Path(options.directory) / "log"
+        if (
+            cfg.getboolean("SLURM", "AGGREGATED_JOB_LOGS", fallback=False)
+            and not options.simulate
+            and log_directory.is_dir()
+        ):
+            compact_job_logs(log_directory)
         # Creating closing flag files will be deprecated in future versions
         return set_closed_with_file()
 
     return False
 
 
+def launch_post_processing(seq_list: list, datacheck_job_ids: Iterable[str] = ()):
+    """
+    Launch the jobs extracting the provenance and merging the files of the sequences.
+
+    Parameters
+    ----------
+    seq_list: list
+        list of sequences
+    datacheck_job_ids: list of str, optional
+        Jobs merging the DL1 datacheck files of other runs, on which
+        the daily datacheck also depends.
+    """
+    # Extract the provenance info
+    extract_provenance(seq_list)
+
+    # Merge DL1b files run-wise
+    merge_files(seq_list, data_level="DL1AB")
+
+    merge_muon_files(seq_list)
+
+    # Merge DL2 files run-wise
+    if not options.no_dl2:
+        merge_files(seq_list, data_level="DL2")
+
+    # Merge DL1 datacheck files and produce PDFs. It also produces
+    # the daily datacheck report using the longterm script, and updates
+    # the longterm DL1 datacheck file with the cherenkov_transparency script.
+    if cfg.getboolean("lstchain", "merge_dl1_datacheck"):
+        list_job_id = [*datacheck_job_ids, *merge_dl1_datacheck(seq_list)]
+        longterm_job_id = daily_datacheck(daily_longterm_cmd(list_job_id))
+        cherenkov_job_id = cherenkov_transparency(cherenkov_transparency_cmd(longterm_job_id))
+        create_longterm_symlink(cherenkov_job_id)
+
+
+def relaunch_missing_dag_jobs(seq_list: list, dag_jobs: dict) -> bool:
+    """
+    Launch the post-processing of the runs whose jobs of the night dependency
+    graph failed, were cancelled or were not submitted, as done without it.
+
+    Parameters
+    ----------
+    seq_list: list
+        list of sequences
+    dag_jobs: dict
+        Job IDs of the post-processing jobs submitted by the sequencer.
+
+    Returns
+    -------
+    bool
+        Whether any post-processing job was missing.
+    """
+    missing = missing_dag_jobs(seq_list)
+    if not missing:
+        return False
+
+    missing_runs = {job.run for job in missing if job.run is not None}
+    runs_to_merge = [
+        sequence
+        for sequence in seq_list
+        if sequence.type == "DATA" and sequence.run in missing_runs
+    ]
+    log.warning(
+        f"Post-processing jobs {', '.join(job.jobname for job in missing)} failed or were not "
+        f"submitted, merging runs {sorted(missing_runs)} and the daily datacheck again"
+    )
+
+    # The daily datacheck also waits for the datacheck merging still running in the graph
+    ongoing_datacheck = [
+        dag_jobs[jobname]
+        for jobname, state in dag_job_states(dag_jobs).items()
+        if jobname.startswith("merge_dl1_datacheck_")
+        and state is not None
+        and state not in TERMINAL_JOB_STATES
+    ]
+    launch_post_processing(runs_to_merge, ongoing_datacheck)
+    return True
+
+
 def post_process_files(seq_list: list):
     """
     Identify the different types of files, try to close the sequences
@@ -266,6 +360,15 @@ def post_process_files(seq_list: list):
                 output_files_set.remove(registered_file)
 
 
+def sequence_files_to_close() -> list:
+    """Data sequence of the run given by --seq, whose files are to be moved."""
+    return [
+        sequence
+        for sequence in build_sequences(options.date)
+        if sequence.type == "DATA" and sequence.run_str == options.seqtoclose
+    ]
+
+
 def set_closed_with_file():
     """Write the analysis report to the closer file."""
     night_finished_file = night_finished_flag()
@@ -323,6 +426,20 @@ def is_finished_check(run_summary):
     return [sequence_success, sequence_list]
 
 
+def merge_dl1_datacheck_cmd(sequence) -> List[str]:
+    """Build the command merging the DL1 datacheck files of a run."""
+    muons_dir = destination_dir("MUON", create_dir=False)
+    datacheck_dir = destination_dir("DATACHECK", create_dir=False)
+
+    return [
+        "lstchain_check_dl1",
+        "--input-file",
+        f"{datacheck_dir}/datacheck_dl1_LST-1.Run{sequence.run:05d}.*.h5",
+        f"--output-dir={datacheck_dir}",
+        f"--muons-dir={muons_dir}",
+    ]
+
+
 def merge_dl1_datacheck(seq_list) -> List[str]:
     """
     Merge every DL1 datacheck h5 files run-wise and generate the PDF files
@@ -334,11 +451,10 @@ def merge_dl1_datacheck(seq_list) -> List[str]:
     """
     log.debug("Merging dl1 datacheck files and producing PDFs")
 
-    muons_dir = destination_dir("MUON", create_dir=False)
-    datacheck_dir = destination_dir("DATACHECK", create_dir=False)
     slurm_account = cfg.get("SLURM", "ACCOUNT")
 
     list_job_id = []
+    max_priority = night_priority(seq_list)
 
     for sequence in seq_list:
         if sequence.type == "DATA":
@@ -346,17 +462,14 @@ def merge_dl1_datacheck(seq_list) -> List[str]:
                 "sbatch",
                 "--parsable",
                 f"--account={slurm_account}",
+                *priority_options(sequence.priority, max_priority),
                 "-D",
                 options.directory,
                 "-o",
                 f"log/merge_dl1_datacheck_{sequence.run:05d}_%j.out",
                 "-e",
                 f"log/merge_dl1_datacheck_{sequence.run:05d}_%j.err",
-                "lstchain_check_dl1",
-                "--input-file",
-                f"{datacheck_dir}/datacheck_dl1_LST-1.Run{sequence.run:05d}.*.h5",
-                f"--output-dir={datacheck_dir}",
-                f"--muons-dir={muons_dir}",
+                *merge_dl1_datacheck_cmd(sequence),
             ]
             if not options.simulate and not options.test:
                 job = subprocess.run(
@@ -375,6 +488,24 @@ def merge_dl1_datacheck(seq_list) -> List[str]:
     return list_job_id
 
 
+def extract_provenance_cmd(sequence) -> List[str]:
+    """Build the command extracting the provenance of a run."""
+    cmd = [
+        "provprocess",
+        "-c",
+        str(options.configfile),
+        str(sequence.drs4_run),
+        str(sequence.pedcal_run),
+        f"{sequence.run:05d}",
+        date_to_dir(options.date),
+        options.prod_id,
+    ]
+    if options.no_dl2:
+        cmd.append("--no-dl2")
+
+    return cmd
+
+
 def extract_provenance(seq_list):
     """
     Extract provenance run wise from the prov.log file
@@ -387,13 +518,10 @@ def extract_provenance(seq_list):
     """
     log.info("Extract provenance run wise")
 
-    nightdir = date_to_dir(options.date)
     slurm_account = cfg.get("SLURM", "ACCOUNT")
 
     for sequence in seq_list:
         if sequence.type == "DATA":
-            drs4_pedestal_run_id = str(sequence.drs4_run)
-            pedcal_run_id = str(sequence.pedcal_run)
             cmd = [
                 "sbatch",
                 f"--account={slurm_account}",
@@ -401,18 +529,9 @@ def extract_provenance(seq_list):
                 options.directory,
                 "-o",
                 f"log/provenance_{sequence.run:05d}_%j.log",
-                "provprocess",
-                "-c",
-                options.configfile,
-                drs4_pedestal_run_id,
-                pedcal_run_id,
-                f"{sequence.run:05d}",
-                nightdir,
-                options.prod_id,
+                *extract_provenance_cmd(sequence),
             ]
-            if options.no_dl2:
-                cmd.append("--no-dl2")
-                
+
             if not options.simulate and not options.test and shutil.which("sbatch") is not None:
                 subprocess.run(cmd, check=True)
             else:
@@ -431,32 +550,42 @@ def get_pattern(data_level) -> Tuple[str, str]:
     raise ValueError(f"Unknown data level {data_level}")
 
 
+def merge_files_cmd(sequence, data_level="DL2") -> List[str]:
+    """Build the command merging the DL1b or DL2 h5 files of a run."""
+    data_dir = destination_dir(data_level, create_dir=False)
+    pattern, prefix = get_pattern(data_level)
+    merged_file = Path(data_dir) / f"{prefix}_LST-1.Run{sequence.run:05d}.h5"
+
+    return [
+        "lstchain_merge_hdf5_files",
+        f"--input-dir={data_dir}",
+        f"--output-file={merged_file}",
+        "--no-image",
+        "--no-progress",
+        f"--run-number={sequence.run}",
+        f"--pattern={pattern}",
+    ]
+
+
 def merge_files(sequence_list, data_level="DL2"):
     """Merge DL1b or DL2 h5 files run-wise."""
     log.info(f"Looping over the sequences and merging the {data_level} files")
 
-    data_dir = destination_dir(data_level, create_dir=False)
-    pattern, prefix = get_pattern(data_level)
+    _, prefix = get_pattern(data_level)
     slurm_account = cfg.get("SLURM", "ACCOUNT")
+    max_priority = night_priority(sequence_list)
 
     for sequence in sequence_list:
         if sequence.type == "DATA":
-            merged_file = Path(data_dir) / f"{prefix}_LST-1.Run{sequence.run:05d}.h5"
-
             cmd = [
                 "sbatch",
                 f"--account={slurm_account}",
+                *priority_options(sequence.priority, max_priority),
                 "-D",
                 options.directory,
                 "-o",
                 f"log/merge_{prefix}_{sequence.run:05d}_%j.log",
-                "lstchain_merge_hdf5_files",
-                f"--input-dir={data_dir}",
-                f"--output-file={merged_file}",
-                "--no-image",
-                "--no-progress",
-                f"--run-number={sequence.run}",
-                f"--pattern={pattern}",
+                *merge_files_cmd(sequence, data_level),
             ]
 
             log.debug(f"Executing {stringify(cmd)}")
@@ -467,29 +596,39 @@ def merge_files(sequence_list, data_level="DL2"):
                 log.debug("Simulate launching scripts")
 
 
+def merge_muon_files_cmd(sequence) -> List[str]:
+    """Build the command merging the muon files of a run."""
+    data_dir = destination_dir("MUON", create_dir=False)
+    pattern, _ = get_pattern("MUON")
+    merged_file = Path(data_dir) / f"muons_LST-1.Run{sequence.run:05d}.fits"
+
+    return [
+        "lstchain_merge_muon_files",
+        f"--input-dir={data_dir}",
+        f"--output-file={merged_file}",
+        f"--run-number={sequence.run}",
+        f"--pattern={pattern}",
+    ]
+
+
 def merge_muon_files(sequence_list):
     """Merge muon files run-wise."""
     log.info("Looping over the sequences and merging the MUON files")
 
-    data_dir = destination_dir("MUON", create_dir=False)
-    pattern, prefix = get_pattern("MUON")
+    _, prefix = get_pattern("MUON")
     slurm_account = cfg.get("SLURM", "ACCOUNT")
+    max_priority = night_priority(sequence_list)
 
     for sequence in sequence_list:
-        merged_file = Path(data_dir) / f"muons_LST-1.Run{sequence.run:05d}.fits"
-
         cmd = [
             "sbatch",
             f"--account={slurm_account}",
+            *priority_options(sequence.priority, max_priority),
             "-D",
             options.directory,
             "-o",
             f"log/merge_{prefix}_{sequence.run:05d}_%j.log",
-            "lstchain_merge_muon_files",
-            f"--input-dir={data_dir}",
-            f"--output-file={merged_file}",
-            f"--run-number={sequence.run}",
-            f"--pattern={pattern}",
+            *merge_muon_files_cmd(sequence),
         ]
 
         log.debug(f"Executing {stringify(cmd)}")
@@ -500,13 +639,25 @@ def merge_muon_files(sequence_list):
             log.debug("Simulate launching scripts")
 
 
-def daily_longterm_cmd(parent_job_ids: List[str]) -> List[str]:
-    """Build the daily longterm command."""
+def longterm_check_cmd() -> List[str]:
+    """Build the command producing the longterm DL1 datacheck file of the night."""
     nightdir = date_to_dir(options.date)
     datacheck_dir = destination_dir("DATACHECK", create_dir=False)
     muons_dir = destination_dir("MUON", create_dir=False)
     longterm_dir = Path(cfg.get("LST1", "LONGTERM_DIR")) / options.prod_id / nightdir
     longterm_output_file = longterm_dir / f"DL1_datacheck_{nightdir}.h5"
+
+    return [
+        "lstchain_longterm_dl1_check",
+        f"--input-dir={datacheck_dir}",
+        f"--output-file={longterm_output_file}",
+        f"--muons-dir={muons_dir}",
+        "--batch",
+    ]
+
+
+def daily_longterm_cmd(parent_job_ids: List[str]) -> List[str]:
+    """Build the daily longterm command."""
     slurm_account = cfg.get("SLURM", "ACCOUNT")
 
     return [
@@ -517,12 +668,8 @@ def daily_longterm_cmd(parent_job_ids: List[str]) -> List[str]:
         options.directory,
         "-o",
         "log/longterm_daily_%j.log",
-        f"--dependency=afterok:{','.join(parent_job_ids)}",
-        "lstchain_longterm_dl1_check",
-        f"--input-dir={datacheck_dir}",
-        f"--output-file={longterm_output_file}",
-        f"--muons-dir={muons_dir}",
-        "--batch",
+        *([f"--dependency=afterok:{','.join(parent_job_ids)}"] if parent_job_ids else []),
+        *longterm_check_cmd(),
     ]
 
 
@@ -545,12 +692,22 @@ def daily_datacheck(cmd: List[str]):
         log.debug("Simulate launching scripts")
 
 
-def cherenkov_transparency_cmd(longterm_job_id: str) -> List[str]:
-    """Build the cherenkov transparency command."""
+def transparency_update_cmd() -> List[str]:
+    """Build the command adding the Cherenkov transparency to the longterm datacheck file."""
     nightdir = date_to_dir(options.date)
     datacheck_dir = destination_dir("DATACHECK", create_dir=False)
     longterm_dir = Path(cfg.get("LST1", "LONGTERM_DIR")) / options.prod_id / nightdir
     longterm_datacheck_file = longterm_dir / f"DL1_datacheck_{nightdir}.h5"
+
+    return [
+        "lstchain_cherenkov_transparency",
+        f"--update-datacheck-file={longterm_datacheck_file}",
+        f"--input-dir={datacheck_dir}",
+    ]
+
+
+def cherenkov_transparency_cmd(longterm_job_id: str) -> List[str]:
+    """Build the cherenkov transparency command."""
     slurm_account = cfg.get("SLURM", "ACCOUNT")
 
     return [
@@ -562,9 +719,7 @@ def cherenkov_transparency_cmd(longterm_job_id: str) -> List[str]:
         "-o",
         "log/cherenkov_transparency_%j.log",
         f"--dependency=afterok:{longterm_job_id}",
-        "lstchain_cherenkov_transparency",
-        f"--update-datacheck-file={longterm_datacheck_file}",
-        f"--input-dir={datacheck_dir}",
+        *transparency_update_cmd(),
     ]
 
 
@@ -590,8 +745,8 @@ def cherenkov_transparency(cmd: List[str]):
 
 def all_closer_jobs_finished_correctly():
     """Check if all the jobs launched by autocloser finished correctly."""
-    sacct_output = run_sacct()
-    jobs_closer = get_closer_sacct_output(sacct_output)
+    # This check is polled, so always ask sacct for the current job states
+    jobs_closer = get_sacct_snapshot(parser=get_closer_sacct_output, max_age=0)
     if len(jobs_closer[jobs_closer["State"]!="COMPLETED"])==0:
         return True
     else:
@@ -1,19 +1,34 @@
 """Script called from the batch scheduler to process a run."""
 
 import logging
+import os
 import sys
+from datetime import datetime
 from pathlib import Path
 
+from tenacity import RetryError
+
 from osa.configs import options
 from osa.configs.config import cfg
 from osa.job import historylevel
+from osa.numbacache import mark_populated
+from osa.paths import analysis_path
+from osa.progress import DONE, FAILED, RUNNING, emit
+from osa.speculation import settle_speculative_task
 from osa.workflow.stages import AnalysisStage
 from osa.provenance.capture import trace
 from osa.utils.cliopts import data_sequence_cli_parsing
 from osa.utils.logging import myLogger
 from osa.utils.utils import date_to_dir
 
-__all__ = ["data_sequence", "r0_to_dl1", "dl1_to_dl2", "dl1ab", "dl1_datacheck"]
+__all__ = [
+    "data_sequence",
+    "data_sequence_block",
+    "r0_to_dl1",
+    "dl1_to_dl2",
+    "dl1ab",
+    "dl1_datacheck",
+]
 
 log = myLogger(logging.getLogger())
 
@@ -47,6 +62,8 @@ def data_sequence(
     rc: int
         Return code of the last executed command.
     """
+    start_time = datetime.utcnow()
+    emit(run_str, "datasequence", RUNNING, start_time)
     history_file = Path(options.directory) / f"sequence_{options.tel_id}_{run_str}.history"
     # Set the starting level and corresponding return code from last analysis step
     # registered in the history file.
@@ -97,6 +114,86 @@ def data_sequence(
     if level == 0:
         log.info(f"Job for sequence {run_str} finished without fatal errors")
 
+    emit(run_str, "datasequence", DONE if rc == 0 else FAILED, start_time, rc=rc)
+    return rc
+
+
+def data_sequence_block(
+    calibration_file: Path,
+    pedestal_file: Path,
+    time_calibration_file: Path,
+    systematic_correction_file: Path,
+    drive_file: Path,
+    run_summary: Path,
+    pedestal_ids_file: Path,
+    run_str: str,
+    n_subruns: int = 1,
+):
+    """
+    Process a block of consecutive subruns one after the other in the same
+    process. Each subrun keeps its own history file, so that a later job
+    restarts each of them from the level it reached.
+
+    Parameters
+    ----------
+    calibration_file: pathlib.Path
+    pedestal_file: pathlib.Path
+    time_calibration_file: pathlib.Path
+    systematic_correction_file: pathlib.Path
+    drive_file: pathlib.Path
+    run_summary: pathlib.Path
+    pedestal_ids_file: pathlib.Path
+        Pedestal ids file of the first subrun of the block.
+    run_str: str
+        XXXXX.XXXX (run_number.subrun_number) of the first subrun of the block.
+    n_subruns: int
+        Number of subruns in the block.
+
+    Returns
+    -------
+    rc: int
+        First non-zero return code among the subruns, 0 if all succeeded.
+    """
+    if n_subruns == 1:
+        return data_sequence(
+            calibration_file,
+            pedestal_file,
+            time_calibration_file,
+            systematic_correction_file,
+            drive_file,
+            run_summary,
+            pedestal_ids_file,
+            run_str,
+        )
+
+    run, first_subrun = run_str.split(".")
+    rc = 0
+    for subrun in range(int(first_subrun), int(first_subrun) + n_subruns):
+        subrun_str = f"{run}.{subrun:04d}"
+        subrun_pedestal_ids_file = (
+            None
+            if pedestal_ids_file is None
+            else pedestal_ids_file.with_name(f"pedestal_ids_Run{run}.{subrun:04d}.h5")
+        )
+        try:
+            subrun_rc = data_sequence(
+                calibration_file,
+                pedestal_file,
+                time_calibration_file,
+                systematic_correction_file,
+                drive_file,
+                run_summary,
+                subrun_pedestal_ids_file,
+                subrun_str,
+            )
+        except RetryError:
+            # Keep processing the rest of the block
+            log.exception(f"Processing of subrun {subrun_str} failed")
+            subrun_rc = 1
+
+        if rc == 0:
+            rc = subrun_rc
+
     return rc
 
 
@@ -296,6 +393,7 @@ def main():
         run_summary_file,
         pedestal_ids_file,
         run_number,
+        n_subruns,
     ) = data_sequence_cli_parsing()
 
     if options.verbose:
@@ -304,7 +402,7 @@ def main():
         log.setLevel(logging.INFO)
 
     # Run the routine piping all the analysis steps
-    rc = data_sequence(
+    rc = data_sequence_block(
         calibration_file,
         drs4_ped_file,
         time_calibration_file,
@@ -313,7 +411,19 @@ def main():
         run_summary_file,
         pedestal_ids_file,
         run_number,
+        n_subruns,
     )
+
+    if rc == 0 and not options.simulate:
+        # The shared numba cache used, if any, holds the code compiled for the analysis
+        mark_populated(os.getenv("NUMBA_CACHE_DIR"))
+
+    if options.speculative_of is not None:
+        # Keep the outputs only if the speculative execution finished first
+        rc = settle_speculative_task(
+            rc, options.speculative_of, options.directory, analysis_path(options.tel_id)
+        )
+
     sys.exit(rc)
 
 
@@ -18,7 +18,7 @@ from osa.utils.utils import wait_for_daytime, date_to_dir, date_to_iso
 from osa.utils.logging import myLogger
 from osa.utils.iofile import append_to_file
 from osa.utils.cliopts import valid_date
-from osa.job import get_sacct_output, run_sacct, job_finished_in_timeout
+from osa.job import stream_sacct, job_finished_in_timeout
 from osa.configs.config import cfg
 from osa.paths import DEFAULT_CFG
 from osa.nightsummary.nightsummary import run_summary_table
@@ -334,7 +334,7 @@ def update_history_file(run_id: str, subrun: str, log_dir: Path, history_file: P
     if not job_id:
         log.debug(f"Cannot find a job_id for the run {run_id:05d}.{subrun:04d}")
     else:
-        job_status = get_sacct_output(run_sacct(job_id=job_id))["State"]
+        job_status = stream_sacct(job_id=job_id)["State"]
         if job_status.item() in ["RUNNING", "PENDING"]:
             log.info(f"Job {job_id} is still running.")
             return
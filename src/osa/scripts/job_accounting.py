@@ -0,0 +1,84 @@
+"""Query the job accounting archive: runtime, memory and failure rate per stage."""
+
+import logging
+from argparse import ArgumentParser
+from pathlib import Path
+
+from osa.accounting import job_accounting_dir, job_statistics, read_job_archive
+from osa.paths import DEFAULT_CFG
+from osa.utils.cliopts import valid_date
+from osa.utils.logging import myLogger
+
+__all__ = ["job_accounting_argparser"]
+
+log = myLogger(logging.getLogger())
+
+
+def job_accounting_argparser():
+    """Command line parser for the job accounting queries."""
+    parser = ArgumentParser(
+        description="Show the p50/p95 runtime and memory and the failure rate of the "
+        "archived jobs of each stage"
+    )
+    parser.add_argument(
+        "-c",
+        "--config",
+        type=Path,
+        default=DEFAULT_CFG,
+        help="Use specific config file [default configs/sequencer.cfg]",
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="store_true", default=False, help="Activate debugging mode"
+    )
+    parser.add_argument("--start", type=valid_date, help="First night (YYYY-MM-DD) to account")
+    parser.add_argument("--end", type=valid_date, help="Last night (YYYY-MM-DD) to account")
+    parser.add_argument(
+        "--stage", action="append", dest="stages", help="Stage to account (can be repeated)"
+    )
+    parser.add_argument(
+        "--prod-id",
+        action="append",
+        dest="prod_ids",
+        help="Production ID to account (can be repeated)",
+    )
+    parser.add_argument(
+        "--by",
+        nargs="+",
+        choices=["stage", "prod_id", "month", "date"],
+        default=["stage"],
+        help="Group the jobs by these columns [default stage]",
+    )
+    parser.add_argument("--archive-dir", type=Path, help="Job accounting archive directory")
+    parser.add_argument("-o", "--output", type=Path, help="Write the statistics to a CSV file")
+    return parser
+
+
+def main():
+    """Print the statistics of the archived jobs."""
+    opts = job_accounting_argparser().parse_args()
+
+    if opts.verbose:
+        log.setLevel(logging.DEBUG)
+    else:
+        log.setLevel(logging.INFO)
+
+    archive_dir = opts.archive_dir or job_accounting_dir()
+    jobs = read_job_archive(
+        archive_dir, start=opts.start, end=opts.end, stages=opts.stages, prod_ids=opts.prod_ids
+    )
+
+    if jobs.empty:
+        log.info(f"No archived jobs found in {archive_dir}")
+        return
+
+    statistics = job_statistics(jobs, by=opts.by)
+
+    if opts.output:
+        statistics.to_csv(opts.output, index=False)
+        log.info(f"Job statistics written to {opts.output}")
+    else:
+        print(statistics.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
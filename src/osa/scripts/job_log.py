@@ -0,0 +1,80 @@
+"""Extract the log of a subrun from the log container of its run, or pack the task logs."""
+
+import logging
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+
+from osa.configs import options
+from osa.joblogs import compact_job_logs, extract_job_log, job_log_file
+from osa.paths import analysis_path
+from osa.utils.cliopts import common_parser, set_common_globals, set_default_date_if_needed
+from osa.utils.logging import myLogger
+
+__all__ = ["job_log_argparser"]
+
+log = myLogger(logging.getLogger())
+
+
+def job_log_argparser():
+    """Command line parser for the job log containers."""
+    parser = ArgumentParser(
+        description="Print the log of a subrun stored in the log container of its run "
+        "(log/RunXXXXX.joblog), or pack the log files of the array tasks into them",
+        parents=[common_parser],
+    )
+    parser.add_argument(
+        "--stream", choices=["out", "err"], help="Only print the stdout or stderr of the subrun"
+    )
+    parser.add_argument("--job-id", help="Only print the output of this job")
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        default=False,
+        help="Pack the .out and .err files of the array tasks into the log container "
+        "of their run",
+    )
+    parser.add_argument("--log-dir", type=Path, help="Log directory of the night")
+    parser.add_argument("tel_id", choices=["LST1"])
+    parser.add_argument("subrun", nargs="?", help="Run and subrun to print, e.g. 01807.0012")
+    return parser
+
+
+def main():
+    """Print the log of a subrun or pack the task logs of a night."""
+    parser = job_log_argparser()
+    opts = parser.parse_args()
+    set_common_globals(opts)
+
+    if options.verbose:
+        log.setLevel(logging.DEBUG)
+    else:
+        log.setLevel(logging.INFO)
+
+    if not opts.compact and opts.subrun is None:
+        parser.error("either a subrun or --compact is required")
+
+    log_dir = opts.log_dir
+    if log_dir is None:
+        options.date = set_default_date_if_needed()
+        log_dir = analysis_path(options.tel_id) / "log"
+
+    if opts.compact:
+        compact_job_logs(log_dir)
+        return
+
+    run, _, subrun = opts.subrun.partition(".")
+    job_log = job_log_file(log_dir, int(run))
+    if not job_log.exists():
+        log.error(f"Log container {job_log} not found")
+        sys.exit(1)
+
+    content = extract_job_log(job_log, int(subrun or 0), stream=opts.stream, job_id=opts.job_id)
+    if not content:
+        log.warning(f"No output of subrun {opts.subrun} found in {job_log}")
+
+    sys.stdout.buffer.write(content)
+
+
+if __name__ == "__main__":
+    main()
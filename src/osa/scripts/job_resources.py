@@ -0,0 +1,105 @@
+"""Show the memory, walltime and partition predicted for the jobs of each run of a night."""
+
+import logging
+from argparse import ArgumentParser
+
+import pandas as pd
+
+from osa.configs import options
+from osa.configs.config import cfg
+from osa.job import get_sacct_snapshot, get_task_resources, packed_walltime, subruns_per_task
+from osa.nightsummary.nightsummary import run_summary_table
+from osa.paths import analysis_path
+from osa.resources import predict_resources
+from osa.utils.cliopts import common_parser, set_common_globals, set_default_date_if_needed
+from osa.utils.logging import myLogger
+
+__all__ = ["job_resources_argparser", "predict_night_resources"]
+
+log = myLogger(logging.getLogger())
+
+
+def job_resources_argparser():
+    """Command line parser for the job resources predictions."""
+    parser = ArgumentParser(
+        description="Show the resources that would be requested for the jobs of each run",
+        parents=[common_parser],
+    )
+    parser.add_argument("tel_id", choices=["LST1"])
+    return parser
+
+
+def predict_night_resources(usage: pd.DataFrame) -> pd.DataFrame:
+    """
+    Predict the resources of the sequences of each DATA and PEDCALIB run of the night.
+
+    Parameters
+    ----------
+    usage: pd.DataFrame
+        Resources used by previous jobs (see `osa.job.get_task_resources`).
+
+    Returns
+    -------
+    pd.DataFrame
+        Predicted and default requests for each run.
+    """
+    summary = run_summary_table(options.date)
+    runs = summary[(summary["run_type"] == "DATA") | (summary["run_type"] == "PEDCALIB")]
+    walltime = cfg.get("SLURM", "WALLTIME")
+    packing = subruns_per_task()
+    data_walltime = walltime
+    if packing > 1:
+        data_walltime = packed_walltime(packing, cfg.get("SLURM", "PARTITION_DATA"))
+
+    rows = []
+    for run in runs:
+        sequence_type = str(run["run_type"])
+        default_time = data_walltime if sequence_type == "DATA" else walltime
+        resources = predict_resources(
+            sequence_type,
+            usage,
+            run=int(run["run_id"]),
+            default_time=default_time,
+            packing=packing if sequence_type == "DATA" else 1,
+        )
+        rows.append(
+            {
+                "run": int(run["run_id"]),
+                "type": sequence_type,
+                "subruns": int(run["n_subruns"]),
+                "mem_per_cpu": resources.mem_per_cpu,
+                "time": resources.time,
+                "partition": resources.partition,
+                "default_mem": cfg.get("SLURM", f"MEMSIZE_{sequence_type}"),
+                "default_time": default_time,
+                "jobs_accounted": resources.n_samples,
+            }
+        )
+
+    return pd.DataFrame(rows)
+
+
+def main():
+    """Print the predicted requests of the jobs of the night."""
+    opts = job_resources_argparser().parse_args()
+    set_common_globals(opts)
+    options.date = set_default_date_if_needed()
+    options.directory = analysis_path(options.tel_id)
+
+    if options.verbose:
+        log.setLevel(logging.DEBUG)
+    else:
+        log.setLevel(logging.INFO)
+
+    usage = get_sacct_snapshot(parser=get_task_resources)
+    predictions = predict_night_resources(usage)
+
+    if predictions.empty:
+        log.info("No DATA or PEDCALIB runs found in the run summary")
+        return
+
+    print(predictions.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
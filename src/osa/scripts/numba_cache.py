@@ -0,0 +1,75 @@
+"""Populate, show or prune the numba cache shared by the jobs."""
+
+import argparse
+import logging
+import sys
+from argparse import ArgumentParser
+
+from osa.configs import options
+from osa.numbacache import (
+    cpu_key,
+    is_populated,
+    prune_numba_cache,
+    shared_numba_cache,
+    warm_up,
+)
+from osa.utils.cliopts import common_parser, set_common_globals
+from osa.utils.logging import myLogger
+
+__all__ = ["numba_cache_argparser"]
+
+log = myLogger(logging.getLogger())
+
+
+def numba_cache_argparser():
+    """Command line parser for the shared numba cache."""
+    parser = ArgumentParser(
+        description="Show the numba cache shared by the jobs on this node, populate it "
+        "running a command (e.g. the analysis of a subrun) or remove the caches of "
+        "previous software versions",
+        parents=[common_parser],
+    )
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        default=False,
+        help="Remove the caches of the software versions other than the current one",
+    )
+    parser.add_argument("tel_id", choices=["LST1"])
+    parser.add_argument(
+        "command",
+        nargs=argparse.REMAINDER,
+        help="Command compiling the numba functions to cache",
+    )
+    return parser
+
+
+def main():
+    """Populate, show or prune the shared numba cache."""
+    opts = numba_cache_argparser().parse_args()
+    set_common_globals(opts)
+
+    if options.verbose:
+        log.setLevel(logging.DEBUG)
+    else:
+        log.setLevel(logging.INFO)
+
+    directory = shared_numba_cache()
+    if directory is None:
+        log.error("No shared numba cache, set the NUMBA_CACHE_DIR option of the CACHE section")
+        sys.exit(1)
+
+    if opts.prune:
+        for path in prune_numba_cache(directory):
+            log.info(f"Removed numba cache {path}")
+
+    if opts.command:
+        sys.exit(warm_up(opts.command, directory))
+
+    cache_dir = directory / cpu_key()
+    status = "populated" if is_populated(cache_dir) else "not populated"
+    log.info(f"Numba cache of this node: {cache_dir} ({status})")
+
+
+if __name__ == "__main__":
+    main()
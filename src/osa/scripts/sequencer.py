@@ -5,11 +5,14 @@ Orchestrator script that creates and execute the calibration sequence and
 prepares a SLURM job array which launches the data sequences for every subrun.
 """
 
+import fnmatch
 import logging
 import os
-import sys
+import time
 from decimal import Decimal
 import datetime
+from pathlib import Path
+from typing import List
 
 from osa import osadb
 from osa.configs import options
@@ -17,16 +20,25 @@ from osa.configs.config import cfg
 from osa.job import (
     set_queue_values,
     prepare_jobs,
+    resubmit_failed_tasks,
     submit_jobs,
-    get_sacct_output,
+    get_sacct_snapshot,
     get_squeue_output,
-    run_sacct,
+    invalidate_sacct_snapshot,
     run_squeue,
+    shared_sacct_snapshot,
+    throttle_arrays,
+    TERMINAL_JOB_STATES,
 )
+from osa.nightdag import submit_night_dag
 from osa.nightsummary.extract import build_sequences
-from osa.nightsummary.nightsummary import run_summary_table
+from osa.nightsummary.nightsummary import get_run_summary_file, run_summary_table
 from osa.paths import analysis_path
+from osa.progress import progress_counts, progress_file, run_progress
+from osa.resources import io_budget
 from osa.report import start
+from osa.scheduler import get_scheduler
+from osa.speculation import mask_superseded_tasks, speculate_stragglers
 from osa.utils.cliopts import sequencer_cli_parsing
 from osa.utils.logging import myLogger
 from osa.utils.utils import is_day_closed, gettag, date_to_iso
@@ -35,15 +47,41 @@ from osa.scripts.gain_selection import GainSel_finished
 
 __all__ = [
     "single_process",
+    "multi_night_process",
     "update_sequence_status",
     "get_status_for_sequence",
     "output_matrix",
     "report_sequences",
     "update_job_info",
+    "manage_running_sequences",
+    "status_matrix",
+    "watch_night",
+    "directory_files",
+    "live_progress",
 ]
 
 log = myLogger(logging.getLogger())
 
+# Nanoseconds after its last modification during which a directory listing is not reused
+DIRECTORY_SETTLE_TIME = 1_000_000_000
+
+# File names of the analysis directories, with the directory modification
+# time and the time they were listed (see directory_files)
+_DIRECTORY_FILES = {}
+
+# Columns of the status table of each sequence, computed from its output files
+_STATUS_COLUMNS = (
+    "calibstatus",
+    "dl1status",
+    "dl1abstatus",
+    "datacheckstatus",
+    "muonstatus",
+    "dl2status",
+)
+
+# Status columns of each sequence with the size of its progress file when they were computed
+_SEQUENCE_STATUS = {}
+
 
 def main():
     """
@@ -60,11 +98,47 @@ def main():
 
     single_array = ["LST1", "LST2"]
     tag = gettag()
-    start(tag)
-    if options.tel_id in single_array:
-        single_process(options.tel_id)
-    else:
+    if options.tel_id not in single_array:
+        start(tag)
         log.error("Process mode not supported yet")
+    elif len(options.nights) > 1:
+        multi_night_process(options.tel_id, options.nights, tag)
+    else:
+        start(tag)
+        sequence_list = single_process(options.tel_id)
+        if options.watch:
+            watch_night(sequence_list)
+
+
+def multi_night_process(telescope, nights, tag):
+    """
+    Run the single process for several nights within the same process.
+    Each night is processed with its own options, while the configuration,
+    the sacct snapshot and the run summaries read are shared by all of them.
+
+    Parameters
+    ----------
+    telescope : str
+        Options: 'LST1'
+    nights : list of datetime.datetime
+        Dates of the nights to process.
+    tag : str
+        Tag of the script for the header of each night.
+
+    Returns
+    -------
+    sequences : dict
+        List of sequences of each night.
+    """
+    sequences = {}
+    with shared_sacct_snapshot():
+        for date in nights:
+            with options.night_options(date=date):
+                start(tag)
+                sequences[date] = single_process(telescope)
+
+    log.info(f"{len(nights)} nights processed")
+    return sequences
 
 
 def single_process(telescope):
@@ -97,14 +171,14 @@ def single_process(telescope):
     summary_table = run_summary_table(options.date)
     if len(summary_table) == 0:
         log.warning("No runs found for this date. Nothing to do. Exiting.")
-        sys.exit(0)
+        return sequence_list
 
     if not options.no_gainsel and not GainSel_finished(options.date):
         log.info(
             f"Gain selection did not finish successfully for date {date_to_iso(options.date)}. "
             "Try again later, once gain selection has finished."
         )
-        sys.exit()
+        return sequence_list
 
     if is_day_closed():
         log.info(f"Date {date_to_iso(options.date)} is already closed for {options.tel_id}")
@@ -113,16 +187,21 @@ def single_process(telescope):
     if not options.test and not options.simulate:
         if is_sequencer_running(options.date):
             log.info(f"Sequencer is still running for date {date_to_iso(options.date)}. Try again later.")
-            sys.exit(0)
+            manage_running_sequences()
+            return sequence_list
 
         elif is_sequencer_completed(options.date) and not options.force_submit:
             log.info(f"Sequencer already finished for date {date_to_iso(options.date)}. Exiting")
-            sys.exit(0)
+            return sequence_list
 
-        elif timeout_in_sequencer(options.date) and not options.force_submit:
+        elif (
+            timeout_in_sequencer(options.date)
+            and not options.force_submit
+            and not options.resubmit_failed
+        ):
             log.info(f"Some jobs of sequencer finished in TIMEOUT for date {date_to_iso(options.date)}."
-                " Please relaunch the affected sequences manually.")
-            sys.exit(0)
+                " Relaunch the sequencer with --resubmit-failed to resubmit only the failed subruns.")
+            return sequence_list
 
     # Build the sequences
     sequence_list = build_sequences(options.date)
@@ -137,17 +216,53 @@ def single_process(telescope):
     get_closed_list(sequence_list)
     update_sequence_status(sequence_list)
 
-    if not options.no_submit:
+    # Share the I/O budget among the arrays already in the queue
+    throttle_arrays(sequence_list)
+
+    if not options.no_submit and options.resubmit_failed:
+        # Only the array tasks that failed or timed out are submitted again
+        resubmit_failed_tasks(sequence_list)
+
+    elif not options.no_submit:
         submit_jobs(sequence_list)
 
+        # Submit also the post-processing of the night depending on the sequences
+        if cfg.getboolean("SLURM", "NIGHT_DAG", fallback=False):
+            submit_night_dag(sequence_list)
+
+    if not options.no_submit:
+        # Duplicate the array tasks lagging far behind the rest of their sequence
+        speculate_stragglers(sequence_list)
+
     # TODO: insert_new_activity_db(sequence_list)
 
     # Display the sequencer table with processing status
     report_sequences(sequence_list)
 
+    # Jobs run by the local scheduler must finish before the sequencer exits
+    get_scheduler().wait()
+
     return sequence_list
 
 
+def manage_running_sequences():
+    """
+    Keep managing the jobs of the night while the sequencer is running:
+    share the I/O budget among the arrays still in the queue and duplicate
+    their straggling tasks (unless --no-submit).
+    """
+    speculate = cfg.getboolean("SLURM", "SPECULATIVE_EXECUTION", fallback=False)
+    if io_budget() is None and not speculate:
+        return
+
+    sequence_list = build_sequences(options.date)
+    update_job_info(sequence_list)
+    throttle_arrays(sequence_list)
+
+    if not options.no_submit:
+        speculate_stragglers(sequence_list)
+
+
 def update_job_info(sequence_list):
     """
     Updates the job information from SLURM
@@ -160,10 +275,9 @@ def update_job_info(sequence_list):
     if options.test:
         return
 
-    sacct_output, squeue_output = run_sacct(), run_squeue()
     set_queue_values(
-        sacct_info=get_sacct_output(sacct_output),
-        squeue_info=get_squeue_output(squeue_output),
+        sacct_info=get_sacct_snapshot(),
+        squeue_info=get_squeue_output(run_squeue()),
         sequence_list=sequence_list,
     )
 
@@ -177,8 +291,26 @@ def update_sequence_status(seq_list):
     ----------
     seq_list
         List of sequences of a given night corresponding to each run.
+
+    Notes
+    -----
+    The jobs append a record to the progress file of their run whenever an
+    analysis stage finishes, so the output files of a sequence are only
+    counted again if its progress file grew since they were last counted.
     """
     for seq in seq_list:
+        key = (Path(options.directory), seq.run)
+        try:
+            progress_size = progress_file(f"{seq.run:05d}", options.directory).stat().st_size
+        except FileNotFoundError:
+            progress_size = None
+
+        cached = _SEQUENCE_STATUS.get(key)
+        if progress_size is not None and cached is not None and cached[0] == progress_size:
+            for column, value in cached[1].items():
+                setattr(seq, column, value)
+            continue
+
         if seq.type == "PEDCALIB":
             seq.calibstatus = int(
                 Decimal(get_status_for_sequence(seq, "CALIB") * 100) / seq.subruns
@@ -194,6 +326,11 @@ def update_sequence_status(seq_list):
             seq.muonstatus = int(Decimal(get_status_for_sequence(seq, "MUON") * 100) / seq.subruns)
             seq.dl2status = int(Decimal(get_status_for_sequence(seq, "DL2") * 100) / seq.subruns)
 
+        _SEQUENCE_STATUS[key] = (
+            progress_size,
+            {column: getattr(seq, column, None) for column in _STATUS_COLUMNS},
+        )
+
 
 def get_status_for_sequence(sequence, data_level) -> int:
     """
@@ -211,28 +348,76 @@ def get_status_for_sequence(sequence, data_level) -> int:
     """
     if data_level == "DL1AB":
         directory = options.directory / options.dl1_prod_id
-        files = list(directory.glob(f"dl1_LST-1*{sequence.run}*.h5"))
+        pattern = f"dl1_LST-1*{sequence.run}*.h5"
 
     elif data_level == "DL2":
         directory = options.directory / options.dl2_prod_id
-        files = list(directory.glob(f"dl2_LST-1*{sequence.run}*.h5"))
+        pattern = f"dl2_LST-1*{sequence.run}*.h5"
 
     elif data_level == "DATACHECK":
         directory = options.directory / options.dl1_prod_id
-        files = list(directory.glob(f"datacheck_dl1_LST-1*{sequence.run}*.h5"))
+        pattern = f"datacheck_dl1_LST-1*{sequence.run}*.h5"
 
     else:
         prefix = cfg.get("PATTERN", f"{data_level}PREFIX")
         suffix = cfg.get("PATTERN", f"{data_level}SUFFIX")
-        files = list(options.directory.glob(f"{prefix}*{sequence.run}*{suffix}"))
+        directory = options.directory
+        pattern = f"{prefix}*{sequence.run}*{suffix}"
+
+    return len(fnmatch.filter(directory_files(Path(directory)), pattern))
+
 
-    return len(files)
+def directory_files(directory: Path) -> List[str]:
+    """
+    Names of the files in a directory. The directory is only listed again
+    if its modification time changed, or if it was modified right before
+    it was last listed, so that no file created meanwhile is missed.
+    """
+    try:
+        mtime = directory.stat().st_mtime_ns
+    except FileNotFoundError:
+        return []
+
+    cached = _DIRECTORY_FILES.get(directory)
+    if cached is None or cached[0] != mtime or mtime >= cached[1] - DIRECTORY_SETTLE_TIME:
+        cached = (mtime, time.time_ns(), os.listdir(directory))
+        _DIRECTORY_FILES[directory] = cached
+
+    return cached[2]
+
+
+def live_progress(sequence_list) -> dict:
+    """
+    Number of subruns of each sequence by status (running, done, failed and
+    stale) according to the heartbeats in the progress file of its run.
+    Sequences without progress file are not included.
+    """
+    progress = {}
+    for sequence in sequence_list:
+        records = run_progress(f"{sequence.run:05d}", options.directory)
+        if records:
+            progress[sequence.run] = progress_counts(records)
+
+    return progress
 
 
 def report_sequences(sequence_list):
     """
     Update the status report table shown by the sequencer.
 
+    Parameters
+    ----------
+    sequence_list: list
+        List of sequences of a given date
+    """
+    padding = int(cfg.get("OUTPUT", "PADDING"))
+    output_matrix(status_matrix(sequence_list), padding)
+
+
+def status_matrix(sequence_list) -> list:
+    """
+    Build the rows of the status table of the sequences, header included.
+
     Parameters
     ----------
     sequence_list: list
@@ -286,8 +471,85 @@ def report_sequences(sequence_list):
             )
 
         matrix.append(row_list)
+
+    return matrix
+
+
+def watch_night(sequence_list, interval: float = None, max_iterations: int = None):
+    """
+    Keep following the processing of the night, showing the status table
+    only when it changes. Every `interval` seconds only what changed is
+    evaluated again: the sequences are only built again if the run summary
+    changed, the analysis directories are only listed again if they were
+    modified and sacct is polled incrementally through a journal of the night.
+    It stops once the night is closed or all the sequence jobs finished.
+
+    Parameters
+    ----------
+    sequence_list: list
+        Sequences of the night.
+    interval: float, optional
+        Seconds between evaluations, by default the WATCH_INTERVAL option.
+    max_iterations: int, optional
+        Maximum number of evaluations, unlimited by default.
+    """
+    if interval is None:
+        interval = cfg.getfloat("SLURM", "WATCH_INTERVAL", fallback=300)
+
+    if not cfg.get("SLURM", "SACCT_JOURNAL", fallback=None):
+        options.sacct_journal = options.log_directory / "sacct_journal.csv"
+
+    summary_file = get_run_summary_file(options.date)
+    summary_mtime = summary_file.stat().st_mtime_ns if summary_file.exists() else None
     padding = int(cfg.get("OUTPUT", "PADDING"))
-    output_matrix(matrix, padding)
+    previous_matrix = status_matrix(sequence_list) if sequence_list else None
+    previous_progress = {}
+    iteration = 0
+
+    log.info(f"Watching the night {date_to_iso(options.date)} every {interval:.0f} s")
+
+    try:
+        while not is_day_closed() and (max_iterations is None or iteration < max_iterations):
+            iteration += 1
+            time.sleep(interval)
+
+            mtime = summary_file.stat().st_mtime_ns if summary_file.exists() else None
+            if mtime != summary_mtime or not sequence_list:
+                log.debug("Run summary changed, building the sequences again")
+                sequence_list = build_sequences(options.date)
+                summary_mtime = mtime
+
+            invalidate_sacct_snapshot()
+            update_job_info(sequence_list)
+            update_sequence_status(sequence_list)
+            throttle_arrays(sequence_list)
+            speculate_stragglers(sequence_list)
+
+            matrix = status_matrix(sequence_list)
+            if matrix != previous_matrix:
+                output_matrix(matrix, padding)
+                previous_matrix = matrix
+
+            progress = live_progress(sequence_list)
+            for run, counts in progress.items():
+                if counts != previous_progress.get(run):
+                    log.info(
+                        f"Run {run:05d}: {counts['running']} subruns running, "
+                        f"{counts['done']} done, {counts['failed']} failed, "
+                        f"{counts['stale']} without recent heartbeat"
+                    )
+            previous_progress = progress
+
+            if sequence_list and all(
+                sequence.state in TERMINAL_JOB_STATES for sequence in sequence_list
+            ):
+                log.info("All the sequence jobs finished")
+                break
+
+    except KeyboardInterrupt:
+        log.info("Stopped watching the night")
+
+    return sequence_list
 
 
 def output_matrix(matrix: list, padding_space: int):
@@ -324,8 +586,7 @@ def output_matrix(matrix: list, padding_space: int):
 def is_sequencer_running(date: datetime.datetime) -> bool:
     """Check if the jobs launched by sequencer are running or pending for the given date."""
     summary_table = run_summary_table(date)
-    sacct_output = run_sacct()
-    sacct_info = get_sacct_output(sacct_output)
+    sacct_info = get_sacct_snapshot()
 
     for run in summary_table["run_id"]:
         jobs_run = sacct_info[sacct_info["JobName"]==f"LST1_{run:05d}"]
@@ -340,8 +601,8 @@ def is_sequencer_completed(date: datetime.datetime) -> bool:
     """Check if the jobs launched by sequencer are already completed."""
     summary_table = run_summary_table(date)
     data_runs = summary_table[summary_table["run_type"] == "DATA"]
-    sacct_output = run_sacct()
-    sacct_info = get_sacct_output(sacct_output)
+    # The tasks superseded by their speculative execution processed their subruns
+    sacct_info = mask_superseded_tasks(get_sacct_snapshot())
 
     for run in data_runs["run_id"]:
         jobs_run = sacct_info[sacct_info["JobName"]==f"LST1_{run:05d}"]
@@ -359,8 +620,8 @@ def timeout_in_sequencer(date: datetime.datetime) -> bool:
     """Check if any of the jobs launched by sequencer finished in timeout."""
     summary_table = run_summary_table(date)
     data_runs = summary_table[summary_table["run_type"] == "DATA"]
-    sacct_output = run_sacct()
-    sacct_info = get_sacct_output(sacct_output)
+    # The tasks superseded by their speculative execution processed their subruns
+    sacct_info = mask_superseded_tasks(get_sacct_snapshot())
 
     for run in data_runs["run_id"]:
         jobs_run = sacct_info[sacct_info["JobName"]==f"LST1_{run:05d}"]
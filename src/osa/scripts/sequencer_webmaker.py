@@ -13,9 +13,10 @@ import pandas as pd
 
 from osa.configs import options
 from osa.configs.config import cfg
+from osa.progress import night_progress, progress_counts
 from osa.utils.cliopts import sequencer_webmaker_argparser
 from osa.utils.logging import myLogger
-from osa.utils.utils import is_day_closed, date_to_iso, date_to_dir
+from osa.utils.utils import is_day_closed, date_to_iso, date_to_dir, get_prod_id
 
 log = myLogger(logging.getLogger())
 
@@ -117,6 +118,36 @@ def matrix_to_html(matrix: list) -> str:
     return df.to_html(index=False)
 
 
+def progress_to_html(directory: Path) -> str:
+    """
+    Build the html table with the live progress of the runs of the night,
+    read from the heartbeats in their progress files.
+    """
+    rows = []
+    for run, records in night_progress(directory).items():
+        if not records:
+            continue
+        counts = progress_counts(records)
+        last_heartbeat = max(record.time for record in records.values())
+        rows.append(
+            [
+                run,
+                counts["running"],
+                counts["done"],
+                counts["failed"],
+                counts["stale"],
+                last_heartbeat.replace("T", " "),
+            ]
+        )
+
+    if not rows:
+        return ""
+
+    columns = ["Run", "Running", "Done", "Failed", "No heartbeat", "Last heartbeat (UTC)"]
+    df = pd.DataFrame(rows, columns=columns)
+    return f"<h2>Live progress of the subruns</h2>\n{df.to_html(index=False)}"
+
+
 def main():
     """Produce the html file with the processing status from the sequencer report."""
 
@@ -153,6 +184,10 @@ def main():
     matrix = lines_to_matrix(lines)
     html_table = matrix_to_html(matrix)
 
+    # Add the live progress of the runs being processed, if any
+    analysis_dir = Path(cfg.get("LST1", "ANALYSIS_DIR")) / flat_date / get_prod_id()
+    html_table += progress_to_html(analysis_dir)
+
     # Save the HTML file
     log.info("Saving the HTML file")
     directory = Path(cfg.get("LST1", "SEQUENCER_WEB_DIR"))
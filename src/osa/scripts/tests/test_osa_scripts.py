@@ -25,6 +25,10 @@ ALL_SCRIPTS = [
     "source_coordinates",
     "sequencer_webmaker",
     "gainsel_webmaker",
+    "job_resources",
+    "job_accounting",
+    "job_log",
+    "numba_cache",
 ]
 
 options.date = datetime.datetime.fromisoformat("2020-01-17")
@@ -163,6 +167,39 @@ def test_sequencer(sequence_file_list):
         assert sequence_file.exists()
 
 
+def test_directory_files(tmp_path):
+    from osa.scripts.sequencer import directory_files
+
+    (tmp_path / "dl1_LST-1.Run01807.0000.h5").touch()
+    assert directory_files(tmp_path) == ["dl1_LST-1.Run01807.0000.h5"]
+    # Just modified directories are listed again
+    (tmp_path / "dl1_LST-1.Run01807.0001.h5").touch()
+    assert len(directory_files(tmp_path)) == 2
+    assert directory_files(tmp_path / "missing") == []
+
+
+def test_watch_night(monkeypatch, tmp_path, sequence_list, running_analysis_dir):
+    import osa.scripts.sequencer as sequencer
+
+    shown = []
+    monkeypatch.setattr(sequencer, "output_matrix", lambda matrix, padding: shown.append(matrix))
+    monkeypatch.setattr(sequencer, "is_day_closed", lambda: False)
+    monkeypatch.setattr(options, "date", datetime.datetime(2020, 1, 17))
+    monkeypatch.setattr(options, "directory", running_analysis_dir)
+    monkeypatch.setattr(options, "dl1_prod_id", cfg.get("LST1", "DL1_PROD_ID"))
+    monkeypatch.setattr(options, "dl2_prod_id", cfg.get("LST1", "DL2_PROD_ID"))
+    monkeypatch.setattr(options, "log_directory", tmp_path)
+    monkeypatch.setattr(options, "sacct_journal", None)
+    monkeypatch.setattr(options, "test", True)
+
+    sequencer.update_sequence_status(sequence_list)
+    sequencer.watch_night(sequence_list, interval=0, max_iterations=3)
+
+    # Nothing changed, so the status table is not shown again
+    assert shown == []
+    assert options.sacct_journal == tmp_path / "sacct_journal.csv"
+
+
 def test_autocloser(running_analysis_dir):
     result = run_program(
         "autocloser",
@@ -371,6 +408,19 @@ def test_no_runs_found():
     assert "No runs found for this date. Nothing to do. Exiting." in output.stderr.splitlines()[-1]
 
 
+def test_empty_dates_file(tmp_path):
+    dates_file = tmp_path / "dates.txt"
+    dates_file.write_text("# No nights yet\n")
+    output = sp.run(
+        ["sequencer", "-s", "--dates-file", str(dates_file), "LST1"],
+        text=True,
+        stdout=sp.PIPE,
+        stderr=sp.PIPE,
+    )
+    assert output.returncode == 2
+    assert f"No dates found in the dates file {dates_file}" in output.stderr
+
+
 @pytest.mark.skip(reason="Currently not working with all combinations")
 def test_sequencer_webmaker(
     run_summary,
@@ -0,0 +1,489 @@
+"""
+Speculative re-execution of the straggling array tasks of the data sequences.
+
+A running task lasting SPECULATION_MULTIPLIER times longer than the median of
+the completed tasks of its sequence, once a SPECULATION_QUANTILE fraction of
+them completed, is duplicated by a speculative job. It processes the same
+subruns in an isolated directory (speculative/RRRRR.SSSS within the analysis
+directory) and whichever finishes first is kept:
+
+- if the speculative job succeeds while the original task still runs, it
+  cancels the task and moves its outputs to the analysis directory. The history
+  files are moved last, so that the subruns only appear as processed once all
+  their outputs are in place.
+- if the original task completes first, the speculative job is cancelled by
+  the sequencer (or discards its own outputs if it also finished).
+"""
+
+import logging
+import math
+import os
+import shutil
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import pandas as pd
+
+from osa.configs import options
+from osa.configs.config import cfg
+from osa.job import (
+    PILOT_SCRIPT_TEMPLATE,
+    TAB,
+    TERMINAL_JOB_STATES,
+    data_sequence_arguments,
+    get_job_resources,
+    get_sacct_snapshot,
+    get_squeue_output,
+    invalidate_sacct_snapshot,
+    job_script_context,
+    python_numba_cache,
+    read_submission_manifest,
+    record_submission,
+    run_squeue,
+    submission_manifest_file,
+    subruns_per_task,
+    write_job_script,
+)
+from osa.paths import get_pedestal_ids_file
+from osa.scheduler import get_scheduler, read_sbatch_directives
+from osa.utils.logging import myLogger
+
+__all__ = [
+    "SpeculativeJob",
+    "speculative_directory",
+    "sequence_job_ids",
+    "find_stragglers",
+    "speculative_job_template",
+    "submit_speculative_jobs",
+    "job_states",
+    "superseded_array_tasks",
+    "mask_superseded_tasks",
+    "sequence_array_completed",
+    "cancel_speculative_losers",
+    "speculate_stragglers",
+    "array_task_state",
+    "promote_speculative_outputs",
+    "settle_speculative_task",
+]
+
+log = myLogger(logging.getLogger(__name__))
+
+SPECULATIVE_JOB_TYPE = "SPECULATIVE"
+
+# Directives of the sequence job replaced or dropped in the speculative one
+REPLACED_DIRECTIVES = {"--job-name", "--chdir", "--array", "--output", "--error", "--open-mode"}
+
+# Seconds waiting for a cancelled task to end and between the checks of its state
+CANCEL_TIMEOUT = 300
+CANCEL_POLL_INTERVAL = 10
+
+
+@dataclass
+class SpeculativeJob:
+    """Speculative execution of an array task of a data sequence."""
+
+    sequence: object
+    task_id: str
+    subrun: int
+    n_subruns: int
+    type: str = SPECULATIVE_JOB_TYPE
+
+    @property
+    def jobname(self) -> str:
+        return f"{self.sequence.jobname}.{self.subrun:04d}_spec"
+
+    @property
+    def run_str(self) -> str:
+        return f"{self.sequence.run:05d}.{self.subrun:04d}"
+
+    @property
+    def script(self) -> Path:
+        return Path(options.directory) / f"speculative_{options.tel_id}_{self.run_str}.py"
+
+
+def speculative_directory(directory: Path, run_str: str) -> Path:
+    """Isolated directory of the outputs of a speculative execution."""
+    return Path(directory) / "speculative" / run_str
+
+
+def sequence_job_ids(sequence) -> List[str]:
+    """IDs of the arrays submitted this night for a data sequence, according to the manifest."""
+    record = read_submission_manifest(submission_manifest_file()).get(sequence.jobname, {})
+    if "jobid" not in record:
+        return []
+
+    return [str(job_id) for job_id in [*record.get("previous_jobids", []), record["jobid"]]]
+
+
+def find_stragglers(
+    sequence,
+    usage: pd.DataFrame,
+    squeue_info: pd.DataFrame,
+    job_ids: Optional[Iterable[str]] = None,
+) -> Dict[int, int]:
+    """
+    Find the running array tasks of a data sequence lasting longer than
+    SPECULATION_MULTIPLIER times the median runtime of its completed tasks,
+    once a SPECULATION_QUANTILE fraction of them completed. Only the arrays
+    submitted this night for the sequence are considered, not those of
+    earlier submissions of the run.
+
+    Parameters
+    ----------
+    sequence: sequence object
+    usage: pd.DataFrame
+        Resources used by the jobs (see `osa.job.get_job_resources`).
+    squeue_info: pd.DataFrame
+        Jobs in the queue (see `osa.job.get_squeue_output`).
+    job_ids: list of str, optional
+        IDs of the arrays of the sequence, by default those in the
+        submission manifest (see `sequence_job_ids`).
+
+    Returns
+    -------
+    stragglers: dict
+        Elapsed time in seconds of the straggling tasks keyed by array index.
+    """
+    multiplier = cfg.getfloat("SLURM", "SPECULATION_MULTIPLIER", fallback=2.0)
+    quantile = cfg.getfloat("SLURM", "SPECULATION_QUANTILE", fallback=0.75)
+    n_tasks = math.ceil(sequence.subruns / subruns_per_task())
+    job_ids = set(sequence_job_ids(sequence) if job_ids is None else job_ids)
+
+    completed = usage[
+        (usage["JobName"] == sequence.jobname)
+        & (usage["State"] == "COMPLETED")
+        & usage["JobID"].str.split("_").str[0].isin(job_ids)
+    ]
+    if completed.empty or len(completed) < quantile * n_tasks:
+        return {}
+
+    threshold = multiplier * completed["Elapsed"].median()
+    running = squeue_info[
+        (squeue_info["JobName"] == sequence.jobname)
+        & (squeue_info["State"] == "RUNNING")
+        & squeue_info["ArrayIndex"].notna()
+        & squeue_info["JobID"].astype(str).isin(job_ids)
+    ]
+    return {
+        int(array_index): int(elapsed)
+        for array_index, elapsed in zip(running["ArrayIndex"], running["CPUTimeRAW"])
+        if array_index.isdigit() and elapsed > threshold
+    }
+
+
+def speculative_job_template(job: SpeculativeJob, context) -> str:
+    """
+    Write the pilot script of a speculative job and return its content. The job
+    has the resources of the sequence and runs datasequence with its outputs
+    in the speculative directory of the subruns.
+    """
+    sequence = job.sequence
+    directives = read_sbatch_directives(sequence.script) if sequence.script.exists() else {}
+    sbatch_parameters = [
+        f"--job-name={job.jobname}",
+        f"--chdir={options.directory}",
+        f"--output=log/Run{job.run_str}_speculative_%j.out",
+        f"--error=log/Run{job.run_str}_speculative_%j.err",
+    ]
+    sbatch_parameters.extend(
+        option if value is None else f"{option}={value}"
+        for option, value in directives.items()
+        if option not in REPLACED_DIRECTIVES
+    )
+
+    commandargs = [f"'{arg}'" for arg in data_sequence_arguments(sequence, context)]
+    if sequence.run in context.pedestal_ids_runs:
+        pedestal_ids_file = get_pedestal_ids_file(sequence.run, context.flat_date)
+        commandargs.append(f"f'--pedestal-ids-file={pedestal_ids_file}'")
+    if job.n_subruns > 1:
+        commandargs.append(f"'--n-subruns={job.n_subruns}'")
+    commandargs.extend(
+        (
+            f"'--output-dir={speculative_directory(options.directory, job.run_str)}'",
+            f"'--speculative-of={job.task_id}'",
+            f"'{job.run_str}'",
+        )
+    )
+
+    numba_import, numba_cache = python_numba_cache(context)
+    content = PILOT_SCRIPT_TEMPLATE.substitute(
+        header="#!/bin/env python\n\n" + "\n".join("#SBATCH " + line for line in sbatch_parameters),
+        setup=f"{numba_import}{context.cache_dirs}\nsubruns = {job.subrun}\n",
+        numba_cache=numba_cache,
+        arguments="".join(f"{TAB * 2}{arg},\n" for arg in commandargs),
+        tel_id=options.tel_id,
+        run="subprocess.run",
+        run_options="",
+    )
+
+    if not options.simulate:
+        write_job_script(job.script, content)
+
+    return content
+
+
+def submit_speculative_jobs(sequence_list) -> Dict[str, str]:
+    """
+    Submit a speculative job for each straggling task of the data
+    sequences (see `find_stragglers`) not already duplicated.
+
+    Returns
+    -------
+    job_ids: dict
+        Job IDs of the speculative jobs keyed by job name.
+    """
+    manifest = submission_manifest_file()
+    records = read_submission_manifest(manifest)
+    usage = get_sacct_snapshot(parser=get_job_resources)
+    squeue_info = get_squeue_output(run_squeue())
+    retries = cfg.getint("SLURM", "SUBMIT_RETRIES", fallback=3)
+    packing = subruns_per_task()
+    context = None
+    job_ids = {}
+
+    for sequence in sequence_list:
+        if sequence.type != "DATA" or sequence.jobid is None:
+            continue
+
+        for task, elapsed in find_stragglers(sequence, usage, squeue_info).items():
+            subrun = task * packing
+            job = SpeculativeJob(
+                sequence,
+                task_id=f"{sequence.jobid}_{task}",
+                subrun=subrun,
+                n_subruns=min(packing, sequence.subruns - subrun),
+            )
+            if job.jobname in records:
+                continue
+
+            log.info(
+                f"Array task {job.task_id} of {sequence.jobname} running for {elapsed} s, "
+                f"submitting a speculative execution of subrun {job.run_str}"
+            )
+            context = context or job_script_context()
+            speculative_job_template(job, context)
+            token = f"osa:{job.jobname}:{uuid.uuid4().hex[:12]}"
+            job_id = get_scheduler().submit(
+                ["sbatch", "--parsable", str(job.script)], token, retries=retries
+            )
+            if job_id is not None:
+                record_submission(manifest, job, job_id, task=job.task_id, run_str=job.run_str)
+                job_ids[job.jobname] = job_id
+
+    if job_ids:
+        invalidate_sacct_snapshot()
+
+    return job_ids
+
+
+def job_states(sacct_info: pd.DataFrame) -> Dict[Tuple[str, str], str]:
+    """State of the jobs and array tasks in the sacct output keyed by ID (e.g. 1234_5) and name."""
+    states = {}
+    for job_id, array_index, name, state in zip(
+        sacct_info["JobID"], sacct_info["ArrayIndex"], sacct_info["JobName"], sacct_info["State"]
+    ):
+        task_id = f"{job_id}_{array_index}" if isinstance(array_index, str) else str(job_id)
+        states[(task_id, str(name))] = str(state).split()[0]
+
+    return states
+
+
+def superseded_array_tasks(sacct_info: pd.DataFrame) -> Set[Tuple[int, str]]:
+    """
+    Array tasks cancelled once their speculative execution completed,
+    as (job ID, array index) pairs. Their subruns were processed.
+    """
+    states = job_states(sacct_info)
+    superseded = set()
+    for jobname, record in read_submission_manifest(submission_manifest_file()).items():
+        if (
+            record.get("type") == SPECULATIVE_JOB_TYPE
+            and states.get((record["jobid"], jobname)) == "COMPLETED"
+        ):
+            job_id, _, array_index = record["task"].partition("_")
+            superseded.add((int(job_id), array_index))
+
+    return superseded
+
+
+def mask_superseded_tasks(
+    job_info: pd.DataFrame, sacct_info: Optional[pd.DataFrame] = None
+) -> pd.DataFrame:
+    """
+    Mark as COMPLETED the array tasks cancelled once their speculative
+    execution completed (see `superseded_array_tasks`), since their subruns
+    were processed. The jobs are returned unchanged unless SPECULATIVE_EXECUTION is set.
+
+    Parameters
+    ----------
+    job_info: pd.DataFrame
+        Jobs with the JobID, ArrayIndex and State columns.
+    sacct_info: pd.DataFrame, optional
+        sacct output with the state of the speculative jobs, `job_info` by default.
+    """
+    if not cfg.getboolean("SLURM", "SPECULATIVE_EXECUTION", fallback=False):
+        return job_info
+
+    superseded = superseded_array_tasks(job_info if sacct_info is None else sacct_info)
+    if not superseded:
+        return job_info
+
+    mask = [
+        (job_id, array_index) in superseded
+        for job_id, array_index in zip(job_info["JobID"], job_info["ArrayIndex"])
+    ]
+    return job_info.assign(State=job_info["State"].astype(str).mask(mask, "COMPLETED"))
+
+
+def sequence_array_completed(sequence) -> bool:
+    """
+    Whether all the tasks of the array job submitted for a data sequence
+    completed, counting those superseded by their speculative execution.
+    """
+    record = read_submission_manifest(submission_manifest_file()).get(sequence.jobname)
+    if record is None:
+        return False
+
+    sacct_info = mask_superseded_tasks(get_sacct_snapshot())
+    tasks = sacct_info[
+        (sacct_info["JobID"] == int(record["jobid"]))
+        & (sacct_info["JobName"] == sequence.jobname)
+    ]
+    return not tasks.empty and bool((tasks["State"].astype(str) == "COMPLETED").all())
+
+
+def cancel_speculative_losers() -> list:
+    """
+    Cancel the speculative jobs still queued whose original task completed
+    first, and remove the outputs left by the finished or cancelled ones.
+
+    Returns
+    -------
+    cancelled: list
+        Job names of the speculative jobs cancelled.
+    """
+    states = job_states(get_sacct_snapshot())
+    cancelled = []
+
+    for jobname, record in read_submission_manifest(submission_manifest_file()).items():
+        if record.get("type") != SPECULATIVE_JOB_TYPE:
+            continue
+
+        output_dir = speculative_directory(options.directory, record["run_str"])
+        original_state = states.get((record["task"], jobname.rsplit(".", 1)[0]))
+        state = states.get((record["jobid"], jobname))
+
+        if state in TERMINAL_JOB_STATES:
+            shutil.rmtree(output_dir, ignore_errors=True)
+        elif original_state == "COMPLETED":
+            log.info(f"Array task {record['task']} finished first, cancelling {jobname}")
+            get_scheduler().cancel(record["jobid"])
+            shutil.rmtree(output_dir, ignore_errors=True)
+            cancelled.append(jobname)
+
+    return cancelled
+
+
+def speculate_stragglers(sequence_list) -> Dict[str, str]:
+    """
+    Cancel the speculative executions already overtaken by their original
+    task and duplicate the new straggling tasks, if SPECULATIVE_EXECUTION is set.
+
+    Returns
+    -------
+    job_ids: dict
+        Job IDs of the speculative jobs submitted keyed by job name.
+    """
+    if (
+        not cfg.getboolean("SLURM", "SPECULATIVE_EXECUTION", fallback=False)
+        or options.test
+        or options.simulate
+    ):
+        return {}
+
+    cancel_speculative_losers()
+    return submit_speculative_jobs(sequence_list)
+
+
+def array_task_state(task_id: str) -> Optional[str]:
+    """State of an array task (e.g. 1234_5) according to the scheduler set in the config file."""
+    job_id, _, array_index = task_id.partition("_")
+    sacct_info = get_sacct_snapshot(max_age=0)
+    task = sacct_info[
+        (sacct_info["JobID"] == int(job_id))
+        & (sacct_info["ArrayIndex"] == array_index)
+        & (sacct_info["JobName"] != "batch")
+    ]
+    if task.empty:
+        return None
+
+    return str(task["State"].iloc[-1]).split()[0]
+
+
+def promote_speculative_outputs(output_dir: Path, directory: Path) -> None:
+    """
+    Move the outputs of a speculative execution to the analysis directory,
+    replacing those of the cancelled task. History files are moved last.
+    """
+    files = sorted(path for path in output_dir.rglob("*") if path.is_file())
+    files.sort(key=lambda path: path.suffix == ".history")
+    for file in files:
+        destination = directory / file.relative_to(output_dir)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(file, destination)
+
+    shutil.rmtree(output_dir, ignore_errors=True)
+
+
+def settle_speculative_task(
+    rc: int, task_id: str, output_dir: Path, directory: Path, timeout: float = CANCEL_TIMEOUT
+) -> int:
+    """
+    Keep the outputs of a finished speculative execution if it succeeded
+    before the original task, which is then cancelled. Otherwise they are discarded.
+
+    Parameters
+    ----------
+    rc: int
+        Return code of the speculative execution.
+    task_id: str
+        Original array task, e.g. 1234_5.
+    output_dir: Path
+        Directory of the outputs of the speculative execution.
+    directory: Path
+        Analysis directory.
+    timeout: float
+        Seconds waiting for the cancelled task to end.
+
+    Returns
+    -------
+    rc: int
+        Return code of the speculative job.
+    """
+    if rc != 0:
+        log.warning(f"Speculative execution of task {task_id} failed, discarding it")
+        shutil.rmtree(output_dir, ignore_errors=True)
+        return rc
+
+    if array_task_state(task_id) == "COMPLETED":
+        log.info(f"Array task {task_id} finished first, discarding the speculative outputs")
+        shutil.rmtree(output_dir, ignore_errors=True)
+        return 0
+
+    log.info(f"Speculative execution finished first, cancelling array task {task_id}")
+    get_scheduler().cancel(task_id)
+
+    # The outputs are only moved once the task can no longer write them
+    deadline = time.monotonic() + timeout
+    while array_task_state(task_id) not in TERMINAL_JOB_STATES:
+        if time.monotonic() > deadline:
+            log.error(f"Array task {task_id} did not end, discarding the speculative outputs")
+            shutil.rmtree(output_dir, ignore_errors=True)
+            return 1
+        time.sleep(CANCEL_POLL_INTERVAL)
+
+    promote_speculative_outputs(output_dir, directory)
+    return 0
@@ -0,0 +1,58 @@
+from datetime import datetime
+from io import StringIO
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+
+def test_job_accounting_archive(tmp_path):
+    from osa.accounting import (
+        archive_night_jobs,
+        history_job_records,
+        job_statistics,
+        read_job_archive,
+        sacct_job_records,
+    )
+    from osa.job import get_job_resources
+
+    usage = get_job_resources(
+        StringIO(
+            "12_0,LST1_01807,,,00:10:00,,,COMPLETED,0:0\n"
+            "12_0.batch,batch,,,00:10:00,,2G,COMPLETED,0:0\n"
+            "12_1,LST1_01807,,,00:30:00,,,OUT_OF_MEMORY,0:125\n"
+            "12_1.batch,batch,,,00:30:00,,4G,OUT_OF_MEMORY,0:125\n"
+            "13,LST1_01809,,,00:05:00,,,COMPLETED,0:0\n"
+            "14,LST1_02000,,,00:05:00,,,COMPLETED,0:0\n"
+        )
+    )
+    jobs = sacct_job_records(usage, runs=[1807, 1809])
+    assert jobs["subrun"].tolist()[:2] == [0, 1]
+    # Array tasks processing several subruns each
+    packed_jobs = sacct_job_records(usage, [1807, 1809], {1807: 4}, {1807: 6, 1809: 1})
+    assert packed_jobs["subrun"].tolist()[:2] == [0, 4]
+    assert packed_jobs["subruns"].tolist()[:2] == [4, 2]
+    assert packed_jobs["subruns"].isna().tolist()[2]
+    history_file = Path("./extra/history_files/sequence_LST1_04183.history")
+    jobs = pd.concat([jobs, history_job_records([history_file])], ignore_index=True)
+
+    files = archive_night_jobs(jobs, datetime(2020, 1, 17), "v0.1.0", tmp_path)
+    assert tmp_path / "date=2020-01-17/stage=DATA/prod_id=v0.1.0/jobs.parquet" in files
+    # Archiving the night again replaces its jobs
+    archive_night_jobs(jobs, datetime(2020, 1, 17), "v0.1.0", tmp_path)
+    archive_night_jobs(jobs, datetime(2020, 2, 15), "v0.2.0", tmp_path)
+
+    archived_jobs = read_job_archive(tmp_path)
+    assert len(archived_jobs) == 2 * len(jobs)
+    assert len(read_job_archive(tmp_path, start=datetime(2020, 2, 1))) == len(jobs)
+    assert len(read_job_archive(tmp_path, prod_ids=["v0.1.0"], stages=["DATA"])) == 2
+    assert read_job_archive(tmp_path, stages=["unknown"]).empty
+
+    statistics = job_statistics(archived_jobs, by=["month", "stage"]).set_index(
+        ["month", "stage"]
+    )
+    assert statistics.loc[("2020-01", "DATA"), "jobs"] == 2
+    assert statistics.loc[("2020-01", "DATA"), "runtime_p50"] == 1200
+    assert statistics.loc[("2020-01", "DATA"), "memory_p95"] == pytest.approx(3.9)
+    assert statistics.loc[("2020-01", "DATA"), "failure_rate"] == 0.5
+    assert statistics.loc[("2020-02", "PEDCALIB"), "failure_rate"] == 0
@@ -0,0 +1,76 @@
+import subprocess as sp
+import sys
+import threading
+
+
+def test_append_and_extract_job_log(tmp_path):
+    from osa.joblogs import append_job_log, extract_job_log, job_log_file, read_job_log_index
+
+    job_log = job_log_file(tmp_path, 1807)
+    assert job_log.name == "Run01807.joblog"
+
+    def write_subrun(subrun):
+        for line in range(50):
+            append_job_log(job_log, f"subrun {subrun} line {line}\n".encode(), subrun, "12", "out")
+
+    threads = [threading.Thread(target=write_subrun, args=(subrun,)) for subrun in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    append_job_log(job_log, b"error\n", 2, "13", "err")
+
+    assert len(read_job_log_index(job_log)) == 201
+    assert extract_job_log(job_log, 1).decode() == "".join(
+        f"subrun 1 line {line}\n" for line in range(50)
+    )
+    assert extract_job_log(job_log, 2, stream="err") == b"error\n"
+    assert extract_job_log(job_log, 2, job_id="13") == b"error\n"
+    assert extract_job_log(job_log, 5) == b""
+
+
+def test_run_logged(tmp_path):
+    from osa.joblogs import extract_job_log, job_log_file, read_job_log_index, run_logged
+
+    job_log = job_log_file(tmp_path / "log", 1807)
+    program = "import sys; print('processing'); print('warning', file=sys.stderr); sys.exit(3)"
+    proc = run_logged([sys.executable, "-c", program], job_log, 12, job_id="1234")
+
+    assert proc.returncode == 3
+    assert extract_job_log(job_log, 12, stream="out") == b"processing\n"
+    assert extract_job_log(job_log, 12, stream="err", job_id="1234") == b"warning\n"
+
+    # A task processing the subruns 8 to 11, run as by the shell pilot scripts
+    program = "print('packed')"
+    cmd = [sys.executable, "-m", "osa.joblogs", str(job_log), "8:4", sys.executable, "-c", program]
+    assert sp.run(cmd).returncode == 0
+    assert extract_job_log(job_log, 10) == b"packed\n"
+    assert extract_job_log(job_log, 12, stream="out") == b"processing\n"
+    assert read_job_log_index(job_log)[-1].n_subruns == 4
+
+
+def test_compact_job_logs(tmp_path):
+    from osa.joblogs import compact_job_logs, extract_job_log, job_log_file
+
+    (tmp_path / "Run01807.0000_jobid_12.out").write_text("subrun 0\n")
+    (tmp_path / "Run01807.0000_jobid_12.err").write_text("")
+    (tmp_path / "Run01807.0001_jobid_12.out").write_text("subrun 1\n")
+    (tmp_path / "Run01807.0001_jobid_14.out").write_text("subrun 1 again\n")
+    (tmp_path / "Run01808.0000_jobid_13.err").write_text("error\n")
+    (tmp_path / "Run01808.task0001x4_jobid_15.out").write_text("subruns 4 to 7\n")
+    (tmp_path / "sequence_LST1_01807.py").write_text("")
+
+    assert compact_job_logs(tmp_path) == 6
+    assert sorted(file.name for file in tmp_path.iterdir()) == [
+        "Run01807.joblog",
+        "Run01807.joblog.index",
+        "Run01808.joblog",
+        "Run01808.joblog.index",
+        "sequence_LST1_01807.py",
+    ]
+    run_log = job_log_file(tmp_path, 1807)
+    assert extract_job_log(run_log, 1) == b"subrun 1\nsubrun 1 again\n"
+    assert extract_job_log(run_log, 1, job_id="14") == b"subrun 1 again\n"
+    assert extract_job_log(job_log_file(tmp_path, 1808), 0, stream="err") == b"error\n"
+    assert extract_job_log(job_log_file(tmp_path, 1808), 6) == b"subruns 4 to 7\n"
+    assert extract_job_log(job_log_file(tmp_path, 1808), 8) == b""
@@ -37,6 +37,51 @@ def test_historylevel():
     assert rc == 0
 
 
+def test_historylevel_last_records(tmp_path):
+    from osa.job import historylevel
+    from osa.report import HistoryRecord
+
+    options.dl1_prod_id = "tailcut84"
+    history_file = tmp_path / "sequence_LST1_01807.0000.history"
+    records = [
+        HistoryRecord("01807.0000", "lstchain_data_r0_to_dl1", "v0.1.0", return_code=1),
+        HistoryRecord("01807.0000", "lstchain_data_r0_to_dl1", "v0.1.0", return_code=0),
+        HistoryRecord("01807.0000", "lstchain_dl1ab", "tailcut84", return_code=0),
+        HistoryRecord("01807.0000", "lstchain_check_dl1", "tailcut84", return_code=2),
+    ]
+    history_file.write_text("".join(f"{record.to_json()}\n" for record in records))
+    assert historylevel(history_file, "DATA") == (2, 2)
+
+    # A retried stage supersedes its failed attempts
+    records.append(HistoryRecord("01807.0000", "lstchain_check_dl1", "tailcut84", return_code=0))
+    history_file.write_text("".join(f"{record.to_json()}\n" for record in records))
+    assert historylevel(history_file, "DATA") == (1, 0)
+    assert historylevel(tmp_path / "missing.history", "DATA") == (4, 0)
+
+
+
+def test_history_index(tmp_path):
+    import shutil
+    from osa.job import history_index
+
+    options.dl1_prod_id = "tailcut84"
+    options.dl2_prod_id = "model1"
+
+    shutil.copy(calibration_history_file, tmp_path)
+    shutil.copy(datasequence_history_file, tmp_path)
+    shutil.copy(datasequence_history_file, tmp_path / "sequence_LST1_04185.0011.history")
+    (tmp_path / "sequence_LST1_04185.0012.history").write_text(
+        "04185.0012 lstchain_data_r0_to_dl1 v0.7.0 2021-03-25 None None 1\n"
+    )
+    shutil.copy(datasequence_history_file, tmp_path / "sequence_LST1_04186.0000.history")
+
+    index = history_index(tmp_path, {4183: "PEDCALIB", 4185: "DATA"})
+
+    assert index == {
+        4183: {None: (0, 0)},
+        4185: {10: (0, 0), 11: (0, 0), 12: (4, 1)},
+    }
+
 def test_preparejobs(running_analysis_dir, sequence_list):
     from osa.job import prepare_jobs
 
@@ -87,6 +132,162 @@ def test_scheduler_env_variables(sequence_list, running_analysis_dir):
         "#SBATCH --mem-per-cpu=6GB",
         "#SBATCH --account=dpps",
     ]
+    # Array limited by the I/O budget
+    env_variables = scheduler_env_variables(second_sequence, array_limit=4)
+    assert "#SBATCH --array=0-10%4" in env_variables
+    env_variables = scheduler_env_variables(second_sequence, array_limit=20)
+    assert "#SBATCH --array=0-10%11" in env_variables
+
+
+def test_throttle_arrays(monkeypatch, sequence_list, fake_scheduler):
+    from io import StringIO
+    import osa.job
+    from osa.job import throttle_arrays
+
+    squeue = "JOBID;NAME;STATE;TIME\n" + "".join(
+        f"{job_id}_{task};LST1_0{job_id};RUNNING;0:10\n"
+        for job_id, tasks in ((1807, 6), (2000, 10))
+        for task in range(tasks)
+    )
+    monkeypatch.setitem(cfg["SLURM"], "IO_BUDGET", "30")
+    monkeypatch.setattr(osa.job, "get_scheduler", lambda: fake_scheduler)
+    monkeypatch.setattr(osa.job, "run_squeue", lambda: StringIO(squeue))
+    monkeypatch.setattr(osa.job, "io_saturation", lambda: 1.0)
+    monkeypatch.setattr(options, "test", False)
+    monkeypatch.setattr(options, "simulate", False)
+
+    data_sequences = [sequence for sequence in sequence_list if sequence.type == "DATA"]
+    for sequence, (job_id, state) in zip(data_sequences, (("1807", "RUNNING"), ("1808", "PENDING"))):
+        monkeypatch.setattr(sequence, "jobid", job_id)
+        monkeypatch.setattr(sequence, "state", state)
+
+    # The tasks of other jobs take 10 of the 30 slots, shared by the two arrays
+    assert throttle_arrays(sequence_list) == 10
+    assert fake_scheduler.throttles == {"1807": 10, "1808": 10}
+
+
+def test_manage_running_sequences(monkeypatch, sequence_list):
+    from osa.scripts import sequencer
+
+    calls = []
+    monkeypatch.setattr(sequencer, "build_sequences", lambda date: sequence_list)
+    monkeypatch.setattr(sequencer, "update_job_info", lambda sequences: calls.append("update"))
+    monkeypatch.setattr(sequencer, "throttle_arrays", lambda sequences: calls.append("throttle"))
+    monkeypatch.setattr(
+        sequencer, "speculate_stragglers", lambda sequences: calls.append("speculate")
+    )
+    monkeypatch.setattr(options, "no_submit", False)
+
+    # Nothing to manage without an I/O budget nor speculative execution
+    monkeypatch.setitem(cfg["SLURM"], "IO_BUDGET", "")
+    monkeypatch.setitem(cfg["SLURM"], "SPECULATIVE_EXECUTION", "False")
+    sequencer.manage_running_sequences()
+    assert calls == []
+
+    monkeypatch.setitem(cfg["SLURM"], "IO_BUDGET", "30")
+    sequencer.manage_running_sequences()
+    assert calls == ["update", "throttle", "speculate"]
+
+    calls.clear()
+    monkeypatch.setitem(cfg["SLURM"], "IO_BUDGET", "")
+    monkeypatch.setitem(cfg["SLURM"], "SPECULATIVE_EXECUTION", "True")
+    monkeypatch.setattr(options, "no_submit", True)
+    sequencer.manage_running_sequences()
+    assert calls == ["update", "throttle"]
+
+
+def test_resubmit_failed_tasks(monkeypatch, tmp_path, sequence_list, fake_scheduler, job_script):
+    from io import StringIO
+    import osa.job
+    from osa.job import failed_array_tasks, get_sacct_output, resubmit_failed_tasks
+
+    sequence = next(sequence for sequence in sequence_list if sequence.type == "DATA")
+    last_task = sequence.subruns - 1
+    states = {task: "COMPLETED" for task in range(sequence.subruns)}
+    states.update({1: "TIMEOUT", 2: "FAILED"})
+    sacct = "".join(
+        f"100_{task},{sequence.jobname},00:10:00,600,00:10:00,00:09:00,,{state},0:0\n"
+        for task, state in states.items()
+    )
+    # Task 2 was already resubmitted and completed, the last one is pending
+    sacct += f"101_2,{sequence.jobname},00:10:00,600,00:10:00,00:09:00,,COMPLETED,0:0\n"
+    sacct += f"102_[{last_task}],{sequence.jobname},00:00:00,0,00:00:00,00:00:00,,PENDING,0:0\n"
+    sacct_info = get_sacct_output(StringIO(sacct))
+
+    # Task 3 completed without producing the DL2 file and task 1 left no history
+    index = {sequence.run: {subrun: (0, 0) for subrun in range(sequence.subruns)}}
+    index[sequence.run][3] = (1, 0)
+    del index[sequence.run][1]
+    del index[sequence.run][last_task]
+
+    monkeypatch.setattr(options, "no_dl2", False)
+    monkeypatch.setitem(cfg["SLURM"], "SUBRUNS_PER_TASK", "1")
+    assert failed_array_tasks(sequence, sacct_info, index) == {1: "TIMEOUT", 3: "COMPLETED"}
+
+    fake_scheduler.next_job_id = 103
+    script = job_script("--time=1:00:00", f"--array=0-{last_task}%4")
+    monkeypatch.setattr(sequence, "script", script)
+    monkeypatch.setattr(options, "directory", tmp_path)
+    monkeypatch.setattr(options, "test", False)
+    monkeypatch.setattr(options, "simulate", False)
+    monkeypatch.setattr(osa.job, "get_scheduler", lambda: fake_scheduler)
+    monkeypatch.setattr(osa.job, "get_sacct_snapshot", lambda: sacct_info)
+    monkeypatch.setattr(osa.job, "history_index", lambda directory, run_types: index)
+
+    assert resubmit_failed_tasks([sequence], walltime_factor=1.5) == {sequence.jobname: "103"}
+    commandargs = fake_scheduler.submitted[0]
+    assert "--array=1,3%4" in commandargs
+    assert "--time=01:30:00" in commandargs
+    assert commandargs[-1] == str(script)
+
+
+def test_resubmit_packed_tasks(monkeypatch, tmp_path, sequence_list, fake_scheduler, job_script):
+    from io import StringIO
+    import osa.job
+    from osa.job import (
+        get_sacct_output,
+        get_task_resources,
+        read_submission_manifest,
+        record_submission,
+        resubmit_failed_tasks,
+    )
+
+    sequence = next(sequence for sequence in sequence_list if sequence.type == "DATA")
+    # Three tasks of four subruns, the second one ended in TIMEOUT
+    sacct = "".join(
+        f"100_{task},{sequence.jobname},00:40:00,2400,00:40:00,00:39:00,,{state},0:0\n"
+        for task, state in enumerate(("COMPLETED", "TIMEOUT", "COMPLETED"))
+    )
+    sacct_info = get_sacct_output(StringIO(sacct))
+    index = {sequence.run: {subrun: (0, 0) for subrun in range(sequence.subruns)}}
+    for subrun in range(4, 8):
+        del index[sequence.run][subrun]
+
+    manifest = tmp_path / "log" / "submission_manifest.json"
+    record_submission(manifest, sequence, "100", subruns_per_task=4, subruns=11)
+    fake_scheduler.next_job_id = 101
+    monkeypatch.setattr(sequence, "script", job_script("--array=0-2%4"))
+    monkeypatch.setattr(options, "directory", tmp_path)
+    monkeypatch.setattr(options, "test", False)
+    monkeypatch.setattr(options, "simulate", False)
+    monkeypatch.setitem(cfg["SLURM"], "SUBRUNS_PER_TASK", "4")
+    monkeypatch.setattr(osa.job, "get_scheduler", lambda: fake_scheduler)
+    monkeypatch.setattr(osa.job, "get_sacct_snapshot", lambda: sacct_info)
+    monkeypatch.setattr(osa.job, "history_index", lambda directory, run_types: index)
+
+    assert resubmit_failed_tasks([sequence]) == {sequence.jobname: "101"}
+    assert "--array=1%4" in fake_scheduler.submitted[0]
+    record = read_submission_manifest(manifest)[sequence.jobname]
+    assert record["jobid"] == "101"
+    assert record["subruns_per_task"] == 4
+    assert record["subruns"] == 11
+    assert record["previous_jobids"] == ["100"]
+
+    # The tasks of both arrays are mapped to their subruns
+    monkeypatch.setattr(osa.job, "recent_nights", lambda max_nights: [tmp_path])
+    sacct += f"101_1,{sequence.jobname},00:50:00,3000,00:50:00,00:49:00,,COMPLETED,0:0\n"
+    usage = get_task_resources(StringIO(sacct))
+    assert usage["subruns"].tolist() == [4, 4, 3, 4]
 
 
 def test_job_header_template(sequence_list, running_analysis_dir):
@@ -131,6 +332,103 @@ def test_job_header_template(sequence_list, running_analysis_dir):
     assert header == output_string2
 
 
+def test_aggregated_job_logs(monkeypatch, sequence_list, running_analysis_dir):
+    from osa.job import data_sequence_job_template, scheduler_env_variables
+
+    monkeypatch.setitem(cfg["SLURM"], "AGGREGATED_JOB_LOGS", "True")
+    monkeypatch.setattr(options, "test", False)
+    monkeypatch.setattr(options, "simulate", True)
+    data_sequence = sequence_list[1]
+
+    header = scheduler_env_variables(data_sequence)
+    assert "#SBATCH --output=log/Run01807_jobid_%A.out" in header
+    assert "#SBATCH --open-mode=append" in header
+    assert not any(line.startswith("#SBATCH --error") for line in header)
+
+    content = data_sequence_job_template(data_sequence)
+    assert "from osa.joblogs import run_logged\n" in content
+    assert f"], '{running_analysis_dir}/log/Run01807.joblog', subruns)" in content
+
+    # The output of a packed task is indexed under all its subruns
+    monkeypatch.setitem(cfg["SLURM"], "SUBRUNS_PER_TASK", "4")
+    content = data_sequence_job_template(data_sequence)
+    assert "subruns, n_subruns=min(4, 11 - subruns))" in content
+    monkeypatch.setitem(cfg["SLURM"], "PILOT_SCRIPT", "shell")
+    content = data_sequence_job_template(data_sequence)
+    assert '"$subruns:$(( 11 - subruns < 4 ? 11 - subruns : 4 ))"' in content
+
+    # The calibration sequence keeps its own log files
+    assert "#SBATCH --error=log/Run01809.%4a_jobid_%A.err" in scheduler_env_variables(
+        sequence_list[0]
+    )
+
+
+def test_shell_pilot(monkeypatch, tmp_path, sequence_list):
+    import os
+    import subprocess as sp
+    from osa.job import data_sequence_job_template, sequence_filenames
+
+    monkeypatch.setitem(cfg["SLURM"], "PILOT_SCRIPT", "shell")
+    monkeypatch.setitem(cfg["SLURM"], "SUBRUNS_PER_TASK", "4")
+    monkeypatch.setattr(options, "test", False)
+    monkeypatch.setattr(options, "simulate", True)
+    data_sequence = sequence_list[1]
+
+    monkeypatch.setattr(data_sequence, "script", None)
+    sequence_filenames(data_sequence)
+    assert data_sequence.script.name == "sequence_LST1_01807.sh"
+
+    content = data_sequence_job_template(data_sequence)
+    assert content.startswith("#!/bin/bash\n\n#SBATCH --job-name=LST1_01807\n")
+    assert "subruns=$((4 * SLURM_ARRAY_TASK_ID))\n" in content
+    assert "import" not in content
+
+    # Run the pilot with a fake datasequence failing with exit code 3
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    fake_program = bin_dir / "datasequence"
+    fake_program.write_text('#!/bin/sh\necho "$@" > arguments.txt\nexit 3\n')
+    fake_program.chmod(0o755)
+    script = tmp_path / "sequence_LST1_01807.sh"
+    script.write_text(content)
+    env = dict(os.environ, PATH=f"{bin_dir}:{os.environ['PATH']}", SLURM_ARRAY_TASK_ID="2")
+    proc = sp.run(["bash", str(script)], cwd=tmp_path, env=env)
+
+    assert proc.returncode == 3
+    arguments = (tmp_path / "arguments.txt").read_text().split()
+    assert "--date=2020-01-17" in arguments
+    assert arguments[-3:] == ["--n-subruns=3", "01807.0008", "LST1"]
+
+
+def test_shell_pilot_pedestal_ids(monkeypatch, tmp_path, sequence_list, pedestal_ids_file):
+    import os
+    import subprocess as sp
+    from osa.job import data_sequence_job_template
+
+    monkeypatch.setitem(cfg["SLURM"], "PILOT_SCRIPT", "shell")
+    monkeypatch.setitem(cfg["SLURM"], "SUBRUNS_PER_TASK", "1")
+    monkeypatch.setattr(options, "test", False)
+    monkeypatch.setattr(options, "simulate", True)
+    data_sequence = sequence_list[2]
+    assert data_sequence.run == 1808
+
+    content = data_sequence_job_template(data_sequence)
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    fake_program = bin_dir / "datasequence"
+    fake_program.write_text('#!/bin/sh\necho "$@" > arguments.txt\n')
+    fake_program.chmod(0o755)
+    script = tmp_path / "sequence_LST1_01808.sh"
+    script.write_text(content)
+    env = dict(os.environ, PATH=f"{bin_dir}:{os.environ['PATH']}", SLURM_ARRAY_TASK_ID="0")
+    assert sp.run(["bash", str(script)], cwd=tmp_path, env=env).returncode == 0
+
+    # The pedestal IDs file of the subrun processed by the task
+    arguments = (tmp_path / "arguments.txt").read_text().split()
+    assert f"--pedestal-ids-file={pedestal_ids_file.resolve()}" in arguments
+    assert arguments[-2:] == ["01808.0000", "LST1"]
+
+
 def test_create_job_template_scheduler(
     sequence_list,
     drs4_time_calibration_files,
@@ -459,3 +757,384 @@ def test_plot_job_statistics(sacct_output, running_analysis_dir):
     plot_job_statistics(sacct_output, log_dir)
     plot_file = log_dir / "job_statistics.pdf"
     assert plot_file.exists()
+
+
+def test_slurm_parsers(mock_sacct_output, mock_squeue_output):
+    from io import BytesIO, StringIO
+    from osa.job import get_closer_sacct_output, get_sacct_output, get_squeue_output
+
+    # Binary stream, as read from the pipe of the sacct process
+    sacct_output = get_sacct_output(BytesIO(mock_sacct_output.read_bytes()))
+    assert sacct_output["JobID"].dtype == "int64"
+    assert sacct_output["JobName"].dtype == "category"
+    assert sacct_output["State"].dtype == "category"
+    assert sacct_output["JobID"].tolist()[:6] == [12925480] * 2 + [12927823] * 2 + [12927824] * 2
+    assert sacct_output["ArrayIndex"].isna().tolist()[:6] == [True] * 4 + [False] * 2
+    assert sacct_output["ArrayIndex"].iloc[4] == "0"
+    assert get_closer_sacct_output(mock_sacct_output).empty
+
+    squeue_output = get_squeue_output(mock_squeue_output)
+    assert squeue_output["JobID"].tolist() == [12951086, 12951087, 12951088]
+    assert squeue_output["ArrayIndex"].tolist()[1:] == ["[0-10]", "[0-8]"]
+    assert squeue_output["CPUTimeRAW"].tolist() == [2952, 0, 0]
+
+    assert get_sacct_output(StringIO("")).empty
+    assert get_squeue_output(StringIO("")).empty
+
+
+def test_get_sacct_snapshot(monkeypatch, mock_sacct_output):
+    from io import StringIO
+    import osa.job
+    from osa.job import get_sacct_snapshot, invalidate_sacct_snapshot, shared_sacct_snapshot
+
+    calls = []
+
+    def fake_fetch_sacct_output():
+        calls.append(1)
+        return mock_sacct_output.read_text()
+
+    monkeypatch.setattr(osa.job, "fetch_sacct_output", fake_fetch_sacct_output)
+    invalidate_sacct_snapshot()
+
+    first = get_sacct_snapshot(max_age=300)
+    second = get_sacct_snapshot(max_age=300)
+    assert len(calls) == 1
+    assert first.equals(second)
+    assert first.equals(osa.job.get_sacct_output(StringIO(mock_sacct_output.read_text())))
+
+    # Modifying the returned table does not alter the shared snapshot
+    first.drop(first.index, inplace=True)
+    assert not get_sacct_snapshot(max_age=300).empty
+
+    get_sacct_snapshot(max_age=0)
+    assert len(calls) == 2
+    invalidate_sacct_snapshot()
+
+    # The nights processed together share one snapshot despite the submissions
+    with shared_sacct_snapshot():
+        get_sacct_snapshot()
+        invalidate_sacct_snapshot()
+        get_sacct_snapshot()
+    assert len(calls) == 3
+    get_sacct_snapshot()
+    assert len(calls) == 4
+    invalidate_sacct_snapshot()
+
+
+def test_sacct_journal(tmp_path):
+    import datetime
+    from osa.job import read_sacct_journal, write_sacct_journal
+
+    journal = tmp_path / "sacct_journal.csv"
+    assert read_sacct_journal(journal) == (None, {})
+
+    last_poll = datetime.datetime(2020, 1, 18, 10, 0, 0)
+    records = {
+        "12951086": ("2020-01-18T10:00:00", "12951086,LST1_01809,,,,,,RUNNING,0:0"),
+        "12951087_0": ("2020-01-18T10:00:00", "12951087_0,LST1_01807,,,,,,PENDING,0:0"),
+    }
+    write_sacct_journal(journal, last_poll, records)
+    assert read_sacct_journal(journal) == (last_poll, records)
+
+
+def test_summarize_sequence_jobs():
+    import pandas as pd
+    from osa.job import summarize_sequence_jobs
+
+    job_info = pd.DataFrame(
+        {
+            "JobID": [1, 2, 2, 3, 3, 4, 4, 5],
+            "JobName": [
+                "LST1_01807",
+                "LST1_01807",
+                "LST1_01807",
+                "LST1_01808",
+                "LST1_01808",
+                "LST1_01809",
+                "LST1_01809",
+                "LST1_01810",
+            ],
+            "CPUTimeRAW": [10, 3600, 7200, 60, None, 60, 60, 60],
+            "State": [
+                "FAILED",
+                "COMPLETED",
+                "COMPLETED",
+                "RUNNING",
+                "CANCELLED by 123",
+                "TIMEOUT",
+                "COMPLETED",
+                "RUNNING",
+            ],
+            "ExitCode": ["1:0", "0:0", "0:0", "0:0", "0:9", "0:0", "0:0", "0:0"],
+        }
+    )
+    summary = summarize_sequence_jobs(job_info)
+
+    assert summary.loc["LST1_01807", "tries"] == 2
+    assert summary.loc["LST1_01807", "jobid"] == 2
+    assert summary.loc["LST1_01807", "state"] == "COMPLETED"
+    assert summary.loc["LST1_01807", "exit"] == "0:0"
+    assert summary.loc["LST1_01807", "cputime"] == "01:30:00"
+    assert summary.loc["LST1_01808", "state"] == "CANCELLED"
+    assert summary.loc["LST1_01808", "exit"] == "0:9"
+    assert summary.loc["LST1_01808", "cputime"] is None
+    assert summary.loc["LST1_01809", "state"] == "TIMEOUT"
+    assert summary.loc["LST1_01809", "exit"] == "0:15"
+    assert summary.loc["LST1_01810", "state"] == "RUNNING"
+    assert summary.loc["LST1_01810", "exit"] is None
+
+
+def test_submit_jobs(monkeypatch, tmp_path, sequence_list):
+    import subprocess as sp
+    import osa.job
+    from osa.job import submit_jobs, read_submission_manifest
+
+    submitted = []
+
+    def fake_check_output(commandargs, **kwargs):
+        if commandargs[0] == "squeue" and "-o" in commandargs:
+            # Nothing queued before the submission
+            return b"JOBID;NAME;STATE;TIME\n"
+        if commandargs[0] == "squeue":
+            # The first submission of the last sequence reached the scheduler
+            return "".join(f"{job_id};{token}\n" for job_id, token in submitted)
+        token = commandargs[-2].removeprefix("--comment=")
+        job_id = str(1000 + len(submitted))
+        submitted.append((job_id, token))
+        if commandargs[-1] == sequence_list[-1].script and len(submitted) < 4:
+            raise sp.CalledProcessError(1, commandargs)
+        return f"{job_id}\n"
+
+    monkeypatch.setattr(osa.job.sp, "check_output", fake_check_output)
+    monkeypatch.setattr(osa.job.shutil, "which", lambda command: command)
+    monkeypatch.setattr(osa.job, "SBATCH_RETRY_DELAY", 0)
+    monkeypatch.setattr(options, "simulate", False)
+    monkeypatch.setattr(options, "test", False)
+    monkeypatch.setattr(options, "directory", tmp_path)
+
+    job_list = submit_jobs(sequence_list)
+
+    assert job_list == [sequence.script for sequence in sequence_list]
+    # Failed submission was found in the queue, so it is not duplicated
+    assert len(submitted) == len(sequence_list)
+
+    manifest = read_submission_manifest(tmp_path / "log" / "submission_manifest.json")
+    calibration_id = manifest[sequence_list[0].jobname]["jobid"]
+    assert calibration_id == "1000"
+    for sequence in sequence_list[1:]:
+        assert manifest[sequence.jobname]["dependency"] == f"afterok:{calibration_id}"
+    assert len({record["jobid"] for record in manifest.values()}) == len(sequence_list)
+
+
+def test_duplicate_submission(monkeypatch, tmp_path, sequence_list, job_script):
+    import osa.job
+    import osa.scheduler
+    from osa.job import read_submission_manifest, record_submission, submit_jobs
+
+    calibration, first_data, second_data = sequence_list
+    queue = (
+        "JOBID;NAME;STATE;TIME\n"
+        f"900;{calibration.jobname};RUNNING;10:00\n"
+        f"901_[0-10];{first_data.jobname};PENDING;0:00\n"
+        "902_3;LST1_09999;RUNNING;10:00\n"
+    )
+    submitted = []
+    cancelled = []
+
+    def fake_check_output(commandargs, **kwargs):
+        if commandargs[0] == "squeue":
+            return queue.encode()
+        submitted.append(str(commandargs[-1]))
+        return f"{1000 + len(submitted)}\n"
+
+    def fake_run(commandargs, **kwargs):
+        cancelled.append(commandargs[-1])
+
+    monkeypatch.setattr(osa.job.sp, "check_output", fake_check_output)
+    monkeypatch.setattr(osa.scheduler.sp, "run", fake_run)
+    monkeypatch.setattr(osa.job.shutil, "which", lambda command: command)
+    monkeypatch.setattr(osa.scheduler.shutil, "which", lambda command: command)
+    monkeypatch.setattr(options, "simulate", False)
+    monkeypatch.setattr(options, "test", False)
+    monkeypatch.setattr(options, "directory", tmp_path)
+    monkeypatch.setitem(cfg["SLURM"], "DUPLICATE_SUBMISSION", "refuse")
+    manifest_file = tmp_path / "log" / "submission_manifest.json"
+    for sequence in sequence_list:
+        script = job_script("--time=01:00:00", name=sequence.script.name)
+        monkeypatch.setattr(sequence, "script", script)
+
+    # Only the sequence not queued is submitted, depending on the queued calibration
+    submit_jobs(sequence_list)
+    assert submitted == [str(second_data.script)]
+    manifest = read_submission_manifest(manifest_file)
+    assert calibration.jobname not in manifest
+    assert manifest[second_data.jobname]["dependency"] == "afterok:900"
+
+    # Submitted by an overlapping sequencer process after the queue snapshot
+    original_guard = osa.job.duplicate_submission_guard
+
+    def guard_with_overlap(manifest):
+        guard = original_guard(manifest)
+        record_submission(manifest, second_data, "950")
+        return guard
+
+    monkeypatch.setattr(osa.job, "duplicate_submission_guard", guard_with_overlap)
+    submitted.clear()
+    submit_jobs(sequence_list)
+    assert submitted == []
+    assert read_submission_manifest(manifest_file)[second_data.jobname]["jobid"] == "950"
+
+    monkeypatch.setattr(osa.job, "duplicate_submission_guard", original_guard)
+    monkeypatch.setitem(cfg["SLURM"], "DUPLICATE_SUBMISSION", "supersede")
+    manifest_file.unlink()
+    submit_jobs(sequence_list)
+    assert sorted(cancelled) == ["900", "901"]
+    assert sorted(submitted) == sorted(str(sequence.script) for sequence in sequence_list)
+
+
+def test_estimated_cpu_hours(tmp_path):
+    from osa.job import estimated_cpu_hours
+
+    script = tmp_path / "sequence_LST1_01807.py"
+    script.write_text(
+        "#!/bin/env python\n\n#SBATCH --job-name=LST1_01807\n#SBATCH --time=01:30:00\n"
+        "#SBATCH --array=0-9%4\n#SBATCH --cpus-per-task=2\n\nprint()\n"
+    )
+    assert estimated_cpu_hours(script) == 30
+    assert estimated_cpu_hours(tmp_path / "missing.py") == 0
+
+
+def test_wait_for_jobs(monkeypatch):
+    import osa.job
+    from osa.job import wait_for_jobs
+
+    # Successive outputs of a fake sacct
+    polls = iter(
+        [
+            "1,LST1_01807,,,,,,PENDING,0:0\n",
+            "1_0,LST1_01807,,,,,,RUNNING,0:0\n1_1,LST1_01807,,,,,,RUNNING,0:0\n",
+            "1_0,LST1_01807,,,,,,RUNNING,0:0\n1_1,LST1_01807,,,,,,RUNNING,0:0\n",
+            "1_0,LST1_01807,,,,,,COMPLETED,0:0\n1_0.batch,batch,,,,,,COMPLETED,0:0\n"
+            "1_1,LST1_01807,,,,,,CANCELLED by 123,0:0\n2,LST1_01808,,,,,,COMPLETED,0:0\n",
+        ]
+    )
+    monkeypatch.setattr(osa.job, "fetch_sacct_output", lambda: next(polls))
+    waits = []
+
+    states = wait_for_jobs(
+        ["1", 2], timeout=3600, min_interval=10, max_interval=15, sleep=waits.append
+    )
+
+    assert states == {"1": "CANCELLED", "2": "COMPLETED"}
+    # The interval is reset when the jobs progress and capped otherwise
+    assert waits == [10, 10, 15]
+
+    monkeypatch.setattr(osa.job, "fetch_sacct_output", lambda: "1,LST1_01807,,,,,,RUNNING,0:0\n")
+    waits.clear()
+    states = wait_for_jobs(["1"], timeout=60, min_interval=10, max_interval=40, sleep=waits.append)
+    assert states == {"1": "RUNNING"}
+    assert waits == [10, 20, 40]
+
+
+def test_write_job_script(tmp_path):
+    from osa.job import write_job_script
+
+    script = tmp_path / "sequence_LST1_01807.py"
+    assert write_job_script(script, "print('first')") is True
+    assert script.read_text() == "print('first')"
+    mtime = script.stat().st_mtime_ns
+
+    # Same content, so the script is not written again
+    assert write_job_script(script, "print('first')") is False
+    assert script.stat().st_mtime_ns == mtime
+
+    assert write_job_script(script, "print('second')") is True
+    assert script.read_text() == "print('second')"
+
+    # Modified on disk by someone else
+    script.write_text("print('other')")
+    assert write_job_script(script, "print('second')") is True
+    assert script.read_text() == "print('second')"
+    assert list(tmp_path.iterdir()) == [script]
+
+
+def test_subrun_packing(monkeypatch, sequence_list, running_analysis_dir):
+    from osa.job import scheduler_env_variables, data_sequence_job_template
+
+    monkeypatch.setitem(cfg["SLURM"], "SUBRUNS_PER_TASK", "4")
+    monkeypatch.setattr(options, "test", False)
+
+    # 11 subruns processed by 3 tasks of 4 subruns with 4 times the walltime
+    data_sequence = sequence_list[1]
+    env_variables = scheduler_env_variables(data_sequence)
+    assert "#SBATCH --time=05:00:00" in env_variables
+    assert "#SBATCH --array=0-2" in env_variables
+    # The logs are named after the task, not the subrun
+    assert "#SBATCH --output=log/Run01807.task%4ax4_jobid_%A.out" in env_variables
+
+    content = data_sequence_job_template(data_sequence)
+    assert "subruns = 4 * int(os.getenv('SLURM_ARRAY_TASK_ID'))" in content
+    assert "f'--n-subruns={min(4, 11 - subruns)}'," in content
+
+    # Calibration sequences are not packed
+    env_variables = scheduler_env_variables(sequence_list[0])
+    assert "#SBATCH --time=1:15:00" in env_variables
+
+
+def test_packed_walltime(monkeypatch, tmp_path):
+    import osa.job
+    from osa.job import packed_walltime
+    from osa.report import HistoryRecord
+
+    analysis_dir = tmp_path / "20200117" / "v0.1.0"
+    analysis_dir.mkdir(parents=True)
+    monkeypatch.setattr(options, "directory", analysis_dir)
+    monkeypatch.setattr(osa.job, "_SUBRUN_RUNTIME", {})
+    monkeypatch.setitem(cfg["SLURM"], "RESOURCE_MARGIN", "0.2")
+    monkeypatch.setitem(cfg["SLURM"], "PARTITION_TIME_LIMITS", "short=1:00:00, long=1:10:00")
+
+    # Nothing measured yet: WALLTIME per subrun, capped at the partition limits
+    assert packed_walltime(30, "short, long") == "01:10:00"
+    assert packed_walltime(30, "short, other") == "1-13:30:00"
+
+    # Subruns of 2 minutes
+    record = HistoryRecord("01807.0000", "lstchain_data_r0_to_dl1", "v0.1.0", 0, duration=120)
+    (analysis_dir / "sequence_LST1_01807.0000.history").write_text(f"{record.to_json()}\n")
+    monkeypatch.setattr(osa.job, "_SUBRUN_RUNTIME", {})
+    assert packed_walltime(30, "short, other") == "01:12:00"
+    assert packed_walltime(30, "short, long") == "01:10:00"
+    assert packed_walltime(10, "short, long") == "00:24:00"
+
+
+def test_subruns_per_task_auto(monkeypatch, tmp_path):
+    from osa.job import subruns_per_task
+    from osa.report import HistoryRecord
+
+    analysis_dir = tmp_path / "20200117" / "v0.1.0"
+    analysis_dir.mkdir(parents=True)
+    monkeypatch.setattr(options, "directory", analysis_dir)
+    monkeypatch.setitem(cfg["SLURM"], "SUBRUNS_PER_TASK", "auto")
+    monkeypatch.setitem(cfg["SLURM"], "PACKING_TARGET_TIME", "1:00:00")
+
+    # No measured runtime yet
+    assert subruns_per_task() == 1
+
+    # Subruns of a previous night took 10 minutes each
+    previous_dir = tmp_path / "20200116" / "v0.1.0"
+    previous_dir.mkdir(parents=True)
+    for subrun in range(3):
+        records = [
+            HistoryRecord(
+                run=f"01800.{subrun:04d}",
+                stage=stage,
+                prod_id="v0.1.0",
+                return_code=0,
+                duration=300,
+            )
+            for stage in ("lstchain_data_r0_to_dl1", "lstchain_dl1ab")
+        ]
+        history_file = previous_dir / f"sequence_LST1_01800.{subrun:04d}.history"
+        history_file.write_text("".join(f"{record.to_json()}\n" for record in records))
+
+    monkeypatch.setattr(options, "directory", tmp_path / "20200118" / "v0.1.0")
+    assert subruns_per_task() == 6
@@ -0,0 +1,105 @@
+import pandas as pd
+
+from osa.configs import options
+from osa.configs.config import cfg
+from osa.paths import DEFAULT_CFG
+
+
+def test_submit_night_dag(monkeypatch, tmp_path, sequence_list, fake_scheduler):
+    import osa.nightdag
+    from osa.job import read_submission_manifest, record_submission
+    from osa.nightdag import night_dag, night_dag_jobs, submit_night_dag
+    from osa.scheduler import read_sbatch_directives
+
+    fake_scheduler.next_job_id = 2000
+    submitted = fake_scheduler.submitted
+    monkeypatch.setattr(osa.nightdag, "get_scheduler", lambda: fake_scheduler)
+    monkeypatch.setattr(options, "simulate", False)
+    monkeypatch.setattr(options, "test", False)
+    monkeypatch.setattr(options, "no_dl2", False)
+    monkeypatch.setattr(options, "directory", tmp_path)
+    monkeypatch.setattr(options, "configfile", DEFAULT_CFG)
+    monkeypatch.setattr(options, "tel_id", "LST1")
+    monkeypatch.setattr(options, "prod_id", "v0.1.0")
+    monkeypatch.setattr(options, "dl1_prod_id", cfg.get("LST1", "DL1_PROD_ID"))
+    monkeypatch.setattr(options, "dl2_prod_id", cfg.get("LST1", "DL2_PROD_ID"))
+
+    data_sequences = [sequence for sequence in sequence_list if sequence.type == "DATA"]
+    dag = night_dag(sequence_list)
+    # Six jobs per run plus the longterm datacheck and the transparency
+    assert len(dag) == 6 * len(data_sequences) + 2
+    names = [job.jobname for job in dag]
+    for index, job in enumerate(dag):
+        for parent in job.parents:
+            assert parent not in names or names.index(parent) < index
+
+    # Only the array job of the first run was submitted
+    manifest = tmp_path / "log" / "submission_manifest.json"
+    record_submission(manifest, data_sequences[0], "1000")
+
+    job_ids = submit_night_dag(sequence_list)
+
+    run = f"{data_sequences[0].run:05d}"
+    assert set(job_ids) == {
+        f"closer_{run}",
+        f"provprocess_{run}",
+        f"merge_dl1_{run}",
+        f"merge_muon_{run}",
+        f"merge_dl2_{run}",
+        f"merge_dl1_datacheck_{run}",
+    }
+    records = read_submission_manifest(manifest)
+    assert records[f"closer_{run}"]["dependency"] == "afterok:1000"
+    register_id = job_ids[f"closer_{run}"]
+    assert records[f"merge_dl1_datacheck_{run}"]["dependency"] == f"afterok:{register_id}"
+    assert all("--kill-on-invalid-dep=yes" in commandargs for commandargs in submitted)
+    assert night_dag_jobs() == job_ids
+
+    script = tmp_path / f"dag_merge_dl1_datacheck_{run}.py"
+    assert read_sbatch_directives(script)["--job-name"] == f"lstchain_check_dl1_{run}"
+    assert "'lstchain_check_dl1'," in script.read_text()
+
+    # Only the failed, cancelled or unknown jobs are submitted again
+    from osa.nightdag import missing_dag_jobs
+    from osa.scripts import closer
+
+    states = {
+        f"closer_{run}": "COMPLETED",
+        f"provprocess_{run}": "RUNNING",
+        f"merge_dl1_{run}": "FAILED",
+        f"merge_muon_{run}": "PENDING",
+        f"merge_dl1_datacheck_{run}": "RUNNING",
+    }
+    sacct_info = pd.DataFrame(
+        {"JobID": [job_ids[name] for name in states], "State": list(states.values())}
+    )
+    monkeypatch.setattr(osa.nightdag, "get_sacct_snapshot", lambda parser=None: sacct_info)
+    missing = [job.jobname for job in missing_dag_jobs(sequence_list)]
+    assert missing[:2] == [f"merge_dl1_{run}", f"merge_dl2_{run}"]
+    assert len(missing) == 2 + 6 * (len(data_sequences) - 1) + 2
+
+    # The closer merges those runs and waits for the datacheck still running
+    launched = []
+    monkeypatch.setattr(
+        closer, "launch_post_processing", lambda seqs, ids: launched.append((seqs, ids))
+    )
+    assert closer.relaunch_missing_dag_jobs(sequence_list, night_dag_jobs())
+    assert launched == [(data_sequences, [job_ids[f"merge_dl1_datacheck_{run}"]])]
+
+    resubmitted = submit_night_dag(sequence_list)
+    assert set(resubmitted) == {f"merge_dl1_{run}", f"merge_dl2_{run}"}
+    # Their parent already completed
+    assert not any(arg.startswith("--dependency") for arg in submitted[-1])
+    assert night_dag_jobs()[f"merge_dl1_{run}"] == resubmitted[f"merge_dl1_{run}"]
+
+    # The array tasks superseded by their speculative execution are cancelled,
+    # the job moving the files only waits for the array job to finish
+    monkeypatch.setitem(cfg["SLURM"], "SPECULATIVE_EXECUTION", "True")
+    manifest.unlink()
+    record_submission(manifest, data_sequences[0], "1000")
+    job_ids = submit_night_dag(sequence_list)
+    records = read_submission_manifest(manifest)
+    register_id = job_ids[f"closer_{run}"]
+    assert records[f"closer_{run}"]["dependency"] == "afterany:1000"
+    assert records[f"provprocess_{run}"]["dependency"] == f"afterok:{register_id}"
+    assert records[f"merge_dl1_{run}"]["dependency"] == f"afterok:{register_id}"
@@ -0,0 +1,105 @@
+import fcntl
+import os
+import subprocess as sp
+import sys
+
+import pytest
+
+from osa.configs import options
+from osa.configs.config import cfg
+
+
+def test_cpu_key():
+    from osa.numbacache import cpu_key
+
+    # Same key as the shell pilot scripts
+    shell_key = sp.check_output(
+        "grep -m1 -E '^(flags|Features)' /proc/cpuinfo | md5sum | cut -c1-12",
+        shell=True,
+        text=True,
+    )
+    assert cpu_key() == shell_key.strip()
+
+
+def test_numba_cache(tmp_path):
+    from osa.numbacache import (
+        cpu_key,
+        is_populated,
+        mark_populated,
+        numba_cache,
+        prune_numba_cache,
+        warm_up,
+    )
+
+    directory = tmp_path / "numba" / "py3.11-numba0.60.0-lstchain0.10.7"
+    cache_dir = directory / cpu_key()
+
+    with numba_cache(directory) as first:
+        assert first == str(cache_dir)
+        # The cache is being populated by the first job
+        with numba_cache(directory) as second:
+            assert second != first
+            assert os.path.isdir(second)
+        assert not os.path.exists(second)
+
+        mark_populated(first)
+        with numba_cache(directory) as third:
+            assert third == first
+
+    # Private caches are not marked
+    mark_populated(str(tmp_path))
+    assert not (tmp_path / ".populated").exists()
+
+    cache_dir.joinpath(".populated").unlink()
+    command = [sys.executable, "-c", "import os; print(os.environ['NUMBA_CACHE_DIR'])"]
+    assert warm_up(command, directory) == 0
+    assert is_populated(cache_dir)
+    assert warm_up([sys.executable, "-c", "raise SystemExit(2)"], directory) == 2
+
+    old_cache = tmp_path / "numba" / "py3.10-numba0.59.0-lstchain0.10.5"
+    old_cache.mkdir()
+    assert prune_numba_cache(directory) == [old_cache]
+    assert not old_cache.exists()
+    assert cache_dir.exists()
+
+
+@pytest.mark.parametrize("pilot", ["python", "shell"])
+def test_shared_numba_cache_pilot(monkeypatch, tmp_path, sequence_list, pilot):
+    from osa.job import data_sequence_job_template, job_script_context, script_interpreter
+    from osa.numbacache import cpu_key
+
+    monkeypatch.setitem(cfg["CACHE"], "NUMBA_CACHE_DIR", str(tmp_path / "numba"))
+    monkeypatch.setitem(cfg["SLURM"], "PILOT_SCRIPT", pilot)
+    monkeypatch.setattr(options, "test", False)
+    monkeypatch.setattr(options, "simulate", True)
+    data_sequence = sequence_list[1]
+
+    context = job_script_context()
+    content = data_sequence_job_template(data_sequence, context)
+    cache_dir = context.numba_cache / cpu_key()
+
+    # The fake datasequence reports the cache it was given
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    fake_program = bin_dir / "datasequence"
+    fake_program.write_text('#!/bin/sh\necho "$NUMBA_CACHE_DIR" > cache.txt\n')
+    fake_program.chmod(0o755)
+    script = tmp_path / f"sequence_LST1_01807.{'sh' if pilot == 'shell' else 'py'}"
+    script.write_text(content)
+    env = dict(os.environ, PATH=f"{bin_dir}:{os.environ['PATH']}", SLURM_ARRAY_TASK_ID="2")
+
+    sp.run([*script_interpreter(script), str(script)], cwd=tmp_path, env=env, check=True)
+    assert (tmp_path / "cache.txt").read_text().strip() == str(cache_dir)
+
+    # Another task is populating the cache
+    with open(cache_dir / ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        sp.run([*script_interpreter(script), str(script)], cwd=tmp_path, env=env, check=True)
+        private_cache = (tmp_path / "cache.txt").read_text().strip()
+        assert private_cache != str(cache_dir)
+        assert not os.path.exists(private_cache)
+
+        # Once populated, the cache is used by every task
+        (cache_dir / ".populated").touch()
+        sp.run([*script_interpreter(script), str(script)], cwd=tmp_path, env=env, check=True)
+        assert (tmp_path / "cache.txt").read_text().strip() == str(cache_dir)
@@ -0,0 +1,43 @@
+from osa.configs.config import cfg
+
+
+def test_source_priority(monkeypatch):
+    from osa.priority import priority_options, source_priority
+
+    monkeypatch.setitem(cfg["SOURCE_PRIORITY"], "grb*", "10")
+    monkeypatch.setitem(cfg["SOURCE_PRIORITY"], "crab", "1")
+    monkeypatch.setitem(cfg["SLURM"], "PRIORITY_NICE_STEP", "100")
+    monkeypatch.setitem(cfg["SLURM"], "PRIORITY_QOS", "")
+
+    assert source_priority("GRB 221009A") == 10
+    assert source_priority("Crab") == 1
+    assert source_priority("Mrk421") == 0
+    assert source_priority(None) == 0
+
+    assert priority_options(10, 10) == []
+    assert priority_options(0, 10) == ["--nice=1000"]
+    assert priority_options(0, 0) == []
+    monkeypatch.setitem(cfg["SLURM"], "PRIORITY_QOS", "urgent")
+    assert priority_options(10, 10) == ["--qos=urgent"]
+    assert priority_options(0, 10) == ["--nice=1000"]
+
+
+def test_sequence_priority(monkeypatch, sequence_list):
+    from osa.job import scheduler_env_variables
+    from osa.priority import night_priority, sort_by_priority
+
+    calibration, *data_sequences = sequence_list
+    monkeypatch.setitem(cfg["SLURM"], "PRIORITY_NICE_STEP", "100")
+    monkeypatch.setattr(data_sequences[-1], "priority", 2)
+    assert night_priority(sequence_list) == 2
+
+    # The calibration sequence is kept first
+    ordered = sort_by_priority(sequence_list)
+    assert ordered[:2] == [calibration, data_sequences[-1]]
+    assert ordered[2:] == data_sequences[:-1]
+
+    assert "#SBATCH --nice=200" in scheduler_env_variables(data_sequences[0], max_priority=2)
+    header = scheduler_env_variables(data_sequences[-1], max_priority=2)
+    assert not any(line.startswith("#SBATCH --nice") for line in header)
+    header = scheduler_env_variables(calibration, max_priority=2)
+    assert not any(line.startswith("#SBATCH --nice") for line in header)
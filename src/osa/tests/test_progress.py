@@ -0,0 +1,104 @@
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+import tenacity
+
+from osa.configs import options
+from osa.configs.config import cfg
+
+
+def test_progress_records(monkeypatch, tmp_path):
+    from osa.progress import emit, progress_counts, progress_file, read_progress
+
+    monkeypatch.setattr(options, "simulate", False)
+    start = datetime.utcnow()
+    emit("01807.0000", "lstchain_dl1ab", "running", start, bytes_written=10, directory=tmp_path)
+    emit("01807.0001", "lstchain_dl1ab", "running", start, directory=tmp_path)
+
+    path = progress_file("01807.0001", tmp_path)
+    assert path == tmp_path / "log" / "Run01807.progress"
+    records = read_progress(path)
+    assert records[0].bytes == 10
+    assert records[1].bytes is None
+
+    # Only the complete lines appended since the last read are parsed
+    emit("01807.0000", "datasequence", "done", start, rc=0, directory=tmp_path)
+    with open(path, "a") as file:
+        file.write('{"subrun":1,"stage":"lstchain_dl1ab","stat')
+    records = read_progress(path)
+    assert records[0].status == "done"
+    assert records[0].rc == 0
+    assert records[1].status == "running"
+    assert progress_counts(records) == {"running": 1, "done": 1, "failed": 0, "stale": 0}
+
+    old = (datetime.utcnow() - timedelta(hours=1)).isoformat(timespec="seconds")
+    with open(path, "a") as file:
+        file.write(f'us":"running","start":"{old}","time":"{old}"}}\n')
+    records = read_progress(path)
+    assert records[1].time == old
+    assert progress_counts(records) == {"running": 0, "done": 1, "failed": 0, "stale": 1}
+
+    # Calibration runs have no subruns, nothing is written when simulating
+    emit("01805", "calibration_pipeline", "running", start, directory=tmp_path)
+    monkeypatch.setattr(options, "simulate", True)
+    emit("01805", "calibration_pipeline", "done", start, rc=0, directory=tmp_path)
+    assert list(read_progress(tmp_path / "log" / "Run01805.progress")) == [None]
+
+
+def test_stage_heartbeats(monkeypatch, running_analysis_dir):
+    from osa.progress import progress_file
+    from osa.workflow.stages import AnalysisStage
+
+    monkeypatch.setitem(cfg["lstchain"], "heartbeat_interval", "0.1")
+    monkeypatch.setattr(options, "simulate", False)
+    monkeypatch.setattr(options, "directory", running_analysis_dir)
+    path = progress_file("01000")
+    path.unlink(missing_ok=True)
+
+    cmd = [sys.executable, "-c", "import time; print('x' * 1000); time.sleep(0.5)"]
+    stage = AnalysisStage(run="01000.0002", command_args=cmd)
+    stage.execute()
+    assert stage.rc == 0
+
+    lines = path.read_text().splitlines()
+    # Start, heartbeats and end of the stage
+    assert len(lines) >= 4
+    assert all('"status":"running"' in line for line in lines)
+    assert '"bytes":' in lines[-1] and '"rc":0' in lines[-1]
+
+    cmd = [sys.executable, "-c", "raise SystemExit(3)"]
+    stage = AnalysisStage(run="01000.0002", command_args=cmd)
+    with pytest.raises(tenacity.RetryError):
+        stage.execute()
+    assert '"status":"failed"' in path.read_text().splitlines()[-1]
+
+
+def test_update_sequence_status_progress(monkeypatch, sequence_list, running_analysis_dir):
+    from osa.progress import emit, progress_file
+    from osa.scripts import sequencer
+
+    monkeypatch.setattr(sequencer, "_SEQUENCE_STATUS", {})
+    monkeypatch.setattr(options, "simulate", False)
+    monkeypatch.setattr(options, "directory", running_analysis_dir)
+    data_sequence = sequence_list[1]
+    run_str = f"{data_sequence.run:05d}.0000"
+    emit(run_str, "datasequence", "running", datetime.utcnow(), directory=running_analysis_dir)
+
+    calls = []
+    monkeypatch.setattr(
+        sequencer, "get_status_for_sequence", lambda seq, level: calls.append(level) or 0
+    )
+    sequencer.update_sequence_status([data_sequence])
+    assert len(calls) == 5
+
+    # The outputs are not counted again until the progress file grows
+    sequencer.update_sequence_status([data_sequence])
+    assert len(calls) == 5
+    assert data_sequence.dl1status == 0
+
+    emit(run_str, "datasequence", "done", datetime.utcnow(), rc=0, directory=running_analysis_dir)
+    sequencer.update_sequence_status([data_sequence])
+    assert len(calls) == 10
+    assert sequencer.live_progress([data_sequence])[data_sequence.run]["done"] == 1
+    progress_file(run_str, running_analysis_dir).unlink()
@@ -1,6 +1,11 @@
+import os
 from datetime import datetime
+from pathlib import Path
+
 from osa.configs import options
 
+extra_files = Path(os.getenv("OSA_TEST_DATA", "extra"))
+
 
 def test_finished_assignments(sequence_list):
     from osa.report import finished_assignments
@@ -17,7 +22,7 @@ def test_finished_assignments(sequence_list):
 
 
 def test_history(base_test_dir):
-    from osa.report import history
+    from osa.report import history, read_history
 
     run = "01800"
     prod_id = "v1.0.0"
@@ -26,7 +31,7 @@ def test_history(base_test_dir):
     input_card = "r0_dl1.config"
     rc = 0
     history_file = base_test_dir / "r0_to_dl1_01800.history"
-    date_string = datetime.utcnow().isoformat(sep=" ", timespec="minutes")
+    start_time = datetime.utcnow()
 
     options.simulate = False
 
@@ -38,13 +43,65 @@ def test_history(base_test_dir):
         history_file=history_file,
         input_file=input_file,
         config_file=input_card,
+        start_time=start_time,
     )
 
     options.simulate = True
 
-    logged_string = (
-        f"01800 r0_to_dl1 v1.0.0 {date_string} " "r0_to_dl1_01800.fits r0_dl1.config 0\n"
+    assert history_file.exists()
+    assert len(history_file.read_text().splitlines()) == 1
+    (record,) = read_history(history_file)
+    assert record.run == run
+    assert record.stage == program
+    assert record.prod_id == prod_id
+    assert record.return_code == rc
+    assert record.input_file == input_file
+    assert record.config_file == input_card
+    assert record.start == start_time
+    assert record.end >= start_time
+    assert record.duration == (record.end - start_time).total_seconds()
+
+
+def test_read_history_legacy():
+    from osa.report import read_history
+
+    history_file = extra_files / "history_files/sequence_LST1_04183_failed.history"
+    records = read_history(history_file)
+
+    assert len(records) == 4
+    assert records[0].run == "04179"
+    assert records[0].stage == "lstchain_data_create_drs4_pedestal_file"
+    assert records[0].prod_id == "v0.7.0"
+    assert records[0].input_file == "drs4_pedestal.Run04179.0000.fits"
+    assert records[0].config_file is None
+    assert records[0].return_code == 0
+    assert records[-1].return_code == 1
+
+    records = read_history(extra_files / "history_files/sequence_LST1_04183.history")
+    assert records[0].end == datetime(2021, 12, 19, 22, 11)
+
+
+def test_read_last_history_records(tmp_path):
+    from osa.report import (
+        HistoryRecord,
+        last_record_per_stage,
+        read_history,
+        read_last_history_records,
     )
 
-    assert history_file.exists()
-    assert history_file.read_text() == logged_string
+    history_file = tmp_path / "sequence_LST1_01800.0000.history"
+    legacy_line = "01800.0000 r0_to_dl1 v1.0.0 2021-12-19 22:11 None None 0\n"
+    records = [
+        HistoryRecord(run="01800.0000", stage=f"stage{i % 3}", prod_id="v1.0.0", return_code=i)
+        for i in range(1000)
+    ]
+    history_file.write_text(legacy_line + "".join(f"{r.to_json()}\n" for r in records))
+
+    assert read_history(history_file)[1:] == records
+    assert read_last_history_records(history_file, n_records=2) == records[-2:]
+    assert read_last_history_records(history_file, n_records=2000)[1:] == records
+
+    last_records = last_record_per_stage(history_file, ["stage0", "stage2", "r0_to_dl1"])
+    assert last_records["stage0"] == records[999]
+    assert last_records["stage2"] == records[998]
+    assert last_records["r0_to_dl1"].return_code == 0
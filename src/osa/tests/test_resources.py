@@ -0,0 +1,106 @@
+import json
+from io import StringIO
+
+import pandas as pd
+
+from osa.configs import options
+
+
+def test_get_job_resources(monkeypatch, tmp_path):
+    from osa.job import get_job_resources, get_task_resources
+
+    sacct_output = StringIO(
+        "12_0,LST1_01807,,,00:10:00,,,RUNNING,0:0\n"
+        "12_0.batch,batch,,,00:10:00,,2G,RUNNING,0:0\n"
+        "12_1,LST1_01807,,,00:20:00,,,OUT_OF_MEMORY,0:125\n"
+        "12_1.batch,batch,,,00:20:00,,3145728K,OUT_OF_MEMORY,0:125\n"
+        "13,LST1_01809,,,00:05:00,,,COMPLETED,0:0\n"
+        "13.batch,batch,,,00:05:00,,512M,COMPLETED,0:0\n"
+        "14,other_job,,,00:05:00,,,COMPLETED,0:0\n"
+    )
+    usage = get_job_resources(sacct_output)
+
+    assert usage["run"].tolist() == [1807, 1807, 1809]
+    assert usage["type"].tolist() == ["DATA", "DATA", "PEDCALIB"]
+    assert usage["State"].tolist() == ["RUNNING", "OUT_OF_MEMORY", "COMPLETED"]
+    assert usage["Elapsed"].tolist() == [600, 1200, 300]
+    assert usage["MaxRSS"].tolist() == [2, 3, 0.5]
+
+    # Packed array tasks, the last one processing the remaining subruns
+    analysis_dir = tmp_path / "20200117" / "v0.1.0"
+    (analysis_dir / "log").mkdir(parents=True)
+    (analysis_dir / "log" / "submission_manifest.json").write_text(
+        json.dumps({"LST1_01807": {"jobid": "12", "subruns_per_task": 4, "subruns": 6}})
+    )
+    monkeypatch.setattr(options, "directory", analysis_dir)
+    sacct_output.seek(0)
+    assert get_task_resources(sacct_output)["subruns"].tolist() == [4, 2, 1]
+
+
+def test_predict_resources(monkeypatch):
+    from osa.configs.config import cfg
+    from osa.resources import predict_resources
+
+    monkeypatch.setitem(cfg["SLURM"], "RESOURCE_MIN_SAMPLES", "3")
+    monkeypatch.setitem(cfg["SLURM"], "RESOURCE_QUANTILE", "1")
+    monkeypatch.setitem(cfg["SLURM"], "RESOURCE_MARGIN", "0.5")
+
+    usage = pd.DataFrame(
+        {
+            "run": [1807, 1807, 1808, 1809],
+            "type": ["DATA", "DATA", "DATA", "DATA"],
+            "State": ["COMPLETED", "COMPLETED", "COMPLETED", "OUT_OF_MEMORY"],
+            "Elapsed": [1200, 1800, 2400, 600],
+            "MaxRSS": [2.0, 3.0, 4.0, 5.0],
+        }
+    )
+
+    # Not enough jobs accounted: defaults of the config file
+    resources = predict_resources("PEDCALIB", usage)
+    assert resources.mem_per_cpu == cfg.get("SLURM", "MEMSIZE_PEDCALIB")
+    assert resources.time == "01:15:00"
+    assert resources.n_samples == 0
+
+    resources = predict_resources("DATA", usage)
+    assert resources.mem_per_cpu == "6GB"
+    assert resources.time == "01:00:00"
+    assert resources.n_samples == 3
+
+    # The run ran out of memory before
+    resources = predict_resources("DATA", usage, run=1809)
+    assert resources.mem_per_cpu == "15GB"
+    assert resources.time == "01:00:00"
+
+    # The walltime is that of the subruns of each task
+    usage["subruns"] = [2, 2, 4, 1]
+    resources = predict_resources("DATA", usage, packing=3)
+    assert resources.time == "01:08:00"
+
+
+def test_select_partitions(monkeypatch):
+    from osa.configs.config import cfg
+    from osa.resources import select_partitions
+
+    monkeypatch.setitem(cfg["SLURM"], "PARTITION_TIME_LIMITS", "short=1:00:00, long=3:00:00")
+
+    assert select_partitions("short, long", 1800) == "short, long"
+    assert select_partitions("short, long", 7200) == "long"
+    assert select_partitions("short, long", 36000) == "long"
+    assert select_partitions("short, other", 7200) == "other"
+
+
+def test_array_throttle(monkeypatch):
+    from osa.configs.config import cfg
+    from osa.resources import array_throttle, io_budget
+
+    monkeypatch.setitem(cfg["SLURM"], "IO_BUDGET", "")
+    assert io_budget() is None
+    monkeypatch.setitem(cfg["SLURM"], "IO_BUDGET", "100")
+    assert io_budget() == 100
+
+    assert array_throttle(100, 20, 4) == 20
+    # Moderately slower subruns do not change the share
+    assert array_throttle(100, 20, 4, saturation=1.2) == 20
+    assert array_throttle(100, 20, 4, saturation=2) == 10
+    # Each array runs at least one task
+    assert array_throttle(100, 150, 4) == 1
@@ -0,0 +1,145 @@
+import time
+from io import StringIO
+from textwrap import dedent
+
+import pytest
+
+from osa.configs import options
+
+
+def write_script(path, header, body):
+    path.write_text(f"#!/bin/env python\n\n{header}\n\nimport os\nimport sys\n\n{dedent(body)}")
+    return path
+
+
+def test_array_task_ids():
+    from osa.scheduler import array_task_ids
+
+    assert array_task_ids(None) == [None]
+    assert array_task_ids("0-3") == [0, 1, 2, 3]
+    assert array_task_ids("0,2,5-6%2") == [0, 2, 5, 6]
+
+
+def test_array_ranges():
+    from osa.scheduler import array_ranges, array_task_ids
+
+    assert array_ranges([7, 0, 1, 2, 3, 9, 10]) == "0-3,7,9-10"
+    assert array_ranges([4]) == "4"
+    assert array_task_ids(array_ranges([1, 5, 6, 8])) == [1, 5, 6, 8]
+
+
+def test_local_scheduler(monkeypatch, tmp_path):
+    from osa.job import get_job_states, get_squeue_output, summarize_job_states
+    from osa.scheduler import LocalScheduler
+
+    monkeypatch.setattr(options, "directory", tmp_path)
+    calibration = write_script(
+        tmp_path / "sequence_LST1_01809.py",
+        "#SBATCH --job-name=LST1_01809\n#SBATCH --output=log/Run01809.%4a_jobid_%A.out",
+        "open('calibrated', 'w').close()\n",
+    )
+    data = write_script(
+        tmp_path / "sequence_LST1_01807.py",
+        "#SBATCH --job-name=LST1_01807\n#SBATCH --array=0-2\n"
+        "#SBATCH --output=log/Run01807.%4a_jobid_%A.out",
+        """\
+        assert os.path.exists('calibrated')
+        assert os.getenv('MPLBACKEND') == 'Agg'
+        sys.exit(int(os.getenv('SLURM_ARRAY_TASK_ID')) == 2)
+        """,
+    )
+    failed = write_script(
+        tmp_path / "sequence_LST1_01808.py", "#SBATCH --job-name=LST1_01808", "sys.exit(3)\n"
+    )
+    dependent = write_script(
+        tmp_path / "sequence_LST1_01810.py", "#SBATCH --job-name=LST1_01810", "\n"
+    )
+
+    scheduler = LocalScheduler(workers=2)
+    calibration_id = scheduler.submit(["sbatch", "--parsable", str(calibration)], "token")
+    data_id = scheduler.submit(
+        [
+            "sbatch",
+            "--export=ALL,MPLBACKEND=Agg",
+            f"--dependency=afterok:{calibration_id}",
+            str(data),
+        ],
+        "token",
+    )
+    failed_id = scheduler.submit(["sbatch", str(failed)], "token")
+    dependent_id = scheduler.submit(
+        ["sbatch", f"--dependency=afterok:{failed_id}", str(dependent)], "token"
+    )
+    # Run whatever the state of the parent job
+    any_id = scheduler.submit(
+        ["sbatch", f"--dependency=afterany:{failed_id}", str(dependent)], "token"
+    )
+    scheduler.wait()
+
+    assert (tmp_path / "log" / f"Run01807.0001_jobid_{data_id}.out").exists()
+    states = summarize_job_states(get_job_states(StringIO(scheduler.sacct_output())))
+    assert states == {
+        calibration_id: "COMPLETED",
+        data_id: "FAILED",
+        failed_id: "FAILED",
+        dependent_id: "CANCELLED",
+        any_id: "COMPLETED",
+    }
+    assert f"{data_id}_2,LST1_01807" in scheduler.sacct_output()
+    assert ",FAILED,3:0" in scheduler.sacct_output()
+    assert get_squeue_output(scheduler.squeue_output()).empty
+
+
+def test_incomplete_scheduler():
+    from osa.scheduler import Scheduler
+
+    class IncompleteScheduler(Scheduler):
+        def submit(self, commandargs, token, limiter=None, retries=3):
+            return "1"
+
+    with pytest.raises(TypeError, match="sacct_output"):
+        IncompleteScheduler()
+
+
+def test_local_scheduler_cancel(monkeypatch, tmp_path):
+    import osa.job
+    from osa.job import find_submitted_job
+    from osa.scheduler import LocalScheduler
+
+    monkeypatch.setattr(options, "directory", tmp_path)
+    blocking = write_script(
+        tmp_path / "sequence_LST1_01805.py",
+        "#SBATCH --job-name=LST1_01805",
+        "import time\ntime.sleep(30)\n",
+    )
+    array = write_script(
+        tmp_path / "sequence_LST1_01807.py",
+        "#SBATCH --job-name=LST1_01807\n#SBATCH --array=0-2",
+        "\n",
+    )
+
+    scheduler = LocalScheduler(workers=2)
+    blocking_id = scheduler.submit(["sbatch", str(blocking)], "token")
+    array_id = scheduler.submit(
+        ["sbatch", f"--dependency=afterok:{blocking_id}", str(array)], "osa:LST1_01807"
+    )
+
+    # The submissions are found by their token, as in the SLURM queue
+    monkeypatch.setattr(osa.job, "get_scheduler", lambda: scheduler)
+    assert find_submitted_job("osa:LST1_01807") == array_id
+    assert find_submitted_job("osa:LST1_01808") is None
+
+    # A pending array task is not run once its dependency is satisfied
+    scheduler.cancel(f"{array_id}_1")
+    while "pid" not in scheduler.read_tasks()[blocking_id]:
+        time.sleep(0.05)
+    start = time.time()
+    scheduler.cancel(blocking_id)
+    scheduler.wait()
+    assert time.time() - start < 10
+
+    tasks = scheduler.read_tasks()
+    assert tasks[blocking_id]["State"] == "CANCELLED"
+    assert tasks[f"{array_id}_1"]["State"] == "CANCELLED"
+    # The cancelled dependency cancels the rest of the array
+    assert tasks[f"{array_id}_0"]["State"] == "CANCELLED"
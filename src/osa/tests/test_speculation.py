@@ -0,0 +1,200 @@
+import os
+from io import StringIO
+
+from osa.configs import options
+from osa.configs.config import cfg
+
+
+def test_find_stragglers(monkeypatch, sequence_list):
+    from osa.job import get_job_resources, get_squeue_output
+    from osa.speculation import find_stragglers
+
+    sequence = next(sequence for sequence in sequence_list if sequence.type == "DATA")
+    monkeypatch.setitem(cfg["SLURM"], "SUBRUNS_PER_TASK", "1")
+    monkeypatch.setitem(cfg["SLURM"], "SPECULATION_MULTIPLIER", "2")
+    monkeypatch.setitem(cfg["SLURM"], "SPECULATION_QUANTILE", "0.75")
+
+    def sacct(n_completed):
+        completed = f"{sequence.jobname},00:10:00,600,00:10:00,00:09:00,,COMPLETED,0:0\n"
+        # Tasks of an earlier submission of the run, lasting much longer
+        earlier = f"{sequence.jobname},01:00:00,3600,01:00:00,00:59:00,,COMPLETED,0:0\n"
+        return get_job_resources(
+            StringIO(
+                "".join(f"99_{task},{earlier}" for task in range(sequence.subruns))
+                + "".join(f"100_{task},{completed}" for task in range(n_completed))
+            )
+        )
+
+    squeue = get_squeue_output(
+        StringIO(
+            "JOBID;NAME;STATE;TIME\n"
+            f"100_{sequence.subruns - 2};{sequence.jobname};RUNNING;25:00\n"
+            f"100_{sequence.subruns - 1};{sequence.jobname};RUNNING;15:00\n"
+            f"101;{sequence.jobname}.0003_spec;RUNNING;30:00\n"
+        )
+    )
+
+    # Not enough completed tasks to estimate their runtime
+    assert find_stragglers(sequence, sacct(1), squeue, job_ids=["100"]) == {}
+    # Only the task lasting more than twice the median runtime of 10 minutes
+    assert find_stragglers(sequence, sacct(sequence.subruns - 2), squeue, job_ids=["100"]) == {
+        sequence.subruns - 2: 1500
+    }
+
+
+def test_submit_speculative_jobs(monkeypatch, tmp_path, sequence_list, fake_scheduler, job_script):
+    import osa.speculation
+    from osa.job import get_sacct_output, get_squeue_output, read_submission_manifest
+    from osa.job import record_submission
+    from osa.job import set_queue_values
+    from osa.scheduler import read_sbatch_directives
+    from osa.speculation import submit_speculative_jobs, superseded_array_tasks
+
+    sequence = next(sequence for sequence in sequence_list if sequence.type == "DATA")
+    straggler = sequence.subruns - 1
+    sacct = "".join(
+        f"100_{task},{sequence.jobname},00:10:00,600,00:10:00,00:09:00,,COMPLETED,0:0\n"
+        for task in range(straggler)
+    )
+    squeue = f"JOBID;NAME;STATE;TIME\n100_{straggler};{sequence.jobname};RUNNING;45:00\n"
+
+    record_submission(tmp_path / "log" / "submission_manifest.json", sequence, "100")
+    fake_scheduler.next_job_id = 101
+    script = job_script(
+        "--job-name=LST1_01807", "--chdir=/tmp", f"--array=0-{straggler}%4", "--mem-per-cpu=6GB"
+    )
+    monkeypatch.setattr(sequence, "script", script)
+    monkeypatch.setattr(sequence, "jobid", "100")
+    monkeypatch.setattr(options, "directory", tmp_path)
+    monkeypatch.setattr(options, "test", False)
+    monkeypatch.setattr(options, "simulate", False)
+    monkeypatch.setattr(options, "tel_id", "LST1")
+    monkeypatch.setitem(cfg["SLURM"], "SUBRUNS_PER_TASK", "1")
+    monkeypatch.setattr(osa.speculation, "get_scheduler", lambda: fake_scheduler)
+    monkeypatch.setattr(
+        osa.speculation,
+        "get_sacct_snapshot",
+        lambda parser=None: (parser or get_sacct_output)(StringIO(sacct)),
+    )
+    monkeypatch.setattr(osa.speculation, "run_squeue", lambda: StringIO(squeue))
+
+    run_str = f"{sequence.run:05d}.{straggler:04d}"
+    jobname = f"{sequence.jobname}.{straggler:04d}_spec"
+    assert submit_speculative_jobs([sequence]) == {jobname: "101"}
+    # The straggler is only duplicated once
+    assert submit_speculative_jobs([sequence]) == {}
+    assert len(fake_scheduler.submitted) == 1
+
+    record = read_submission_manifest(tmp_path / "log" / "submission_manifest.json")[jobname]
+    assert record["type"] == "SPECULATIVE"
+    assert record["task"] == f"100_{straggler}"
+
+    speculative_script = tmp_path / f"speculative_LST1_{run_str}.py"
+    directives = read_sbatch_directives(speculative_script)
+    assert directives["--job-name"] == jobname
+    assert directives["--chdir"] == str(tmp_path)
+    assert directives["--mem-per-cpu"] == "6GB"
+    assert "--array" not in directives
+    content = speculative_script.read_text()
+    assert f"'--output-dir={tmp_path / 'speculative' / run_str}'," in content
+    assert f"'--speculative-of=100_{straggler}'," in content
+    assert f"'{run_str}'," in content
+
+    # The task cancelled once its speculative execution completed processed its subrun
+    sacct_info = get_sacct_output(
+        StringIO(
+            sacct
+            + f"100_{straggler},{sequence.jobname},00:45:00,2700,00:45:00,,,CANCELLED,0:15\n"
+            + f"101,{jobname},00:20:00,1200,00:20:00,00:18:00,,COMPLETED,0:0\n"
+        )
+    )
+    assert superseded_array_tasks(sacct_info) == {(100, str(straggler))}
+
+    monkeypatch.setitem(cfg["SLURM"], "SPECULATIVE_EXECUTION", "True")
+    squeue_info = get_squeue_output(StringIO("JOBID;NAME;STATE;TIME\n"))
+    set_queue_values(sacct_info, squeue_info, [sequence])
+    assert sequence.state == "COMPLETED"
+
+    # Neither the night nor the array job is considered unfinished because of it
+    import pandas as pd
+    from osa.scripts import sequencer
+    from osa.speculation import sequence_array_completed
+
+    monkeypatch.setattr(osa.speculation, "get_sacct_snapshot", lambda: sacct_info)
+    monkeypatch.setattr(sequencer, "get_sacct_snapshot", lambda: sacct_info)
+    monkeypatch.setattr(
+        sequencer,
+        "run_summary_table",
+        lambda date: pd.DataFrame({"run_id": [sequence.run], "run_type": ["DATA"]}),
+    )
+    assert sequencer.is_sequencer_completed(options.date)
+    assert not sequencer.timeout_in_sequencer(options.date)
+    assert sequence_array_completed(sequence)
+
+    monkeypatch.setitem(cfg["SLURM"], "SPECULATIVE_EXECUTION", "False")
+    assert not sequencer.is_sequencer_completed(options.date)
+    assert not sequence_array_completed(sequence)
+
+
+def test_array_task_state(monkeypatch, fake_scheduler):
+    import osa.job
+    from osa.job import invalidate_sacct_snapshot
+    from osa.speculation import array_task_state
+
+    # Read from the scheduler set in the config file, whatever it is
+    monkeypatch.setattr(
+        fake_scheduler,
+        "sacct_output",
+        lambda: "100_3,LST1_01807,00:10:00,600,00:10:00,,,CANCELLED by 0,0:15\n"
+        "100_3.batch,batch,00:10:00,600,00:10:00,,,CANCELLED,0:15\n",
+    )
+    monkeypatch.setattr(osa.job, "get_scheduler", lambda: fake_scheduler)
+    invalidate_sacct_snapshot()
+    assert array_task_state("100_3") == "CANCELLED"
+    assert array_task_state("100_4") is None
+    invalidate_sacct_snapshot()
+
+
+def test_settle_speculative_task(monkeypatch, tmp_path, fake_scheduler):
+    import osa.speculation
+    from osa.speculation import settle_speculative_task
+
+    monkeypatch.setattr(osa.speculation, "get_scheduler", lambda: fake_scheduler)
+    monkeypatch.setattr(osa.speculation, "CANCEL_POLL_INTERVAL", 0)
+
+    def speculative_outputs():
+        output_dir = tmp_path / "speculative" / "01807.0012"
+        (output_dir / "v0.9").mkdir(parents=True)
+        (output_dir / "sequence_LST1_01807.0012.history").write_text("history")
+        (output_dir / "dl1_LST-1.Run01807.0012.h5").write_text("dl1a")
+        (output_dir / "v0.9" / "dl1_LST-1.Run01807.0012.h5").write_text("dl1b")
+        return output_dir
+
+    # The original task completed first
+    output_dir = speculative_outputs()
+    monkeypatch.setattr(osa.speculation, "array_task_state", lambda task_id: "COMPLETED")
+    assert settle_speculative_task(0, "100_12", output_dir, tmp_path) == 0
+    assert not output_dir.exists()
+    assert not (tmp_path / "dl1_LST-1.Run01807.0012.h5").exists()
+    assert fake_scheduler.cancelled == []
+
+    # The speculative execution finished first, the original task is cancelled
+    output_dir = speculative_outputs()
+    states = iter(["RUNNING", "RUNNING", "CANCELLED"])
+    monkeypatch.setattr(osa.speculation, "array_task_state", lambda task_id: next(states))
+    moved = []
+    replace = os.replace
+    monkeypatch.setattr(
+        os, "replace", lambda src, dst: moved.append(dst.name) or replace(src, dst)
+    )
+
+    assert settle_speculative_task(0, "100_12", output_dir, tmp_path) == 0
+    assert fake_scheduler.cancelled == ["100_12"]
+    assert not output_dir.exists()
+    assert (tmp_path / "v0.9" / "dl1_LST-1.Run01807.0012.h5").read_text() == "dl1b"
+    assert moved[-1] == "sequence_LST1_01807.0012.history"
+
+    # A failed speculative execution is discarded
+    output_dir = speculative_outputs()
+    assert settle_speculative_task(1, "100_12", output_dir, tmp_path) == 1
+    assert not output_dir.exists()
@@ -31,6 +31,8 @@ __all__ = [
     "simprocparsing",
     "sequencer_webmaker_argparser",
     "valid_date",
+    "read_dates_file",
+    "night_range",
     "get_prod_id",
     "get_dl1_prod_id",
     "get_dl2_prod_id",
@@ -110,6 +112,13 @@ def closer_argparser():
         default=False,
         help="Do not produce DL2 files (default False)",
     )
+    parser.add_argument(
+        "--files-only",
+        action="store_true",
+        default=False,
+        help="Only move the output files of the sequence given by --seq to their "
+        "final directories, without merging them (default False)",
+    )
     parser.add_argument("tel_id", choices=["ST", "LST1", "LST2"])
 
     return parser
@@ -117,13 +126,18 @@ def closer_argparser():
 
 def closercliparsing():
     # parse the command line
-    opts = closer_argparser().parse_args()
+    parser = closer_argparser()
+    opts = parser.parse_args()
+
+    if opts.files_only and opts.seqtoclose is None:
+        parser.error("--files-only requires --seq")
 
     # set global variables
     set_common_globals(opts)
     options.seqtoclose = opts.seqtoclose
     options.no_dl2 = opts.no_dl2
     options.noninteractive = opts.noninteractive
+    options.files_only = opts.files_only
 
     log.debug(f"the options are {opts}")
 
@@ -210,6 +224,22 @@ def data_sequence_argparser():
         type=Path,
         help="Path to a file containing the ids of the interleaved pedestal events",
     )
+    parser.add_argument(
+        "--n-subruns",
+        type=int,
+        default=1,
+        help="Number of consecutive subruns to process starting from run_number (default 1)",
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=Path,
+        help="Directory of the outputs and history files instead of the analysis directory",
+    )
+    parser.add_argument(
+        "--speculative-of",
+        type=str,
+        help="Array task (e.g. 1234_5) whose subruns are speculatively processed",
+    )
     parser.add_argument("run_number", help="Number of the run to be processed")
     parser.add_argument("tel_id", choices=["ST", "LST1", "LST2"])
     return parser
@@ -234,6 +264,10 @@ def data_sequence_cli_parsing():
     # setting the default date and directory if needed
     options.date = set_default_date_if_needed()
     options.directory = analysis_path(options.tel_id)
+    options.speculative_of = opts.speculative_of
+    if opts.output_dir is not None:
+        options.directory = opts.output_dir.resolve()
+        options.directory.mkdir(parents=True, exist_ok=True)
 
     set_prod_ids()
 
@@ -246,6 +280,7 @@ def data_sequence_cli_parsing():
         opts.run_summary,
         opts.pedestal_ids_file,
         opts.run_number,
+        opts.n_subruns,
     )
 
 
@@ -287,6 +322,32 @@ def sequencer_argparser():
         default=False,
         help="Force sequencer to submit jobs"
     )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        default=False,
+        help="Keep running and show the status of the night whenever it changes, "
+        "re-evaluating it every WATCH_INTERVAL seconds (default False)",
+    )
+    parser.add_argument(
+        "--resubmit-failed",
+        action="store_true",
+        default=False,
+        help="Resubmit only the array tasks of the data sequences that failed or "
+        "timed out, with a walltime longer by RESUBMIT_WALLTIME_FACTOR after a timeout "
+        "(default False)",
+    )
+    nights = parser.add_mutually_exclusive_group()
+    nights.add_argument(
+        "--end-date",
+        type=valid_date,
+        help="Process every night from --date up to this date (YYYY-MM-DD) in one go",
+    )
+    nights.add_argument(
+        "--dates-file",
+        type=Path,
+        help="Process in one go the nights listed in this file, one date (YYYY-MM-DD) per line",
+    )
     parser.add_argument(
         "tel_id",
         choices=["ST", "LST1", "LST2", "all"],
@@ -298,7 +359,13 @@ def sequencer_argparser():
 
 def sequencer_cli_parsing():
     # parse the command line
-    opts = sequencer_argparser().parse_args()
+    parser = sequencer_argparser()
+    opts = parser.parse_args()
+
+    if opts.watch and (opts.end_date or opts.dates_file):
+        parser.error("--watch can only follow a single night")
+    if opts.end_date and opts.end_date < (opts.date or YESTERDAY):
+        parser.error("--end-date is earlier than --date, no night to process")
 
     # set global variables
     set_common_globals(opts)
@@ -307,16 +374,40 @@ def sequencer_cli_parsing():
     options.no_dl2 = opts.no_dl2
     options.no_gainsel = opts.no_gainsel
     options.force_submit = opts.force_submit
+    options.watch = opts.watch
+    options.resubmit_failed = opts.resubmit_failed
 
     log.debug(f"the options are {opts}")
 
     set_prod_ids()
 
     # setting the default date and directory if needed
-    options.date = set_default_date_if_needed()
+    if opts.dates_file:
+        options.nights = read_dates_file(opts.dates_file)
+        if not options.nights:
+            parser.error(f"No dates found in the dates file {opts.dates_file}")
+        options.date = options.nights[0]
+    else:
+        options.date = set_default_date_if_needed()
+        options.nights = night_range(options.date, opts.end_date or options.date)
     options.directory = analysis_path(options.tel_id)
 
 
+def read_dates_file(dates_file: Path) -> list:
+    """
+    Read the dates (YYYY-MM-DD) listed in a file, one per line. Empty lines
+    and comments (starting with #) are skipped.
+    """
+    with open(dates_file, "r") as file:
+        lines = [line.split("#")[0].strip() for line in file]
+    return [valid_date(line) for line in lines if line]
+
+
+def night_range(start: datetime.datetime, end: datetime.datetime) -> list:
+    """Dates of the nights from start to end, both included."""
+    return [start + datetime.timedelta(days=day) for day in range((end - start).days + 1)]
+
+
 def provprocess_argparser():
     parser = ArgumentParser()
     parser.add_argument(
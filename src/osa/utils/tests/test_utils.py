@@ -51,6 +51,14 @@ def test_time_to_seconds():
         time_to_seconds("12.11.11")
 
 
+def test_seconds_to_time():
+    from osa.utils.utils import seconds_to_time, time_to_seconds
+
+    assert seconds_to_time(2 * 3600 + 27 * 60 + 15) == "02:27:15"
+    assert seconds_to_time(2 * 24 * 3600 + 2 * 3600 + 27 * 60 + 15) == "2-02:27:15"
+    assert time_to_seconds(seconds_to_time(4 * 4500)) == 4 * 4500
+
+
 def test_stringify():
     from osa.utils.utils import stringify
 
@@ -75,3 +83,37 @@ def test_create_lock(base_test_dir):
     lock_path = base_test_dir / "test_lock.closed"
     is_closed = create_lock(lock_path)
     assert is_closed is False
+
+
+def test_night_options(monkeypatch, tmp_path):
+    import sys
+    from osa.utils.cliopts import night_range, read_dates_file, sequencer_cli_parsing
+
+    nights = night_range(datetime.datetime(2020, 1, 30), datetime.datetime(2020, 2, 2))
+    assert [night.day for night in nights] == [30, 31, 1, 2]
+
+    dates_file = tmp_path / "dates.txt"
+    dates_file.write_text("# Nights to reprocess\n2020-01-17\n\n2020-01-18  # moon\n")
+    assert read_dates_file(dates_file) == [
+        datetime.datetime(2020, 1, 17),
+        datetime.datetime(2020, 1, 18),
+    ]
+    dates_file.write_text("# Nothing to reprocess\n\n")
+    assert read_dates_file(dates_file) == []
+
+    # An end date before the first night is rejected rather than ignored
+    argv = ["sequencer", "--date=2020-01-17", "--end-date=2020-01-16", "LST1"]
+    monkeypatch.setattr(sys, "argv", argv)
+    with pytest.raises(SystemExit):
+        sequencer_cli_parsing()
+
+    date, directory = options.date, options.directory
+    with options.night_options(date=nights[0], directory=tmp_path):
+        options.no_gainsel = True
+        assert options.date == nights[0]
+        assert options.directory == tmp_path
+
+    # Previous values are restored and options set within the night are dropped
+    assert options.date == date
+    assert options.directory == directory
+    assert not hasattr(options, "no_gainsel")
@@ -29,6 +29,7 @@ __all__ = [
     "get_dl1_prod_id",
     "get_dl2_prod_id",
     "time_to_seconds",
+    "seconds_to_time",
     "DATACHECK_FILE_PATTERNS",
     "YESTERDAY",
     "set_prod_ids",
@@ -244,6 +245,25 @@ def time_to_seconds(timestring):
     return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
 
 
+def seconds_to_time(seconds: float) -> str:
+    """
+    Transform seconds to (D-)HH:MM:SS time format.
+
+    Parameters
+    ----------
+    seconds: float
+
+    Returns
+    -------
+    Time in format (D-)HH:MM:SS
+    """
+    days, seconds = divmod(int(seconds), 24 * 3600)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    hhmmss = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+    return f"{days}-{hhmmss}" if days else hhmmss
+
+
 def set_prod_ids():
     """Set the product IDs."""
     options.prod_id = get_prod_id()
@@ -2,9 +2,11 @@
 
 import logging
 import os
+from dataclasses import replace
 from pathlib import Path
 
 from osa.configs import options
+from osa.report import read_last_history_records
 from osa.utils.logging import myLogger
 
 __all__ = [
@@ -58,18 +60,23 @@ def failed_history(history_file: Path) -> bool:
     """
     Check if a processing step has failed twice in a given history file.
 
-    Return True if the last line of the history file contains a non-zero exit
+    Return True if the last record of the history file contains a non-zero exit
     status and is repeated twice, meaning that a given step has failed twice.
     """
-    history_lines = history_file.read_text().splitlines()
+    # Only the last two records are read, from the end of the file
+    history_records = read_last_history_records(history_file, n_records=2)
 
     # Check if history file has at least two trials
-    if len(history_lines) < 2:
+    if len(history_records) < 2:
         return False
 
-    # Check if the last line of the history file is repeated twice
-    # and the exit status is non-zero
-    return history_lines[-1] == history_lines[-2] and history_lines[-1].split()[-1] != "0"
+    # Check if the last record of the history file is repeated twice
+    # (regardless of its time) and the exit status is non-zero
+    last, previous = (
+        replace(record, start=None, end=None, duration=None)
+        for record in reversed(history_records)
+    )
+    return last == previous and last.return_code != 0
 
 
 def set_closed_sequence(sequence):
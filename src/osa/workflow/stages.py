@@ -7,6 +7,7 @@ retry in case of failure, and keep track of the history of the stages.
 
 import logging
 import subprocess as sp
+from datetime import datetime
 from pathlib import Path
 from typing import List, Union
 
@@ -15,6 +16,7 @@ import lstchain
 
 from osa.configs import options
 from osa.configs.config import cfg
+from osa.progress import FAILED, RUNNING, bytes_written, emit, heartbeat_interval
 from osa.report import history
 from osa.utils.logging import myLogger
 from osa.utils.utils import stringify, date_to_dir
@@ -47,22 +49,63 @@ class AnalysisStage:
         self.config_file = config_file
         self.command = self.command_args[0]
         self.rc = None
+        self.start_time = None
         self.history_file = (
             Path(options.directory) / f"sequence_{options.tel_id}_{self.run}.history"
         )
+        # Run whose progress file gets the heartbeats of the stage
+        self.progress_run = run
 
     @retry(stop=stop_after_attempt(int(cfg.get("lstchain", "max_tries"))))
     def execute(self):
         """Run the program and retry if it fails."""
         log.info(f"Executing {stringify(self.command_args)}")
-        output = sp.run(self.command_args, stdout=sp.PIPE, stderr=sp.STDOUT, encoding="utf-8")
-        self.rc = output.returncode
+        self.start_time = datetime.utcnow()
+        stdout, written = self._run_with_heartbeats()
         self._write_checkpoint()
 
         # If fails, remove products from the directory for subsequent trials
         if self.rc != 0:
             self._clean_up()
-            raise ValueError(f"{self.command} failed with output: \n {output.stdout}")
+            self._emit_progress(FAILED, written)
+            raise ValueError(f"{self.command} failed with output: \n {stdout}")
+
+        self._emit_progress(RUNNING, written)
+
+    def _run_with_heartbeats(self):
+        """
+        Run the program writing a heartbeat in the progress file of the run
+        every `heartbeat_interval` seconds. Return its output and the bytes
+        it wrote.
+        """
+        interval = heartbeat_interval()
+        written = None
+        self._emit_progress(RUNNING, written)
+
+        with sp.Popen(
+            self.command_args, stdout=sp.PIPE, stderr=sp.STDOUT, encoding="utf-8"
+        ) as process:
+            while True:
+                try:
+                    stdout, _ = process.communicate(timeout=interval if interval > 0 else None)
+                    break
+                except sp.TimeoutExpired:
+                    written = bytes_written(process.pid)
+                    self._emit_progress(RUNNING, written)
+
+        self.rc = process.returncode
+        return stdout, written
+
+    def _emit_progress(self, status, written=None):
+        """Write a record with the status of the stage in the progress file."""
+        emit(
+            run=self.progress_run,
+            stage=self.command,
+            status=status,
+            start=self.start_time,
+            bytes_written=written,
+            rc=self.rc,
+        )
 
     def show_command(self):
         """Show the command to be executed."""
@@ -134,6 +177,7 @@ class AnalysisStage:
             stage=self.command,
             return_code=self.rc,
             history_file=self.history_file,
+            start_time=self.start_time,
             config_file=self.config_file,
         )
 
@@ -158,6 +202,7 @@ class DRS4PedestalStage(AnalysisStage):
     ):
         super().__init__(run, command_args, config_file)
         self.run_pedcal = run_pedcal
+        self.progress_run = run_pedcal
         self.history_file = (
             Path(options.directory) / f"sequence_{options.tel_id}_{self.run_pedcal}.history"
         )
@@ -170,6 +215,7 @@ class DRS4PedestalStage(AnalysisStage):
             stage=self.command,
             return_code=self.rc,
             history_file=self.history_file,
+            start_time=self.start_time,
         )
 
 
@@ -195,4 +241,5 @@ class ChargeCalibrationStage(AnalysisStage):
             stage=self.command,
             return_code=self.rc,
             history_file=self.history_file,
+            start_time=self.start_time,
         )
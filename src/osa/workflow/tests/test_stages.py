@@ -2,6 +2,7 @@ import pytest
 import tenacity
 
 from osa.configs import options
+from osa.report import HistoryRecord
 
 
 def test_analysis_stage(running_analysis_dir):
@@ -33,10 +34,12 @@ def test_analysis_stage(running_analysis_dir):
     with open(stage.history_file, "r") as f:
         lines = f.readlines()
         assert len(lines) >= 3
-    # Check that the last element in the last line is the rc 2
-    assert lines[-1].split(" ")[0] == stage.run
-    assert lines[-1].split(" ")[1] == cmd[0]
-    assert lines[-1].split(" ")[-1] == "2\n"
+    # Check that the last record has the rc 2
+    record = HistoryRecord.from_line(lines[-1])
+    assert record.run == stage.run
+    assert record.stage == cmd[0]
+    assert record.return_code == 2
+    assert record.duration >= 0
 
     # Second step
     cmd = [
@@ -54,10 +57,11 @@ def test_analysis_stage(running_analysis_dir):
     with open(stage.history_file, "r") as f:
         lines = f.readlines()
         assert len(lines) >= 6
-    # Check that the last element in the last line is the step rc
-    assert lines[-1].split(" ")[0] == stage.run
-    assert lines[-1].split(" ")[1] == cmd[0]
-    assert lines[-1].split(" ")[-1] == "1\n"
+    # Check that the last record has the step rc
+    record = HistoryRecord.from_line(lines[-1])
+    assert record.run == stage.run
+    assert record.stage == cmd[0]
+    assert record.return_code == 1
 
     # Third step
     cmd = ["lstchain_check_dl1", "--input-file=dl1_file.h5", "--batch"]
@@ -71,10 +75,11 @@ def test_analysis_stage(running_analysis_dir):
     with open(stage.history_file, "r") as f:
         lines = f.readlines()
         assert len(lines) >= 9
-    # Check that the last element in the last line is the step rc
-    assert lines[-1].split(" ")[0] == stage.run
-    assert lines[-1].split(" ")[1] == cmd[0]
-    assert lines[-1].split(" ")[-1] == "255\n"
+    # Check that the last record has the step rc
+    record = HistoryRecord.from_line(lines[-1])
+    assert record.run == stage.run
+    assert record.stage == cmd[0]
+    assert record.return_code == 255
 
 
 def test_calibration_steps(running_analysis_dir):
@@ -100,10 +105,12 @@ def test_calibration_steps(running_analysis_dir):
     with open(step1.history_file, "r") as f:
         lines = f.readlines()
         assert len(lines) == 6
-    # Check that the last element in the last line is the rc
-    assert lines[0].split(" ")[0] == step1.run
-    assert lines[-1].split(" ")[0] == step2.run
-    assert lines[0].split(" ")[1] == cmd1[0]
-    assert lines[-1].split(" ")[1] == cmd2[0]
-    assert lines[0].split(" ")[-1] == "1\n"
-    assert lines[-1].split(" ")[-1] == "1\n"
+    # Check the run, stage and rc of the first and last records
+    first_record = HistoryRecord.from_line(lines[0])
+    last_record = HistoryRecord.from_line(lines[-1])
+    assert first_record.run == step1.run
+    assert last_record.run == step2.run
+    assert first_record.stage == cmd1[0]
+    assert last_record.stage == cmd2[0]
+    assert first_record.return_code == 1
+    assert last_record.return_code == 1